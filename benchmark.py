@@ -0,0 +1,280 @@
+"""Benchmarks do controle do laboratório com dados sintéticos
+
+Gera conjuntos de alunos, relatórios e agendamentos de vários tamanhos numa
+pasta temporária, cronometra os caminhos mais usados do script principal e
+grava o resultado em JSON, comparando com uma linha de base salva.
+
+Exemplos:
+    python benchmark.py                          # 1k e 100k linhas, backend CSV
+    python benchmark.py --tamanhos 1000,100000,1000000 --armazenamento sqlite
+    python benchmark.py --salvar-baseline        # grava a linha de base atual
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().with_name("import pandas as pd.py")
+ARQ_BASELINE = Path(__file__).resolve().with_name("benchmark_baseline.json")
+LIMITE_LINHAS_XLSX = 1_048_575  # o Excel não comporta mais linhas numa planilha
+GRADES = {"padrao": {"pcs": 20, "slot_minutos": 60}, "grande": {"pcs": 200, "slot_minutos": 15}}
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Fabio", "Gabriela", "Heitor", "Iara", "Joao",
+         "Karina", "Lucas", "Marina", "Nicolas", "Olivia", "Paulo", "Renata", "Samuel", "Tatiana", "Vitor"]
+
+
+def carregar_app(pasta: Path, armazenamento: str, grade: dict):
+    """Importa uma instância nova do script principal, com a pasta de trabalho em `pasta`"""
+    os.chdir(pasta)
+    config = {"abertura": "08:00", "fechamento": "21:00", **grade}
+    Path("laboratorio.json").write_text(json.dumps(config), encoding="utf-8")
+    spec = importlib.util.spec_from_file_location(f"laboratorio_{id(pasta)}", SCRIPT)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    app.ARMAZENAMENTO = armazenamento
+    app._mensagens_no_stderr = True
+    return app
+
+
+def gerar_alunos(app, n: int, rng: random.Random):
+    pcs = app.pcs_do_lab()
+    inicio = datetime(2025, 1, 1)
+    linhas = []
+    for _ in range(n):
+        entrada = rng.randrange(8 * 60, 19 * 60)
+        saida = entrada + rng.randrange(30, 150)
+        linhas.append({
+            "pc": rng.choice(pcs),
+            "nome": f"{rng.choice(NOMES)} {rng.choice(NOMES)}",
+            "data": (inicio + timedelta(days=rng.randrange(365))).strftime("%d/%m/%Y"),
+            "entrada": app._hhmm(entrada),
+            "saida": app._hhmm(min(saida, 21 * 60)),
+        })
+    df = app.pd.DataFrame(linhas)
+    df["duracao"] = [app.calcular_duracao(d, e, s) for d, e, s in zip(df["data"], df["entrada"], df["saida"])]
+    return df[app.COLUNAS_ALUNOS]
+
+
+def gerar_relatorios(app, n: int, rng: random.Random):
+    return app.pd.DataFrame({
+        "professor": [f"Prof {rng.choice(NOMES)}" for _ in range(n)],
+        "relatorio": [f"Aula {i}: " + " ".join(rng.choices(NOMES, k=8)) for i in range(n)],
+        "usuario": [rng.choice(list(app.USERS)) for _ in range(n)],
+    })[app.COLUNAS_REL]
+
+
+def gerar_agendamentos(app, n: int, rng: random.Random):
+    """Reservas em células distintas, preenchendo dias a partir de amanhã"""
+    pcs, horarios = app.pcs_do_lab(), app.horarios_do_lab()
+    por_dia = len(pcs) * len(horarios)
+    amanha = datetime.now() + timedelta(days=1)
+    celulas = rng.sample(range(max(n * 2, por_dia)), n)
+    linhas = []
+    for c in celulas:
+        dia, resto = divmod(c, por_dia)
+        linhas.append({
+            "data": (amanha + timedelta(days=dia)).strftime("%d/%m/%Y"),
+            "pc": pcs[resto % len(pcs)],
+            "horario": horarios[resto // len(pcs)],
+            "professor": f"Prof {rng.choice(NOMES)}",
+            "status": "Agendado",
+        })
+    return app.pd.DataFrame(linhas, columns=app.COLUNAS_AG)
+
+
+def preparar_dados(app, n: int, semente: int):
+    """Grava os três conjuntos sintéticos no formato do backend ativo"""
+    rng = random.Random(semente)
+    for df, csv_path in ((gerar_alunos(app, n, rng), app.ARQ_ALUNOS),
+                         (gerar_relatorios(app, n, rng), app.ARQ_REL),
+                         (gerar_agendamentos(app, n, rng), app.ARQ_AG)):
+        df.to_csv(csv_path, index=True, index_label="id")
+        app._acompanhar_sequencia(csv_path, len(df) - 1)
+    if app.ARMAZENAMENTO == "sqlite":
+        app.migrar_csv_para_sqlite(forcar=True)
+
+
+def cronometrar(funcao, repeticoes: int, preparo=None) -> dict:
+    tempos = []
+    for _ in range(repeticoes):
+        if preparo:
+            preparo()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {"mediana_s": statistics.median(tempos), "min_s": min(tempos), "repeticoes": repeticoes}
+
+
+def cenario(n: int, nome_grade: str, armazenamento: str, repeticoes: int, semente: int) -> dict:
+    """Executa todos os benchmarks para um tamanho de dados e uma grade de PCs/horários"""
+    resultados = {}
+    origem = os.getcwd()
+    with tempfile.TemporaryDirectory() as pasta:
+        try:
+            app = carregar_app(Path(pasta), armazenamento, GRADES[nome_grade])
+            preparar_dados(app, n, semente)
+            rotulo = f"{armazenamento}/{nome_grade}/{n}"
+
+            def medir(nome, funcao, preparo=None, vezes=repeticoes):
+                resultados[f"{rotulo}/{nome}"] = cronometrar(funcao, vezes, preparo)
+
+            df = app.carregar_dataframe(app.ARQ_ALUNOS, cols=app.COLUNAS_ALUNOS)
+            medir("carregar_dataframe", lambda: app.carregar_dataframe(app.ARQ_ALUNOS, cols=app.COLUNAS_ALUNOS))
+            cache = app._caminho_cache_tipado(app.ARQ_ALUNOS)
+            medir("carregar_tipado_sem_cache", lambda: app.carregar_tipado(app.ARQ_ALUNOS),
+                  preparo=lambda: cache.unlink(missing_ok=True))
+            medir("carregar_tipado_com_cache", lambda: app.carregar_tipado(app.ARQ_ALUNOS))
+            medir("salvar", lambda: app.salvar_csv_xlsx(df, app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX),
+                  preparo=app._exportador_xlsx.aguardar)
+            if n <= LIMITE_LINHAS_XLSX:
+                medir("salvar_com_xlsx", lambda: (app.salvar_csv_xlsx(df, app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX),
+                                                  app._exportador_xlsx.aguardar()), vezes=1)
+            app._exportador_xlsx.aguardar()
+            # Primeiro backup copia tudo; os seguintes só conferem o cache de hashes
+            medir("criar_backup_inicial", app.criar_backup, vezes=1)
+            medir("criar_backup_sem_mudancas", app.criar_backup)
+
+            ultima = max((n - 1) // app.TAMANHO_PAGINA, 0)
+            medir("listar_primeira_pagina", lambda: app.consultar_registros(app.ARQ_ALUNOS, {}, 0))
+            medir("listar_ultima_pagina", lambda: app.consultar_registros(app.ARQ_ALUNOS, {}, ultima))
+            medir("listar_filtro_nome", lambda: app.consultar_registros(app.ARQ_ALUNOS, {"nome": "Ana"}, 0))
+            medir("buscar_registro", lambda: app.buscar_registro(app.ARQ_ALUNOS, n // 2))
+            medir("indexar_relatorios", app.indice_relatorios().reconstruir, vezes=1)
+            medir("buscar_relatorios", lambda: app.buscar_relatorios("ana bruno"))
+            um_mes_dez_pcs = {"pcs": [f"PC{i:02d}" for i in range(1, 11)], "data_inicio": "01/06/2025", "data_fim": "30/06/2025"}
+            medir("exportar_csv_um_mes", lambda: app.exportar_filtrado(app.ARQ_ALUNOS, um_mes_dez_pcs, Path("exportacao.csv"),
+                                                                       app.COLUNAS_ALUNOS))
+            medir("exportar_xlsx_um_mes", lambda: app.exportar_filtrado(app.ARQ_ALUNOS, um_mes_dez_pcs, Path("exportacao.xlsx"),
+                                                                        app.COLUNAS_ALUNOS), vezes=1)
+            medir("exportar_csv_tudo", lambda: app.exportar_filtrado(app.ARQ_ALUNOS, {}, Path("exportacao.csv"),
+                                                                     app.COLUNAS_ALUNOS), vezes=1)
+
+            servico = app.AgendamentoService()
+            pcs, horarios = servico.pcs, servico.horarios
+            # Um dia depois de todas as reservas sintéticas, para as novas não colidirem
+            dias_ocupados = max(n * 2, len(pcs) * len(horarios)) // (len(pcs) * len(horarios))
+            data = (datetime.now() + timedelta(days=dias_ocupados + 2)).strftime("%d/%m/%Y")
+            medir("agenda_primeira_leitura", lambda: (setattr(servico, "_assinatura", None), servico.indice()))
+            medir("get_horarios_agrupados", lambda: servico.get_horarios_agrupados(data))
+            celulas = iter([(pc, h) for h in horarios for pc in pcs])
+            medir("agendar_horario", lambda: servico.agendar_horario(data, *next(celulas), "Prof Benchmark"),
+                  vezes=min(20, len(pcs) * len(horarios) // 2))
+            livre = horarios[-1]
+            medir("agendar_multiplos_pcs", lambda: servico.agendar_multiplos_pcs(data, livre, pcs, "Prof Lote"), vezes=1)
+            # Uma turma semanal num semestre: 4 PCs x 2 horários x 16 semanas numa só gravação
+            fim = (datetime.strptime(data, "%d/%m/%Y") + timedelta(weeks=15)).strftime("%d/%m/%Y")
+            semestre = app.expandir_recorrencia([(pc, h) for pc in pcs[:4] for h in horarios[-3:-1]], data, fim, "semanal")
+            medir("agendar_lote_semanal", lambda: servico.agendar_lote(semestre, "Prof Semestre"), vezes=1)
+            medir("buscar_capacidade_semestre", lambda: servico.buscar_capacidade(len(pcs) // 2, data, fim, True),
+                  preparo=servico.indice)
+            # Terminal fino falando com um servidor no loopback que mantém os conjuntos em memória
+            servidor = app.ServidorLab().em_segundo_plano()
+            try:
+                remoto = app.ArmazenamentoRemoto(f"{servidor.host}:{servidor.porta}")
+                medir("remoto_copia_completa", lambda: remoto.carregar(app.ARQ_ALUNOS), preparo=remoto._copias.clear)
+                medir("remoto_copia_em_dia", lambda: remoto.carregar(app.ARQ_ALUNOS))
+                medir("remoto_listar_filtro_nome",
+                      lambda: remoto.consultar(app.ARQ_ALUNOS, {"nome": "Ana"}, 0, app.TAMANHO_PAGINA))
+                medir("remoto_buscar_registro", lambda: remoto.buscar(app.ARQ_ALUNOS, n // 2))
+                sessao = df.iloc[0].to_dict()
+                medir("remoto_atualizar_sessao",
+                      lambda: remoto.atualizar(app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX, {int(df.index[0]): sessao}))
+                medir("remoto_delta_apos_gravacao", lambda: remoto.carregar(app.ARQ_ALUNOS),
+                      preparo=lambda: remoto.atualizar(app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX, {int(df.index[0]): sessao}))
+            finally:
+                servidor.parar()
+            app._exportador_xlsx.aguardar()
+            if armazenamento == "csv":
+                # Mesmos dados num laboratório, com as sessões divididas em partições mensais
+                app.migrar_para_lab("benchmark")
+                app._exportador_xlsx.aguardar()
+                um_mes = {"data_inicio": "01/06/2025", "data_fim": "30/06/2025"}
+                medir("lab_carregar_dataframe", lambda: app.carregar_dataframe(app.ARQ_ALUNOS, cols=app.COLUNAS_ALUNOS))
+                medir("lab_listar_um_mes", lambda: app.consultar_registros(app.ARQ_ALUNOS, um_mes, 0))
+                medir("lab_listar_filtro_nome", lambda: app.consultar_registros(app.ARQ_ALUNOS, {"nome": "Ana"}, 0))
+                sessao = df.iloc[0].to_dict()
+                medir("lab_atualizar_sessao", lambda: app.atualizar_registros(app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX,
+                                                                              {int(df.index[0]): sessao}),
+                      preparo=app._exportador_xlsx.aguardar)
+            # Compacta e faz o backup pendente ainda dentro da pasta temporária, não na pasta real ao sair
+            app.compactar_conjuntos()
+            app._finalizar_ao_sair()
+            if app._armazenamento is not None and hasattr(app._armazenamento, "con"):
+                app._armazenamento.con.close()
+        finally:
+            os.chdir(origem)
+    return resultados
+
+
+def comparar(atuais: dict, baseline: dict, tolerancia: float) -> list:
+    """Medições que ficaram mais lentas que a linha de base além da tolerância"""
+    regressoes = []
+    for chave, atual in atuais.items():
+        base = baseline.get(chave)
+        if not base or not base.get("mediana_s"):
+            continue
+        razao = atual["mediana_s"] / base["mediana_s"]
+        atual["razao_baseline"] = round(razao, 3)
+        if razao > 1 + tolerancia:
+            regressoes.append({"medicao": chave, "razao": round(razao, 3),
+                               "baseline_s": base["mediana_s"], "atual_s": atual["mediana_s"]})
+    return regressoes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks com dados sintéticos")
+    parser.add_argument("--tamanhos", default="1000,100000", help="linhas por conjunto, separadas por vírgula")
+    parser.add_argument("--grades", default="padrao,grande", help=f"grades de PCs/horários: {', '.join(GRADES)}")
+    parser.add_argument("--armazenamento", choices=("csv", "sqlite"), default="csv")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", default="benchmark_resultados.json")
+    parser.add_argument("--baseline", default=str(ARQ_BASELINE))
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="lentidão aceita antes de acusar regressão")
+    parser.add_argument("--salvar-baseline", action="store_true", help="grava estes resultados como linha de base")
+    args = parser.parse_args()
+
+    saida = Path(args.saida).resolve()
+    baseline_path = Path(args.baseline).resolve()
+    resultados = {}
+    for n in (int(t) for t in args.tamanhos.split(",")):
+        for grade in args.grades.split(","):
+            print(f"> {args.armazenamento} / {grade} / {n} linhas", file=sys.stderr)
+            resultados.update(cenario(n, grade, args.armazenamento, args.repeticoes, args.semente))
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["resultados"] if baseline_path.exists() else {}
+    regressoes = comparar(resultados, baseline, args.tolerancia)
+    relatorio = {
+        "meta": {
+            "criado_em": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "armazenamento": args.armazenamento,
+        },
+        "resultados": resultados,
+        "regressoes": regressoes,
+    }
+    saida.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.salvar_baseline:
+        baseline_path.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    largura = max(map(len, resultados))
+    for chave, r in resultados.items():
+        razao = f"  x{r['razao_baseline']:.2f}" if "razao_baseline" in r else ""
+        print(f"{chave:<{largura}}  {r['mediana_s'] * 1000:10.2f} ms{razao}")
+    if not baseline:
+        print(f"Sem linha de base em {baseline_path} (use --salvar-baseline)", file=sys.stderr)
+    for r in regressoes:
+        print(f"REGRESSÃO: {r['medicao']} {r['razao']:.2f}x mais lento", file=sys.stderr)
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,54 @@
-import pandas as pd
+from __future__ import annotations
+import time
+_INICIO_PROCESSO = time.perf_counter()
 import os
+import sys
+import csv
+import atexit
+import threading
+import platform
+import importlib
+import functools
 import pwinput
-import time
 import shutil
+import json
+import hashlib
+import hmac
+import re
+import unicodedata
+import sqlite3
+import heapq
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+# pandas importa concurrent.futures.thread, que registra um hook de saída; importado
+# já aqui, o pandas ainda pode ser carregado pela primeira vez dentro do atexit
+import concurrent.futures.thread
+from contextlib import contextmanager, closing, ExitStack
 from datetime import datetime, timedelta
-from tabulate import tabulate
 from pathlib import Path
-from colorama import Fore, Style, init
-from openpyxl import load_workbook
-from openpyxl.styles import Font, Alignment
 
-init(autoreset=True)
+class _ModuloPreguicoso:
+    """Adia o import de um módulo pesado até o primeiro acesso a um atributo"""
+
+    def __init__(self, nome: str):
+        self._nome = nome
+        self._modulo = None
+
+    def __getattr__(self, atributo: str):
+        if self._modulo is None:
+            self._modulo = importlib.import_module(self._nome)
+        return getattr(self._modulo, atributo)
+
+# pandas, openpyxl, tabulate e colorama só são carregados quando usados:
+# a tela de login e os acréscimos ao journal não dependem deles
+pd = _ModuloPreguicoso("pandas")
+MODULOS_PESADOS = ("pandas", "openpyxl", "tabulate", "colorama")
+LIMITE_LEITURA_RAPIDA = 256 * 1024  # bytes até os quais buscas por ID usam só o módulo csv
+
+def tabulate(*args, **kwargs) -> str:
+    from tabulate import tabulate as _tabulate
+    return _tabulate(*args, **kwargs)
 
 # Configurações do sistema
 ARQ_ALUNOS = Path("alunos.csv")
@@ -18,84 +56,477 @@ ARQ_ALUNOS_XLSX = Path("alunos.xlsx")
 ARQ_REL = Path("relatorios.csv")
 ARQ_REL_XLSX = Path("relatorios.xlsx")
 ARQ_AG = Path("agendamentos.csv")
+ARQ_AG_XLSX = Path("agendamentos.xlsx")
+ARQ_DB = Path("laboratorio.db")
+ARQ_ANALISE = Path("analise_uso.json")  # agregados de uso mantidos incrementalmente
+ARQ_INDICE_REL = Path("relatorios_indice.json")  # índice invertido da busca de relatórios
+# Arquivos acima ficam na pasta do laboratório ativo: "." no layout de um laboratório só,
+# DIR_DADOS/<lab> quando há vários (os de alunos ainda divididos em subpastas AAAA-MM)
+ARQUIVOS_DO_LAB = ("ARQ_ALUNOS", "ARQ_ALUNOS_XLSX", "ARQ_REL", "ARQ_REL_XLSX", "ARQ_AG", "ARQ_AG_XLSX",
+                   "ARQ_DB", "ARQ_ANALISE", "ARQ_INDICE_REL")
+DIR_DADOS = Path(os.environ.get("LAB_DIR_DADOS", "data"))
+DIR_LAB = Path(".")
+LAB_ATUAL = None
+PARTICOES_MENSAIS = {"alunos": "data"}  # conjunto -> coluna DD/MM/AAAA que define a partição do mês
+LEITORES_PARALELOS = min(8, os.cpu_count() or 1)  # threads para ler várias partições ao mesmo tempo
+COLUNAS_ALUNOS = ["pc", "nome", "data", "entrada", "saida", "duracao"]
+COLUNAS_REL = ["professor", "relatorio", "usuario"]
+COLUNAS_AG = ["data", "pc", "horario", "professor", "status"]
+ARMAZENAMENTO = os.environ.get("LAB_ARMAZENAMENTO", "csv")  # "csv", "sqlite" ou "remoto" (cliente do servidor)
+SERVIDOR = os.environ.get("LAB_SERVIDOR", "127.0.0.1:8765")  # host:porta do servidor do laboratório
+TOKEN_SERVIDOR = os.environ.get("LAB_TOKEN", "")  # segredo compartilhado; obrigatório se o servidor sair do loopback
+LIMITE_HISTORICO_SERVIDOR = 1000  # alterações guardadas para os clientes se atualizarem por diferença
+TAMANHO_BLOCO = 5000  # linhas lidas por vez nas consultas em streaming
+TAMANHO_PAGINA = 20
+LINHAS_MAX_XLSX = 1048576  # limite de linhas de uma planilha, com o cabeçalho
+LIMITE_JOURNAL = 200  # registros pendentes antes de compactar o journal no snapshot
+LIMITE_LOG_DERIVADO = 200  # deltas no log de um índice/agregado antes de regravar o JSON inteiro
+DIR_BACKUP = Path("backup")
+DIR_BACKUP_OBJETOS = DIR_BACKUP / "objetos"
+DIR_BACKUP_SNAPSHOTS = DIR_BACKUP / "snapshots"
+XLSX_EM_SEGUNDO_PLANO = True  # gera o XLSX numa thread, agrupando salvamentos repetidos do mesmo arquivo
+XLSX_AO_SAIR = os.environ.get("LAB_XLSX_AO_SAIR", "1") != "0"  # ao encerrar, espera as exportações pendentes (0 ou --sem-xlsx pula)
+INTERVALO_BACKUP = float(os.environ.get("LAB_INTERVALO_BACKUP", 60))  # segundos mínimos entre snapshots automáticos
+ESPERA_BACKUP = 2.0  # segundos para agrupar gravações seguidas num único snapshot
+RETENCAO_BACKUP = {"horas_horarias": 24, "dias_diarios": 30}  # um snapshot por hora no último dia, um por dia no último mês
+ARQ_CONFIG_LAB = Path("laboratorio.json")
+CONFIG_LAB_PADRAO = {"pcs": 20, "abertura": "08:00", "fechamento": "21:00", "slot_minutos": 60}
+INSTRUMENTACAO_ATIVA = os.environ.get("LAB_INSTRUMENTACAO", "1") != "0"
+ARQ_LOG_DIAGNOSTICO = Path(os.environ["LAB_LOG_DIAGNOSTICO"]) if os.environ.get("LAB_LOG_DIAGNOSTICO") else None  # log JSON por chamada
 USERS = {
     "admin": {"senha": "admin123", "nome": "Administrador"},
     "proftec": {"senha": "tecnico123", "nome": "Prof. Técnico"},
     "professor": {"senha": "prof123", "nome": "Professor"}
 }
 
+_config_lab = None
+
+def config_lab() -> dict:
+    """Tamanho do laboratório e expediente; laboratorio.json sobrescreve os valores padrão
+
+    Com vários laboratórios, o laboratorio.json da pasta do laboratório ativo
+    sobrescreve o da pasta de trabalho
+    """
+    global _config_lab
+    if _config_lab is None:
+        _config_lab = dict(CONFIG_LAB_PADRAO)
+        for arquivo in dict.fromkeys((ARQ_CONFIG_LAB, DIR_LAB / ARQ_CONFIG_LAB.name)):
+            if arquivo.exists():
+                with open(arquivo, encoding="utf-8") as f:
+                    _config_lab.update(json.load(f))
+    return _config_lab
+
+def _minutos(hora: str) -> int:
+    h, m = map(int, hora.split(":"))
+    return h * 60 + m
+
+def _hhmm(minutos: int) -> str:
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+def pcs_do_lab() -> list:
+    return [f"PC{i:02d}" for i in range(1, config_lab()["pcs"] + 1)]
+
+def horarios_do_lab() -> list:
+    """Slots do expediente no formato HH:MM - HH:MM"""
+    cfg = config_lab()
+    passo = cfg["slot_minutos"]
+    inicio, fim = _minutos(cfg["abertura"]), _minutos(cfg["fechamento"])
+    return [f"{_hhmm(t)} - {_hhmm(t + passo)}" for t in range(inicio, fim - passo + 1, passo)]
+
+class Instrumentacao:
+    """Latência, linhas, bytes e erros por operação de armazenamento, backup e agenda
+
+    Os tempos vão para um histograma de faixas fixas (em ms), então o custo por
+    chamada é constante; com ARQ_LOG_DIAGNOSTICO, cada chamada também vira uma
+    linha JSON no arquivo
+    """
+
+    LIMITES_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, ativa: bool = True, arquivo_log: Path = None):
+        self.ativa = ativa
+        self.arquivo_log = arquivo_log
+        self._trava = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._trava:
+            self._operacoes = {}
+            self.ultimos_erros = []
+
+    def _operacao(self, nome: str) -> dict:
+        op = self._operacoes.get(nome)
+        if op is None:
+            op = self._operacoes[nome] = {
+                "chamadas": 0, "total_s": 0.0, "max_s": 0.0, "faixas": [0] * (len(self.LIMITES_MS) + 1),
+                "linhas": 0, "bytes_lidos": 0, "bytes_gravados": 0, "erros": 0, "erros_engolidos": 0
+            }
+        return op
+
+    def registrar(self, nome: str, segundos: float, linhas: int = 0, bytes_lidos: int = 0,
+                  bytes_gravados: int = 0, erro: Exception = None):
+        ms = segundos * 1000
+        faixa = next((i for i, limite in enumerate(self.LIMITES_MS) if ms <= limite), len(self.LIMITES_MS))
+        with self._trava:
+            op = self._operacao(nome)
+            op["chamadas"] += 1
+            op["total_s"] += segundos
+            op["max_s"] = max(op["max_s"], segundos)
+            op["faixas"][faixa] += 1
+            op["linhas"] += linhas
+            op["bytes_lidos"] += bytes_lidos
+            op["bytes_gravados"] += bytes_gravados
+            if erro is not None:
+                op["erros"] += 1
+        self._log({"operacao": nome, "ms": round(ms, 3), "linhas": linhas, "bytes_lidos": bytes_lidos,
+                   "bytes_gravados": bytes_gravados, "erro": repr(erro) if erro is not None else None})
+
+    def somar_bytes(self, nome: str, lidos: int = 0, gravados: int = 0):
+        """Bytes apurados dentro da própria operação (ex.: cópias de backup)"""
+        with self._trava:
+            op = self._operacao(nome)
+            op["bytes_lidos"] += lidos
+            op["bytes_gravados"] += gravados
+
+    def erro_engolido(self, nome: str, erro: Exception):
+        """Conta um erro que a operação tratou sem propagar"""
+        evento = {"operacao": nome, "erro_engolido": repr(erro), "quando": datetime.now().isoformat(timespec="seconds")}
+        with self._trava:
+            self._operacao(nome)["erros_engolidos"] += 1
+            self.ultimos_erros = (self.ultimos_erros + [evento])[-20:]
+        self._log(evento)
+
+    def _log(self, evento: dict):
+        if not self.arquivo_log:
+            return
+        linha = json.dumps({"ts": time.time(), **evento}, ensure_ascii=False)
+        try:
+            with self._trava, open(self.arquivo_log, "a", encoding="utf-8") as f:
+                f.write(linha + "\n")
+        except OSError:
+            pass
+
+    def _percentil(self, faixas: list, fracao: float) -> str:
+        alvo = fracao * sum(faixas)
+        acumulado = 0
+        for i, quantidade in enumerate(faixas):
+            acumulado += quantidade
+            if quantidade and acumulado >= alvo:
+                return f"≤{self.LIMITES_MS[i]}" if i < len(self.LIMITES_MS) else f">{self.LIMITES_MS[-1]}"
+        return "-"
+
+    def resumo(self) -> list:
+        """Uma linha por operação, com p50/p95 pela faixa do histograma (ms)"""
+        with self._trava:
+            operacoes = {nome: dict(op, faixas=list(op["faixas"])) for nome, op in self._operacoes.items()}
+        linhas = []
+        for nome, op in sorted(operacoes.items()):
+            linhas.append({
+                "operacao": nome,
+                "chamadas": op["chamadas"],
+                "media_ms": round(op["total_s"] * 1000 / op["chamadas"], 2) if op["chamadas"] else 0.0,
+                "p50_ms": self._percentil(op["faixas"], 0.5),
+                "p95_ms": self._percentil(op["faixas"], 0.95),
+                "max_ms": round(op["max_s"] * 1000, 2),
+                "linhas": op["linhas"],
+                "bytes_lidos": op["bytes_lidos"],
+                "bytes_gravados": op["bytes_gravados"],
+                "erros": op["erros"],
+                "erros_engolidos": op["erros_engolidos"],
+            })
+        return linhas
+
+    def histograma(self, nome: str) -> list:
+        """(faixa em ms, chamadas) de uma operação"""
+        with self._trava:
+            faixas = list(self._operacoes[nome]["faixas"]) if nome in self._operacoes else []
+        rotulos = [f"≤{limite}" for limite in self.LIMITES_MS] + [f">{self.LIMITES_MS[-1]}"]
+        return list(zip(rotulos, faixas))
+
+_instrumentacao = Instrumentacao(INSTRUMENTACAO_ATIVA, ARQ_LOG_DIAGNOSTICO)
+
+def medido(nome: str, linhas=None, bytes_lidos=None, bytes_gravados=None):
+    """Decorador que cronometra a função; os extras recebem (resultado, *args, **kwargs)"""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            if not _instrumentacao.ativa:
+                return funcao(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                resultado = funcao(*args, **kwargs)
+            except Exception as e:
+                _instrumentacao.registrar(nome, time.perf_counter() - inicio, erro=e)
+                raise
+            decorrido = time.perf_counter() - inicio
+            extras = {}
+            try:
+                for chave, calculo in (("linhas", linhas), ("bytes_lidos", bytes_lidos), ("bytes_gravados", bytes_gravados)):
+                    if calculo is not None:
+                        extras[chave] = int(calculo(resultado, *args, **kwargs) or 0)
+            except Exception as e:
+                _instrumentacao.erro_engolido(f"{nome}.metricas", e)
+            _instrumentacao.registrar(nome, decorrido, **extras)
+            return resultado
+        return envoltorio
+    return decorador
+
+def _tamanho_em_disco(*arquivos: Path) -> int:
+    total = 0
+    for arq in arquivos:
+        try:
+            total += arq.stat().st_size
+        except (FileNotFoundError, TypeError):
+            pass
+    return total
+
+def _bytes_dataset(csv_path: Path) -> int:
+    """Bytes lidos ao carregar o conjunto no backend CSV (snapshot + journal de cada partição)"""
+    if ARMAZENAMENTO != "csv":
+        return 0
+    return _tamanho_em_disco(*arquivos_do_conjunto(csv_path))
+
+class EntradaInvalida(ValueError):
+    """Pedido ou dado informado pelo usuário que não passa na validação; no CLI sai com o código 2"""
+
+class IndiceAgenda:
+    """Índice das reservas por (data, PC, horário); a disponibilidade é derivada dele"""
+    
+    def __init__(self, df: pd.DataFrame, pcs: list, horarios: list):
+        self.pcs = pcs
+        self.horarios = horarios
+        # Só as reservas são guardadas: memória proporcional ao número de agendamentos
+        self.reservas = {}
+        self.posicao_pc = {pc: i for i, pc in enumerate(pcs)}
+        # Bit i ligado = pcs[i] ocupado no slot (data, horário); slots sem reserva não aparecem
+        self.bits_slot = defaultdict(int)
+        self.ocupados_slot = defaultdict(set)
+        self.ocupados_pc = defaultdict(set)
+        self.slots_professor = defaultdict(set)
+        # Células com mais de uma linha no arquivo (dados antigos): desmarcar uma não as libera
+        self.repetidas = set()
+        for idx, data, pc, horario, professor in zip(df.index, df["data"], df["pc"], df["horario"], df["professor"]):
+            self.marcar(idx, data, pc, horario, professor)
+    
+    def ocupante(self, data: str, pc: str, horario: str):
+        """Professor que ocupa a célula, ou None se estiver livre"""
+        reserva = self.reservas.get((data, pc, horario))
+        return reserva[1] if reserva else None
+    
+    def marcar(self, idx, data: str, pc: str, horario: str, professor: str):
+        if (data, pc, horario) in self.reservas:
+            self.repetidas.add((data, pc, horario))
+        self.reservas[(data, pc, horario)] = (idx, professor)
+        if pc in self.posicao_pc:
+            self.bits_slot[(data, horario)] |= 1 << self.posicao_pc[pc]
+        self.ocupados_slot[(data, horario)].add(pc)
+        self.ocupados_pc[(data, pc)].add(horario)
+        self.slots_professor[professor].add((data, pc, horario))
+    
+    def desmarcar(self, data: str, pc: str, horario: str):
+        """Desfaz `marcar` para uma célula cancelada"""
+        reserva = self.reservas.pop((data, pc, horario), None)
+        if reserva is None:
+            return
+        if pc in self.posicao_pc:
+            bits = self.bits_slot[(data, horario)] & ~(1 << self.posicao_pc[pc])
+            if bits:
+                self.bits_slot[(data, horario)] = bits
+            else:
+                del self.bits_slot[(data, horario)]
+        for ocupados, chave, valor in ((self.ocupados_slot, (data, horario), pc), (self.ocupados_pc, (data, pc), horario)):
+            ocupados[chave].discard(valor)
+            if not ocupados[chave]:
+                del ocupados[chave]
+        self.slots_professor[reserva[1]].discard((data, pc, horario))
+    
+    def conflito(self, professor: str, data: str, horario: str, pc: str = None) -> bool:
+        if pc:
+            return (data, pc, horario) in self.slots_professor.get(professor, ())
+        return any(d == data and h == horario for d, _, h in self.slots_professor.get(professor, ()))
+    
+    def pcs_livres(self, data: str, horario: str) -> list:
+        ocupados = self.ocupados_slot.get((data, horario), ())
+        return [pc for pc in self.pcs if pc not in ocupados]
+    
+    def horarios_livres(self, data: str, pc: str) -> list:
+        ocupados = self.ocupados_pc.get((data, pc), ())
+        return [h for h in self.horarios if h not in ocupados]
+    
+    def bits_livres(self, data: str, horario: str) -> int:
+        """Máscara dos PCs livres no slot, na ordem de `pcs`"""
+        return ~self.bits_slot.get((data, horario), 0) & ((1 << len(self.pcs)) - 1)
+    
+    def qtd_livres(self, data: str, horario: str) -> int:
+        return len(self.pcs) - len(self.ocupados_slot.get((data, horario), ()))
+    
+    def bloco_livre(self, data: str, horario: str, tamanho: int):
+        """Primeiro bloco de `tamanho` PCs vizinhos livres no slot, ou None"""
+        if tamanho < 1:
+            raise EntradaInvalida(f"Tamanho de bloco inválido: {tamanho} (mínimo 1 PC)")
+        # Invariante: o bit i de `inicios` indica que os bits i..i+largura-1 estão livres;
+        # dobrar a largura a cada passo leva log2(tamanho) operações
+        inicios = self.bits_livres(data, horario)
+        largura = 1
+        while largura * 2 <= tamanho:
+            inicios &= inicios >> largura
+            largura *= 2
+        inicios &= inicios >> (tamanho - largura)
+        if not inicios:
+            return None
+        primeiro = (inicios & -inicios).bit_length() - 1
+        return self.pcs[primeiro:primeiro + tamanho]
+
+FREQUENCIAS_RECORRENCIA = {"diaria": 1, "semanal": 7}
+
+def expandir_recorrencia(pares: list, data_inicio: str, data_fim: str = None, frequencia: str = None,
+                         dias_semana: list = None) -> list:
+    """Células (data, pc, horário) de cada par (pc, horário) repetido de `data_inicio` até `data_fim`
+
+    `frequencia` é "diaria" ou "semanal" (sem ela, só `data_inicio`); `dias_semana` (0 = segunda)
+    restringe as datas geradas
+    """
+    inicio = datetime.strptime(data_inicio, "%d/%m/%Y")
+    fim = datetime.strptime(data_fim, "%d/%m/%Y") if data_fim and frequencia else inicio
+    if frequencia and frequencia not in FREQUENCIAS_RECORRENCIA:
+        raise EntradaInvalida(f"Frequência inválida: {frequencia}")
+    if fim < inicio:
+        raise EntradaInvalida("A data final é anterior à inicial")
+    passo = FREQUENCIAS_RECORRENCIA.get(frequencia, 1)
+    datas = [inicio + timedelta(days=d) for d in range(0, (fim - inicio).days + 1, passo)]
+    if dias_semana is not None:
+        datas = [d for d in datas if d.weekday() in dias_semana]
+    return [(d.strftime("%d/%m/%Y"), pc, horario) for d in datas for pc, horario in pares]
+
+class AgendaLegada(EntradaInvalida):
+    """A agenda ainda está na grade antiga sem datas e precisa de converter_agenda_legada"""
+
+def _grade_legada(df: pd.DataFrame) -> bool:
+    return "data" not in df.columns or df["data"].isna().any()
+
 class AgendamentoService:
     """Serviço para gerenciamento de agendamentos"""
     
     def __init__(self):
         self.arquivo_ag = ARQ_AG
-        self.arquivo_xlsx = Path("agendamentos.xlsx")
+        self.arquivo_xlsx = ARQ_AG_XLSX
+        self.pcs = pcs_do_lab()
+        self.horarios = horarios_do_lab()
+        # Reservas mantidas em memória; só são relidas quando o arquivo muda no disco
+        self._df = None
+        self._indice = None
+        self._assinatura = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    def _agendamentos(self) -> pd.DataFrame:
+        """Retorna as reservas em memória, recarregando do disco apenas se o arquivo mudou"""
+        assinatura = assinatura_dataset(self.arquivo_ag)
+        if self._em_dia(assinatura):
+            self._assinatura = assinatura
+            self.cache_hits += 1
+            return self._df
+        self.cache_misses += 1
+        df = carregar_dataframe(self.arquivo_ag, cols=COLUNAS_AG)
+        if _grade_legada(df):
+            # A conversão descarta a grade vaga: só roda por converter_agenda_legada, com backup antes
+            raise AgendaLegada("A agenda está no formato antigo, sem datas. Peça ao ADMIN para convertê-la "
+                               "(Limpar dados > Converter agenda antiga, ou o comando agenda convert).")
+        self._df = df
+        self._indice = IndiceAgenda(df, self.pcs, self.horarios)
+        self._assinatura = assinatura
+        return self._df
+    
+    def _em_dia(self, assinatura) -> bool:
+        """Se a agenda em memória corresponde à `assinatura` do disco (ou à sua versão compactada)"""
+        return self._df is not None and self._assinatura is not None and (
+            assinatura == self._assinatura or _compactacoes.get(self.arquivo_ag) == (self._assinatura, assinatura)
+        )
+    
+    def _gravar(self, gravar, linhas, aplicar):
+        """Executa `gravar()` e repete a alteração na agenda em memória com `aplicar(resultado)`
+
+        `linhas(resultado)` diz quantas linhas a gravação mudou. Se outro terminal alterou a
+        agenda antes ou durante a gravação, a memória é descartada e relida na próxima consulta
+        """
+        with _trava_journal, _trava_conjunto(self.arquivo_ag):
+            antes = assinatura_dataset(self.arquivo_ag)
+            em_dia = self._em_dia(antes)
+            resultado = gravar()
+            depois = assinatura_dataset(self.arquivo_ag)
+            if em_dia and armazenamento().so_gravacao_propria(self.arquivo_ag, antes, depois, linhas(resultado)):
+                aplicar(resultado)
+                self._assinatura = depois
+            else:
+                self._assinatura = None
+        return resultado
+    
+    def indice(self) -> IndiceAgenda:
+        """Índice das reservas correspondente à agenda em memória"""
+        self._agendamentos()
+        return self._indice
+    
+    def _reservar(self, celulas: list, professor: str, tudo_ou_nada: bool = False) -> list:
+        """Grava as células (data, pc, horário) ainda livres no armazenamento e retorna as reservadas
+
+        A verificação é refeita sobre o estado atual do disco/banco, então reservas
+        feitas por outro terminal desde a última leitura são respeitadas
+        """
+        registros = [
+            {"data": data, "pc": pc, "horario": horario, "professor": professor, "status": "Agendado"}
+            for data, pc, horario in celulas
+        ]
+        def aplicar(inseridos):
+            novos = pd.DataFrame([{c: r[c] for c in COLUNAS_AG} for r in inseridos], columns=self._df.columns,
+                                 index=pd.Index([r["id"] for r in inseridos], name=self._df.index.name))
+            self._df = pd.concat([self._df, novos]) if len(self._df) else novos
+            for r in inseridos:
+                self._indice.marcar(r["id"], r["data"], r["pc"], r["horario"], r["professor"])
+        
+        inseridos = self._gravar(
+            lambda: inserir_registros_unicos(
+                registros, self.arquivo_ag, self.arquivo_xlsx, COLUNAS_AG, ["data", "pc", "horario"], tudo_ou_nada
+            ),
+            len, aplicar
+        )
+        return [(r["data"], r["pc"], r["horario"]) for r in inseridos]
+    
+    def estatisticas_cache(self) -> dict:
+        """Contadores de acerto/falha do cache da agenda"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "taxa_acerto": self.cache_hits / total if total else 0.0
+        }
     
     def carregar_agendamentos(self) -> pd.DataFrame:
-        """Carrega os agendamentos do arquivo"""
-        if not self.arquivo_ag.exists():
-            self._criar_agendamentos_iniciais()
-        return carregar_dataframe(self.arquivo_ag)
-    
-    def _criar_agendamentos_iniciais(self):
-        """Cria a estrutura inicial de agendamentos"""
-        horarios = [f"{h:02d}:00 - {h+1:02d}:00" for h in range(8, 21)]
-        pcs = [f"PC{i:02d}" for i in range(1, 21)]
-        registros = []
-        for pc in pcs:
-            for h in horarios:
-                registros.append([pc, h, "livre", "Disponível"])
-        df_ag = pd.DataFrame(registros, columns=["pc", "horario", "professor", "status"])
-        salvar_csv_xlsx(df_ag, self.arquivo_ag, self.arquivo_xlsx)
-    
-    def verificar_conflito(self, professor: str, horario: str, pc: str = None) -> bool:
+        """Carrega as reservas do arquivo"""
+        return self._agendamentos().copy()
+    
+    def verificar_conflito(self, professor: str, data: str, horario: str, pc: str = None) -> bool:
         """Verifica se professor já tem agendamento no mesmo horário para o mesmo PC"""
-        agendamentos = self.carregar_agendamentos()
-        
-        if pc:
-            # Verifica conflito específico para um PC
-            conflito = agendamentos[
-                (agendamentos["professor"] == professor) &
-                (agendamentos["horario"] == horario) &
-                (agendamentos["pc"] == pc) &
-                (agendamentos["status"] == "Agendado")
-            ]
-        else:
-            # Verifica se o professor já tem qualquer agendamento neste horário
-            conflito = agendamentos[
-                (agendamentos["professor"] == professor) &
-                (agendamentos["horario"] == horario) &
-                (agendamentos["status"] == "Agendado")
-            ]
-        
-        return not conflito.empty
+        # Sem pc, verifica se o professor já tem qualquer agendamento neste horário
+        return self.indice().conflito(professor, data, horario, pc)
     
-    def agendar_horario(self, idx: int, professor: str) -> bool:
+    @medido("agendar_horario", linhas=lambda ok, *a, **k: int(bool(ok)))
+    def agendar_horario(self, data: str, pc: str, horario: str, professor: str) -> bool:
         """Realiza o agendamento de um horário"""
         try:
-            df_agend = self.carregar_agendamentos()
-            
-            if idx not in df_agend.index:
+            if pc not in self.pcs or horario not in self.horarios:
                 return False
-            
-            horario_escolhido = df_agend.loc[idx, "horario"]
-            pc_escolhido = df_agend.loc[idx, "pc"]
-            
-            # Verificar conflito apenas para o PC específico
-            if self.verificar_conflito(professor, horario_escolhido, pc_escolhido):
+            if self.indice().ocupante(data, pc, horario) is not None:
                 return False
-            
-            # Realizar agendamento
-            df_agend.loc[idx, "professor"] = professor
-            df_agend.loc[idx, "status"] = "Agendado"
-            salvar_csv_xlsx(df_agend, self.arquivo_ag, self.arquivo_xlsx)
-            return True
+            # Falha se outro terminal reservou a célula desde a última leitura
+            return bool(self._reservar([(data, pc, horario)], professor))
             
         except Exception as e:
+            _instrumentacao.erro_engolido("agendar_horario", e)
             msg(f"Erro ao agendar: {e}", "err")
             return False
     
-    def agendar_multiplos_pcs(self, indices: list, professor: str) -> dict:
+    @medido("agendar_multiplos_pcs", linhas=lambda r, *a, **k: len(r["sucessos"]))
+    def agendar_multiplos_pcs(self, data: str, horario: str, pcs: list, professor: str) -> dict:
         """Agenda múltiplos PCs no mesmo horário"""
         resultados = {
             'sucessos': [],
@@ -103,98 +534,378 @@ class AgendamentoService:
         }
         
         try:
-            df_agend = self.carregar_agendamentos()
-            horarios_agendados = set()
-            pcs_agendados = set()
-            
-            # Primeiro, verificar todos os agendamentos
-            for idx in indices:
-                if idx not in df_agend.index:
-                    resultados['falhas'].append(f"Índice {idx} inválido")
-                    continue
-                
-                horario = df_agend.loc[idx, "horario"]
-                pc = df_agend.loc[idx, "pc"]
-                
-                # Verificar se o horário é o mesmo para todos
-                horarios_agendados.add(horario)
-                pcs_agendados.add(pc)
-                
-                # Verificar conflito para este PC específico
-                if self.verificar_conflito(professor, horario, pc):
-                    resultados['falhas'].append(f"PC {pc} já agendado por você neste horário")
-                    continue
-            
-            # Se há mais de um horário diferente, não permitir
-            if len(horarios_agendados) > 1:
-                resultados['falhas'].append("Todos os agendamentos devem ser no mesmo horário")
+            if horario not in self.horarios:
+                resultados['falhas'].append(f"Horário {horario} inválido")
                 return resultados
+            # Todo o lote é verificado contra o índice carregado uma única vez
+            indice = self.indice()
+            celulas = []
+            for pc in dict.fromkeys(pcs):
+                if pc not in self.pcs:
+                    resultados['falhas'].append(f"PC {pc} inválido")
+                elif indice.conflito(professor, data, horario, pc):
+                    resultados['falhas'].append(f"PC {pc} já agendado por você neste horário")
+                elif indice.ocupante(data, pc, horario) is not None:
+                    resultados['falhas'].append(f"PC {pc} já está reservado neste horário")
+                else:
+                    celulas.append((data, pc, horario))
             
-            # Realizar os agendamentos válidos
-            for idx in indices:
-                if idx in df_agend.index:
-                    horario = df_agend.loc[idx, "horario"]
-                    pc = df_agend.loc[idx, "pc"]
-                    
-                    if not self.verificar_conflito(professor, horario, pc):
-                        df_agend.loc[idx, "professor"] = professor
-                        df_agend.loc[idx, "status"] = "Agendado"
-                        resultados['sucessos'].append(f"PC {pc} - {horario}")
-            
-            if resultados['sucessos']:
-                salvar_csv_xlsx(df_agend, self.arquivo_ag, self.arquivo_xlsx)
+            reservadas = set(self._reservar(celulas, professor)) if celulas else set()
+            for celula in celulas:
+                _, pc, horario = celula
+                if celula in reservadas:
+                    resultados['sucessos'].append(f"PC {pc} - {horario}")
+                else:
+                    resultados['falhas'].append(f"PC {pc} - {horario} já foi reservado em outro terminal")
             
             return resultados
             
         except Exception as e:
+            _instrumentacao.erro_engolido("agendar_multiplos_pcs", e)
             msg(f"Erro ao agendar múltiplos PCs: {e}", "err")
             resultados['falhas'].append("Erro interno do sistema")
             return resultados
     
-    def get_horarios_disponiveis(self) -> pd.DataFrame:
-        """Retorna horários disponíveis"""
-        df = self.carregar_agendamentos()
-        return df[df["status"] == "Disponível"]
-    
-    def get_horarios_agendados(self) -> pd.DataFrame:
-        """Retorna horários agendados"""
-        df = self.carregar_agendamentos()
-        return df[df["status"] == "Agendado"]
+    @medido("agendar_lote", linhas=lambda r, *a, **k: sum(item["reservado"] for item in r))
+    def agendar_lote(self, celulas: list, professor: str, tudo_ou_nada: bool = True) -> list:
+        """Reserva um conjunto qualquer de células (data, pc, horário) numa única gravação
+
+        Retorna um resultado por célula pedida, na mesma ordem: {data, pc, horario, reservado, motivo}.
+        Com `tudo_ou_nada`, qualquer célula recusada cancela o lote inteiro; sem ele, as livres são gravadas
+        """
+        pedidos = pd.DataFrame(list(celulas), columns=["data", "pc", "horario"])
+        if pedidos.empty:
+            return []
+        # Validação de todo o lote de uma vez, contra a agenda em memória
+        datas = pd.to_datetime(pedidos["data"], format="%d/%m/%Y", errors="coerce")
+        # "1/12/2026" e "01/12/2026" são a mesma célula: a agenda só conhece a forma com zeros
+        pedidos["data"] = datas.dt.strftime("%d/%m/%Y").where(datas.notna(), pedidos["data"])
+        agenda = self._agendamentos()[["data", "pc", "horario", "professor"]].drop_duplicates(["data", "pc", "horario"])
+        ocupacao = pedidos.merge(agenda, on=["data", "pc", "horario"], how="left")["professor"]
+        regras = [
+            (datas.isna(), "data inválida"),
+            (datas < pd.Timestamp(datetime.now().date()), "data no passado"),
+            (~pedidos["pc"].isin(self.pcs), "PC inválido"),
+            (~pedidos["horario"].isin(self.horarios), "horário inválido"),
+            (pedidos.duplicated(["data", "pc", "horario"]), "célula repetida no lote"),
+            (ocupacao.eq(professor).to_numpy(), "já agendado por você"),
+            (ocupacao.notna().to_numpy(), "já reservado"),
+        ]
+        motivos = pd.Series("", index=pedidos.index)
+        # A primeira regra violada é a que aparece no resultado
+        for mascara, motivo in reversed(regras):
+            motivos = motivos.mask(pd.Series(mascara, index=pedidos.index).fillna(False).astype(bool), motivo)
+        
+        livres = motivos == ""
+        if tudo_ou_nada and not livres.all():
+            motivos[livres] = "lote cancelado"
+        else:
+            celulas_livres = list(zip(pedidos["data"][livres], pedidos["pc"][livres], pedidos["horario"][livres]))
+            reservadas = set(self._reservar(celulas_livres, professor, tudo_ou_nada)) if celulas_livres else set()
+            # Recusadas na gravação: outro terminal as reservou depois da nossa leitura.
+            # No tudo-ou-nada nada foi gravado; a agenda relida aponta quais células causaram isso
+            indice = self.indice() if tudo_ou_nada and not reservadas else None
+            for idx, celula in zip(pedidos.index[livres], celulas_livres):
+                if celula in reservadas:
+                    continue
+                if indice is None or indice.ocupante(*celula) is not None:
+                    motivos[idx] = "reservado em outro terminal"
+                else:
+                    motivos[idx] = "lote cancelado"
+        
+        pedidos["reservado"] = motivos == ""
+        pedidos["motivo"] = motivos
+        return pedidos.to_dict("records")
     
-    def get_horarios_agrupados(self) -> dict:
-        """Retorna horários agrupados por período"""
-        df = self.carregar_agendamentos()
-        horarios_agrupados = {}
+    @medido("cancelar_agendamento", linhas=lambda ok, *a, **k: int(bool(ok)))
+    def cancelar_agendamento(self, data: str, pc: str, horario: str, professor: str = None) -> bool:
+        """Libera uma célula; com `professor`, só se a reserva for dele"""
+        reserva = self.indice().reservas.get((data, pc, horario))
+        if reserva is None or (professor and reserva[1] != professor):
+            return False
+        if (data, pc, horario) in self._indice.repetidas:
+            # Outra linha reserva a mesma célula: só a releitura diz como ela fica
+            excluir_registros(self.arquivo_ag, self.arquivo_xlsx, [reserva[0]])
+            self._assinatura = None
+            return True
         
-        for horario in df['horario'].unique():
-            pcs_horario = df[df['horario'] == horario]
-            horarios_agrupados[horario] = pcs_horario
+        def aplicar(_):
+            self._df = self._df.drop(reserva[0])
+            self._indice.desmarcar(data, pc, horario)
         
-        return horarios_agrupados
+        self._gravar(lambda: excluir_registros(self.arquivo_ag, self.arquivo_xlsx, [reserva[0]]), lambda _: 1, aplicar)
+        return True
+    
+    def get_horarios_disponiveis(self, data: str) -> pd.DataFrame:
+        """Retorna os horários livres de uma data"""
+        indice = self.indice()
+        livres = [(data, pc, h) for h in self.horarios for pc in indice.pcs_livres(data, h)]
+        return pd.DataFrame(livres, columns=["data", "pc", "horario"])
+    
+    def get_horarios_agendados(self, data_inicio: str = None, data_fim: str = None) -> pd.DataFrame:
+        """Retorna as reservas, opcionalmente dentro de um intervalo de datas"""
+        df = self._agendamentos()
+        if df.empty or not (data_inicio or data_fim):
+            return df
+        datas = pd.to_datetime(df["data"], format="%d/%m/%Y", errors="coerce")
+        mascara = pd.Series(True, index=df.index)
+        if data_inicio:
+            mascara &= datas >= datetime.strptime(data_inicio, "%d/%m/%Y")
+        if data_fim:
+            mascara &= datas <= datetime.strptime(data_fim, "%d/%m/%Y")
+        return df[mascara]
+    
+    def get_pcs_livres(self, data: str, horario: str) -> list:
+        """PCs livres em um horário"""
+        return self.indice().pcs_livres(data, horario)
+    
+    def get_horarios_livres(self, data: str, pc: str) -> list:
+        """Horários livres de um PC"""
+        return self.indice().horarios_livres(data, pc)
+    
+    @medido("buscar_capacidade", linhas=lambda r, *a, **k: len(r))
+    def buscar_capacidade(self, minimo: int, data_inicio: str, data_fim: str = None, adjacentes: bool = False) -> list:
+        """Slots com pelo menos `minimo` PCs livres entre as datas, com os PCs sugeridos
+
+        Slots com um bloco de PCs vizinhos livres vêm primeiro; com `adjacentes`, só eles são retornados
+        """
+        if minimo < 1:
+            raise EntradaInvalida(f"Número mínimo de PCs inválido: {minimo} (use 1 ou mais)")
+        indice = self.indice()
+        inicio = datetime.strptime(data_inicio, "%d/%m/%Y")
+        dias = (datetime.strptime(data_fim, "%d/%m/%Y") - inicio).days if data_fim else 0
+        vizinhos, espalhados = [], []
+        for d in range(dias + 1):
+            data = (inicio + timedelta(days=d)).strftime("%d/%m/%Y")
+            for horario in self.horarios:
+                livres = indice.qtd_livres(data, horario)
+                if livres < minimo:
+                    continue
+                bloco = indice.bloco_livre(data, horario, minimo)
+                if bloco:
+                    vizinhos.append({"data": data, "horario": horario, "livres": livres, "adjacentes": True, "pcs": bloco})
+                elif not adjacentes:
+                    sugestao = indice.pcs_livres(data, horario)[:minimo]
+                    espalhados.append({"data": data, "horario": horario, "livres": livres, "adjacentes": False, "pcs": sugestao})
+        return vizinhos + espalhados
+    
+    def get_horarios_agrupados(self, data: str) -> dict:
+        """Retorna, por horário, os PCs livres na data"""
+        indice = self.indice()
+        return {horario: indice.pcs_livres(data, horario) for horario in self.horarios}
+
+# Backups são guardados por conteúdo: cada versão distinta de arquivo é copiada
+# uma única vez para backup/objetos/<hash> e cada snapshot é só um manifesto JSON
+_cache_hash = {}
+_ultimo_manifesto = None
+
+def _hash_arquivo(arquivo: Path) -> str:
+    """Calcula o SHA-256 do arquivo, reaproveitando o resultado se mtime/tamanho não mudaram"""
+    st = arquivo.stat()
+    assinatura = (st.st_mtime_ns, st.st_size)
+    em_cache = _cache_hash.get(arquivo)
+    if em_cache and em_cache[0] == assinatura:
+        return em_cache[1]
+    h = hashlib.sha256()
+    with open(arquivo, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    digest = h.hexdigest()
+    _cache_hash[arquivo] = (assinatura, digest)
+    return digest
+
+def _caminho_objeto(digest: str) -> Path:
+    return DIR_BACKUP_OBJETOS / digest[:2] / digest
+
+def _guardar_objeto(arquivo: Path, digest: str):
+    destino = _caminho_objeto(digest)
+    if destino.exists():
+        return
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporario = destino.with_suffix(".tmp")
+    shutil.copy2(arquivo, temporario)
+    os.replace(temporario, destino)
+    _instrumentacao.somar_bytes("criar_backup", gravados=destino.stat().st_size)
+
+def _listar_snapshots() -> list:
+    if not DIR_BACKUP_SNAPSHOTS.exists():
+        return []
+    return sorted(DIR_BACKUP_SNAPSHOTS.glob("*.json"))
+
+def _ler_manifesto(snapshot: Path) -> dict:
+    with open(snapshot, encoding="utf-8") as f:
+        return json.load(f)
 
-def criar_backup():
-    """Cria backup dos arquivos importantes"""
+@medido("criar_backup")
+def criar_backup(avisar: bool = True):
+    """Cria backup dos arquivos importantes; `avisar=False` só relata erros"""
+    global _ultimo_manifesto
     try:
-        backup_dir = Path("backup") / datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_dir.mkdir(parents=True, exist_ok=True)
-        
-        arquivos = [ARQ_ALUNOS, ARQ_REL, ARQ_AG, ARQ_ALUNOS_XLSX, ARQ_REL_XLSX]
+        arquivos = (
+            arquivos_do_conjunto(ARQ_ALUNOS, ARQ_ALUNOS_XLSX) + arquivos_do_conjunto(ARQ_REL)
+            + [ARQ_AG, ARQ_REL_XLSX] + armazenamento().arquivos_backup()
+        )
+        conteudo = {}
         for arquivo in arquivos:
             if arquivo.exists():
-                shutil.copy2(arquivo, backup_dir / arquivo.name)
-        
-        msg(f"Backup criado em: {backup_dir}", "ok")
+                digest = _hash_arquivo(arquivo)
+                _guardar_objeto(arquivo, digest)
+                # Caminho relativo à pasta do laboratório: inclui a subpasta do mês
+                conteudo[arquivo.relative_to(DIR_LAB).as_posix()] = digest
+
+        if _ultimo_manifesto is None:
+            snapshots = _listar_snapshots()
+            _ultimo_manifesto = _ler_manifesto(snapshots[-1])["arquivos"] if snapshots else {}
+        if conteudo == _ultimo_manifesto:
+            if avisar:
+                msg("Backup já atualizado, nenhum arquivo mudou.", "ok")
+            return True
+
+        DIR_BACKUP_SNAPSHOTS.mkdir(parents=True, exist_ok=True)
+        agora = datetime.now()
+        snapshot = DIR_BACKUP_SNAPSHOTS / f"{agora.strftime('%Y%m%d_%H%M%S_%f')}.json"
+        with open(snapshot, "w", encoding="utf-8") as f:
+            json.dump({"criado_em": agora.isoformat(timespec="seconds"), "arquivos": conteudo}, f, indent=2)
+        _ultimo_manifesto = conteudo
+
+        if avisar:
+            msg(f"Backup criado em: {snapshot}", "ok")
         return True
     except Exception as e:
+        _instrumentacao.erro_engolido("criar_backup", e)
         msg(f"Erro ao criar backup: {e}", "err")
         return False
 
+class AgendadorBackup:
+    """Thread que agrupa pedidos de backup: no máximo um snapshot por INTERVALO_BACKUP
+
+    Um pedido espera ESPERA_BACKUP segundos para juntar gravações em sequência; o
+    pedido pendente ao encerrar o programa vira um último backup síncrono
+    """
+
+    def __init__(self, intervalo: float = INTERVALO_BACKUP, espera: float = ESPERA_BACKUP):
+        self.intervalo = intervalo
+        self.espera = espera
+        self._cond = threading.Condition()
+        self._pendente_desde = None
+        self._ultimo = None
+        self._executando = False
+        self._thread = None
+        self.snapshots_feitos = 0
+        self.pedidos = 0
+
+    def solicitar(self):
+        """Registra que houve uma gravação; o snapshot sai em segundo plano"""
+        with self._cond:
+            self.pedidos += 1
+            if self._pendente_desde is None:
+                self._pendente_desde = time.monotonic()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _vencimento(self) -> float:
+        vence = self._pendente_desde + self.espera
+        if self._ultimo is not None:
+            vence = max(vence, self._ultimo + self.intervalo)
+        return vence
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                while self._pendente_desde is None or time.monotonic() < self._vencimento():
+                    espera = None if self._pendente_desde is None else self._vencimento() - time.monotonic()
+                    self._cond.wait(espera)
+                self._pendente_desde = None
+                self._executando = True
+            try:
+                self._backup(avisar=False)
+            finally:
+                with self._cond:
+                    self._executando = False
+                    self._cond.notify_all()
+
+    def _backup(self, avisar: bool):
+        # Serializa com as gravações deste processo para não copiar um journal pela metade
+        with _trava_journal:
+            criar_backup(avisar=avisar)
+        with self._cond:
+            self._ultimo = time.monotonic()
+            self.snapshots_feitos += 1
+
+    def finalizar(self):
+        """Espera o snapshot em andamento e faz na hora o que ainda estiver pendente"""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._executando)
+            pendente = self._pendente_desde is not None
+            self._pendente_desde = None
+        if pendente:
+            self._backup(avisar=False)
+
+_agendador_backup = AgendadorBackup()
+
+def solicitar_backup():
+    """Pede um backup sem bloquear quem acabou de gravar"""
+    if ARMAZENAMENTO == "remoto":
+        return  # o servidor faz o backup das próprias gravações
+    _agendador_backup.solicitar()
+
+def restaurar_backup(snapshot: Path, destino: Path = None) -> list:
+    """Recria os arquivos de um snapshot a partir dos objetos guardados (padrão: na pasta do laboratório)"""
+    destino = destino or DIR_LAB
+    restaurados = []
+    for nome, digest in _ler_manifesto(snapshot)["arquivos"].items():
+        (destino / nome).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(_caminho_objeto(digest), destino / nome)
+        restaurados.append(nome)
+    return restaurados
+
+def podar_backups(retencao: dict = None, agora: datetime = None) -> tuple[int, int]:
+    """Aplica a política de retenção e remove objetos que nenhum snapshot referencia"""
+    retencao = retencao or RETENCAO_BACKUP
+    agora = agora or datetime.now()
+    limite_horario = agora - timedelta(hours=retencao["horas_horarias"])
+    limite_diario = agora - timedelta(days=retencao["dias_diarios"])
+
+    snapshots = _listar_snapshots()
+    manter = set(snapshots[-1:])  # o mais recente nunca é removido
+    vistos = set()
+    # Do mais novo para o mais antigo: o primeiro de cada hora/dia é o que fica
+    for snapshot in reversed(snapshots):
+        criado = datetime.strptime(snapshot.stem, "%Y%m%d_%H%M%S_%f")
+        if criado >= limite_horario:
+            chave = ("h", criado.strftime("%Y%m%d%H"))
+        elif criado >= limite_diario:
+            chave = ("d", criado.strftime("%Y%m%d"))
+        else:
+            continue
+        if chave not in vistos:
+            vistos.add(chave)
+            manter.add(snapshot)
+
+    removidos = 0
+    for snapshot in snapshots:
+        if snapshot not in manter:
+            snapshot.unlink()
+            removidos += 1
+
+    referenciados = set()
+    for snapshot in manter:
+        referenciados.update(_ler_manifesto(snapshot)["arquivos"].values())
+    objetos_removidos = 0
+    if DIR_BACKUP_OBJETOS.exists():
+        for objeto in DIR_BACKUP_OBJETOS.glob("*/*"):
+            if objeto.name not in referenciados:
+                objeto.unlink()
+                objetos_removidos += 1
+    return removidos, objetos_removidos
+
 def validar_pc_existente(numero_pc: str) -> bool:
     """Valida se o PC existe no laboratório"""
     try:
-        pcs_validos = [f"PC{i:02d}" for i in range(1, 21)]
         pc = f"PC{numero_pc.zfill(2)}"
-        return pc in pcs_validos
+        return pc in pcs_do_lab()
     except Exception:
         return False
 
@@ -213,12 +924,13 @@ def validar_duracao_minima(entrada: str, saida: str) -> tuple[bool, str]:
 def validar_hora_agendamento(hora_str: str, data_str: str = None) -> tuple[bool, str]:
     """Valida se o horário está dentro do expediente e não é no passado"""
     try:
+        cfg = config_lab()
         hora = datetime.strptime(hora_str, "%H:%M").time()
-        hora_min = datetime.strptime("08:00", "%H:%M").time()
-        hora_max = datetime.strptime("21:00", "%H:%M").time()
+        hora_min = datetime.strptime(cfg["abertura"], "%H:%M").time()
+        hora_max = datetime.strptime(cfg["fechamento"], "%H:%M").time()
         
         if not (hora_min <= hora <= hora_max):
-            return False, "Horário fora do expediente (08:00 - 21:00)"
+            return False, f"Horário fora do expediente ({cfg['abertura']} - {cfg['fechamento']})"
             
         if data_str:
             data_hora = datetime.strptime(f"{data_str} {hora_str}", "%d/%m/%Y %H:%M")
@@ -230,11 +942,47 @@ def validar_hora_agendamento(hora_str: str, data_str: str = None) -> tuple[bool,
         return False, "Formato de hora inválido (use HH:MM)"
 
 def limpar_tela():
-    os.system("cls" if os.name == "nt" else "clear")
+    # Sequência ANSI em vez de abrir um processo "clear" a cada tela
+    if os.name == "nt":
+        os.system("cls")
+    else:
+        print("\033[H\033[2J\033[3J", end="", flush=True)
+
+_mensagens_no_stderr = False  # no modo não interativo o stdout fica reservado aos dados
+
+_cores = None
 
 def msg(text, tipo="info"):
-    cores = {"info": Fore.CYAN, "ok": Fore.GREEN, "warn": Fore.YELLOW, "err": Fore.RED}
-    print(cores.get(tipo, Fore.CYAN) + text + Style.RESET_ALL)
+    global _cores
+    if _cores is None:
+        from colorama import Fore, Style, init
+        init(autoreset=True)
+        _cores = {"info": Fore.CYAN, "ok": Fore.GREEN, "warn": Fore.YELLOW, "err": Fore.RED, "reset": Style.RESET_ALL}
+    print(_cores.get(tipo, _cores["info"]) + text + _cores["reset"], file=sys.stderr if _mensagens_no_stderr else sys.stdout)
+
+@contextmanager
+def progresso_na_tela(rotulo: str):
+    """Callback `progresso(linhas)` que reescreve uma linha com a contagem e a taxa
+
+    Fora de um terminal (saída redirecionada, scripts) entrega None e não mostra nada
+    """
+    saida = sys.stderr if _mensagens_no_stderr else sys.stdout
+    if not saida.isatty():
+        yield None
+        return
+    inicio = time.perf_counter()
+    ultima = [0.0]
+
+    def mostrar(linhas: int):
+        agora = time.perf_counter()
+        if agora - ultima[0] >= 0.2:
+            ultima[0] = agora
+            print(f"\r{rotulo}: {linhas} linha(s), {linhas / (agora - inicio):.0f}/s", end="", file=saida, flush=True)
+    try:
+        yield mostrar
+    finally:
+        if ultima[0]:
+            print(file=saida)
 
 def pedir_validado(prompt, func):
     while True:
@@ -253,6 +1001,19 @@ def validar_numero(texto: str):
         return texto
     return None
 
+def expandir_pcs(texto: str) -> list:
+    """Lista de PCs a partir de "01,02,05-10" (aceita o prefixo PC); ValueError se algum não existir"""
+    pcs = []
+    for parte in texto.upper().replace("PC", "").split(","):
+        inicio, _, fim = parte.strip().partition("-")
+        if not validar_numero(inicio) or (fim and not validar_numero(fim.strip())):
+            raise EntradaInvalida(f"PCs inválidos: {texto}")
+        for numero in range(int(inicio), int(fim or inicio) + 1):
+            if not validar_pc_existente(str(numero)):
+                raise EntradaInvalida(f"PC{numero:02d} não existe no laboratório.")
+            pcs.append(f"PC{numero:02d}")
+    return list(dict.fromkeys(pcs))
+
 def validar_data(data_str: str):
     try:
         d = datetime.strptime(data_str, "%d/%m/%Y")
@@ -273,48 +1034,2727 @@ def confirmar_sn(mensagem: str):
         if r in ("s", "n"):
             return r
 
+def calcular_duracao(data_str: str, entrada_str: str, saida_str: str) -> str:
+    try:
+        data = datetime.strptime(data_str, "%d/%m/%Y")
+        entrada = datetime.strptime(entrada_str, "%H:%M").time()
+        saida = datetime.strptime(saida_str, "%H:%M").time()
+        dt_entrada = datetime.combine(data.date(), entrada)
+        dt_saida = datetime.combine(data.date(), saida)
+        if dt_saida < dt_entrada:
+            dt_saida += timedelta(days=1)
+        delta = dt_saida - dt_entrada
+        horas = int(delta.total_seconds() // 3600)
+        minutos = int((delta.total_seconds() % 3600) // 60)
+        return f"{horas:02d}:{minutos:02d}"
+    except Exception:
+        return ""
+
+@medido("carregar", linhas=lambda df, *a, **k: len(df), bytes_lidos=lambda df, path, *a, **k: _bytes_dataset(path))
+def carregar_dataframe(path: Path, cols=None):
+    return armazenamento().carregar(path, cols)
+
+@medido("salvar", linhas=lambda r, df, *a, **k: len(df), bytes_gravados=lambda r, df, csv_path, *a, **k: _bytes_dataset(csv_path))
 def salvar_csv_xlsx(df: pd.DataFrame, csv_path: Path, xlsx_path: Path):
-    df.to_csv(csv_path, index=False)
+    armazenamento().salvar(df, csv_path, xlsx_path)
+
+@medido("inserir", linhas=lambda *a, **k: 1)
+def inserir_registro(registro: dict, csv_path: Path, xlsx_path: Path, cols: list) -> int:
+    """Inclui um único registro no conjunto de dados; retorna o ID atribuído"""
+    return armazenamento().inserir([registro], csv_path, xlsx_path, cols)[0]
+
+@medido("inserir", linhas=lambda r, registros, *a, **k: len(registros))
+def inserir_registros(registros: list, csv_path: Path, xlsx_path: Path, cols: list) -> list:
+    """Inclui vários registros numa única gravação; retorna os IDs atribuídos"""
+    if not registros:
+        return []
+    return armazenamento().inserir(registros, csv_path, xlsx_path, cols)
+
+@medido("atualizar", linhas=lambda r, csv_path, xlsx_path, alteracoes, *a, **k: len(alteracoes))
+def atualizar_registros(csv_path: Path, xlsx_path: Path, alteracoes: dict, visao: pd.DataFrame = None):
+    """Aplica {índice: {coluna: valor}}; `visao` é o DataFrame completo já alterado, se houver"""
+    armazenamento().atualizar(csv_path, xlsx_path, alteracoes, visao)
+
+@medido("reservar", linhas=lambda r, *a, **k: len(r))
+def reservar_registros(csv_path: Path, xlsx_path: Path, alteracoes: dict, esperado: dict) -> list:
+    """Aplica cada alteração só se a linha ainda tiver os valores `esperado`; retorna os índices aplicados"""
+    return armazenamento().atualizar_se(csv_path, xlsx_path, alteracoes, esperado)
+
+@medido("inserir_unicos", linhas=lambda r, *a, **k: len(r))
+def inserir_registros_unicos(registros: list, csv_path: Path, xlsx_path: Path, cols: list, chave: list,
+                             tudo_ou_nada: bool = False) -> list:
+    """Inclui os registros cuja chave ainda não existe; retorna os que foram incluídos, com o ID em "id"
+
+    Com `tudo_ou_nada`, uma única chave repetida faz com que nada seja gravado
+    """
+    return armazenamento().inserir_unicos(registros, csv_path, xlsx_path, cols, chave, tudo_ou_nada)
+
+@medido("excluir", linhas=lambda r, csv_path, xlsx_path, indices, *a, **k: len(indices))
+def excluir_registros(csv_path: Path, xlsx_path: Path, indices: list):
+    armazenamento().excluir(csv_path, xlsx_path, indices)
+
+@medido("consultar", linhas=lambda r, *a, **k: len(r[0]), bytes_lidos=lambda r, csv_path, *a, **k: _bytes_dataset(csv_path))
+def consultar_registros(csv_path: Path, filtros: dict = None, pagina: int = 0, tamanho: int = TAMANHO_PAGINA) -> tuple[pd.DataFrame, int]:
+    """Retorna uma página de registros filtrados e o total de registros que casam com o filtro
+
+    Filtros aceitos: pc, pcs (lista), nome (prefixo), professor, data_inicio e data_fim (DD/MM/AAAA) e ids
+    """
+    return armazenamento().consultar(csv_path, filtros or {}, pagina * tamanho, tamanho)
+
+@medido("buscar")
+def buscar_registro(csv_path: Path, id_registro: int):
+    """Registro com o ID informado, ou None"""
+    return armazenamento().buscar(csv_path, id_registro)
+
+@medido("exportar_filtrado", linhas=lambda r, *a, **k: r,
+        bytes_gravados=lambda r, csv_path, filtros, destino, *a, **k: _tamanho_em_disco(Path(destino)))
+def exportar_filtrado(csv_path: Path, filtros: dict, destino: Path, cols: list, progresso=None) -> int:
+    """Grava em `destino` (.csv ou .xlsx) os registros que casam com o filtro e retorna quantos foram
+
+    Os registros vêm do armazenamento em blocos e vão direto para o arquivo (CSV por blocos,
+    XLSX no modo write-only do openpyxl), então a memória não cresce com o tamanho da
+    exportação. `progresso(linhas)` é chamado depois de cada bloco
+    """
+    destino = Path(destino)
+    formato = destino.suffix.lower()
+    if formato not in (".csv", ".xlsx"):
+        raise EntradaInvalida(f"Formato de exportação não suportado: {destino.name} (use .csv ou .xlsx)")
+    temporario = _temporario(destino)
+    linhas = 0
+    try:
+        with closing(armazenamento().iterar(csv_path, filtros)) as blocos:
+            if formato == ".csv":
+                with open(temporario, "w", newline="", encoding="utf-8") as f:
+                    csv.writer(f, lineterminator="\n").writerow(["id", *cols])
+                    for bloco in blocos:
+                        bloco.reindex(columns=cols).to_csv(f, header=False, lineterminator="\n")
+                        linhas += len(bloco)
+                        if progresso is not None:
+                            progresso(linhas)
+            else:
+                import openpyxl
+                from openpyxl.cell import WriteOnlyCell
+                from openpyxl.styles import Font, Alignment
+                wb = openpyxl.Workbook(write_only=True)
+                ws = wb.create_sheet(csv_path.stem)
+                cabecalho = []
+                for nome in ["id", *cols]:
+                    celula = WriteOnlyCell(ws, value=nome)
+                    celula.font = Font(bold=True)
+                    celula.alignment = Alignment(horizontal="center")
+                    cabecalho.append(celula)
+                ws.append(cabecalho)
+                try:
+                    for bloco in blocos:
+                        if linhas + len(bloco) >= LINHAS_MAX_XLSX:
+                            raise EntradaInvalida(f"Mais de {LINHAS_MAX_XLSX - 1} linhas não cabem numa planilha; exporte para .csv")
+                        bloco = bloco.reindex(columns=cols).astype(object)
+                        for linha in bloco.where(bloco.notna(), None).itertuples(name=None):
+                            ws.append([int(linha[0]), *linha[1:]])
+                        linhas += len(bloco)
+                        if progresso is not None:
+                            progresso(linhas)
+                except BaseException:
+                    # Fecha o arquivo temporário em que o openpyxl vinha escrevendo as linhas
+                    ws.close()
+                    raise
+                wb.save(temporario)
+        os.replace(temporario, destino)
+    finally:
+        temporario.unlink(missing_ok=True)
+    return linhas
+
+def _mascara_filtros(df: pd.DataFrame, filtros: dict) -> pd.Series:
+    mascara = pd.Series(True, index=df.index)
+    if filtros.get("ids") is not None:
+        mascara &= df.index.isin(filtros["ids"])
+    if filtros.get("pc"):
+        mascara &= df["pc"] == filtros["pc"]
+    if filtros.get("pcs"):
+        mascara &= df["pc"].isin(filtros["pcs"])
+    if filtros.get("nome"):
+        mascara &= df["nome"].str.lower().str.startswith(filtros["nome"].lower(), na=False)
+    if filtros.get("professor"):
+        mascara &= df["professor"].str.lower() == filtros["professor"].lower()
+    if filtros.get("data_inicio") or filtros.get("data_fim"):
+        datas = pd.to_datetime(df["data"], format="%d/%m/%Y", errors="coerce")
+        if filtros.get("data_inicio"):
+            mascara &= datas >= datetime.strptime(filtros["data_inicio"], "%d/%m/%Y")
+        if filtros.get("data_fim"):
+            mascara &= datas <= datetime.strptime(filtros["data_fim"], "%d/%m/%Y")
+    return mascara
+
+@medido("limpar")
+def limpar_dataset(csv_path: Path, xlsx_path: Path):
+    """Apaga todos os registros do conjunto de dados e suas exportações"""
+    armazenamento().limpar(csv_path, xlsx_path)
+
+def dataset_existe(csv_path: Path) -> bool:
+    return armazenamento().existe(csv_path)
+
+def assinatura_dataset(csv_path: Path):
+    """Versão atual do conjunto de dados, usada para invalidar caches"""
+    return armazenamento().assinatura(csv_path)
+
+# Esquema tipado: PCs e professores como categorias, datas como datas, horários
+# e durações em minutos inteiros. O snapshot CSV convertido fica num cache colunar
+# (<nome>.cache.npz) que é relido sem parsing enquanto o CSV não mudar
+# "Disponível" é o status das células vagas da grade antiga; fora do enum viraria NaN
+STATUS_AGENDAMENTO = ("Agendado", "Disponível", "Livre")
+ESQUEMAS = {
+    "alunos": {"pc": "categoria", "nome": "texto", "data": "data", "entrada": "minutos", "saida": "minutos", "duracao": "minutos"},
+    "relatorios": {"professor": "categoria", "relatorio": "texto", "usuario": "categoria"},
+    "agendamentos": {"data": "data", "pc": "categoria", "horario": "categoria", "professor": "categoria", "status": "status"},
+}
+
+def _caminho_cache_tipado(csv_path: Path) -> Path:
+    return csv_path.with_name(f"{csv_path.stem}.cache.npz")
+
+def _minutos_do_dia(valores: pd.Series) -> pd.Series:
+    hora = pd.to_datetime(valores.str.slice(0, 5), format="%H:%M", errors="coerce")
+    return (hora.dt.hour * 60 + hora.dt.minute).astype("Int16")
+
+CONVERSORES_TIPADOS = {
+    "categoria": lambda valores: valores.astype("category"),
+    "status": lambda valores: pd.Series(pd.Categorical(valores, categories=STATUS_AGENDAMENTO)),
+    "data": lambda valores: pd.to_datetime(valores, format="%d/%m/%Y", errors="coerce"),
+    "minutos": _minutos_do_dia,
+    "texto": lambda valores: valores.astype("string"),
+}
+
+def tipar(df: pd.DataFrame, tabela: str) -> pd.DataFrame:
+    """Converte as colunas de texto de um conjunto para o esquema tipado
+
+    Cada coluna é convertida só nos seus valores distintos (datas, horários e PCs
+    se repetem muito) e depois expandida pelos códigos
+    """
+    tipado = pd.DataFrame(index=df.index)
+    for coluna, tipo in ESQUEMAS[tabela].items():
+        valores = df[coluna] if coluna in df.columns else pd.Series(None, index=df.index, dtype=object)
+        codigos, unicos = pd.factorize(valores)
+        convertidos = CONVERSORES_TIPADOS[tipo](pd.Series(unicos, dtype=object).str.strip())
+        # O código -1 (valor ausente) não existe nos rótulos e vira nulo
+        coluna_tipada = convertidos.reset_index(drop=True).reindex(codigos)
+        coluna_tipada.index = df.index
+        tipado[coluna] = coluna_tipada
+    return tipado
+
+def _textos_para_colunas(colunas: dict, chave: str, valores):
+    """Textos como um bloco de bytes UTF-8 mais os fins de cada valor, sem objetos Python no arquivo"""
+    import numpy as np
+    nulos = np.asarray(pd.isna(valores), dtype=bool)
+    codificados = [b"" if nulo else str(valor).encode("utf-8") for valor, nulo in zip(valores, nulos)]
+    colunas[f"{chave}:bytes"] = np.frombuffer(b"".join(codificados), dtype=np.uint8)
+    colunas[f"{chave}:fins"] = np.cumsum([len(c) for c in codificados], dtype=np.int64)
+    colunas[f"{chave}:nulos"] = nulos
+
+def _textos_das_colunas(colunas, chave: str) -> list:
+    dados = colunas[f"{chave}:bytes"].tobytes()
+    fins = colunas[f"{chave}:fins"].tolist()
+    return [None if nulo else dados[inicio:fim].decode("utf-8")
+            for inicio, fim, nulo in zip([0] + fins[:-1], fins, colunas[f"{chave}:nulos"].tolist())]
+
+def _gravar_cache_tipado(df: pd.DataFrame, tabela: str, cache: Path, versao: tuple):
+    """Grava o conjunto tipado coluna a coluna: códigos das categorias, datas e minutos como inteiros"""
+    import numpy as np
+    colunas = {"versao_csv": np.array(versao, dtype=np.int64), "id": df.index.to_numpy(dtype=np.int64)}
+    for coluna, tipo in ESQUEMAS[tabela].items():
+        if tipo in ("categoria", "status"):
+            colunas[f"{coluna}:codigos"] = df[coluna].cat.codes.to_numpy()
+            _textos_para_colunas(colunas, f"{coluna}:categorias", df[coluna].cat.categories)
+        elif tipo == "data":
+            colunas[coluna] = df[coluna].to_numpy()
+        elif tipo == "minutos":
+            # Minuto do dia nunca é negativo: -1 marca o valor ausente
+            colunas[coluna] = df[coluna].fillna(-1).to_numpy(dtype=np.int16)
+        else:
+            _textos_para_colunas(colunas, coluna, df[coluna])
+    temporario = _temporario(cache)
+    with open(temporario, "wb") as f:
+        np.savez(f, **colunas)
+    os.replace(temporario, cache)
+
+def _ler_cache_tipado(cache: Path, tabela: str, versao: tuple):
+    """Conjunto tipado do cache, ou None se ele é de outra versão do CSV"""
+    import numpy as np
+    # Sem pickle: um cache gravado por outro terminal não consegue executar código aqui
+    with np.load(cache, allow_pickle=False) as colunas:
+        if tuple(colunas["versao_csv"].tolist()) != versao:
+            return None
+        df = pd.DataFrame(index=pd.Index(colunas["id"], dtype="int64"))
+        for coluna, tipo in ESQUEMAS[tabela].items():
+            if tipo in ("categoria", "status"):
+                categorias = pd.Index(_textos_das_colunas(colunas, f"{coluna}:categorias"))
+                df[coluna] = pd.Categorical.from_codes(colunas[f"{coluna}:codigos"], categories=categorias)
+            elif tipo == "data":
+                df[coluna] = colunas[coluna]
+            elif tipo == "minutos":
+                minutos = colunas[coluna]
+                df[coluna] = pd.arrays.IntegerArray(minutos, minutos < 0)
+            else:
+                df[coluna] = pd.array(_textos_das_colunas(colunas, coluna), dtype="string")
+    return df
+
+def _snapshot_tipado(csv_path: Path, tabela: str) -> pd.DataFrame:
+    """Snapshot CSV já tipado, do cache colunar quando ele corresponde ao arquivo atual"""
+    st = csv_path.stat()
+    versao = (st.st_mtime_ns, st.st_size)
+    cache = _caminho_cache_tipado(csv_path)
+    if cache.exists():
+        try:
+            guardado = _ler_cache_tipado(cache, tabela, versao)
+            if guardado is not None:
+                return guardado
+        except Exception as e:
+            _instrumentacao.erro_engolido("carregar_tipado", e)
+    df = tipar(ArmazenamentoCSV._com_ids(pd.read_csv(csv_path, dtype=str)), tabela)
+    try:
+        _gravar_cache_tipado(df, tabela, cache, versao)
+    except OSError as e:
+        _instrumentacao.erro_engolido("carregar_tipado", e)
+    return df
+
+def _partes_tipadas(csv_path: Path, tabela: str) -> list:
+    """Snapshot tipado e journal convertido de um arquivo; quem chama segura _trava_journal"""
+    journal = caminho_journal(csv_path)
+
+    def ler():
+        partes = []
+        if csv_path.exists() and csv_path.stat().st_size > 0:
+            partes.append(_snapshot_tipado(csv_path, tabela))
+        if journal.exists() and journal.stat().st_size > 0:
+            pendentes = ArmazenamentoCSV._com_ids(pd.read_csv(journal, dtype=str), sum(len(p) for p in partes))
+            partes.append(tipar(pendentes, tabela))
+        return _sem_ja_compactados(partes)
+    return _ler_consistente(csv_path, ler)
+
+@medido("carregar_tipado", linhas=lambda df, *a, **k: len(df))
+def carregar_tipado(csv_path: Path) -> pd.DataFrame:
+    """Carrega o conjunto no esquema tipado; no backend CSV, só o journal pendente é convertido
+
+    Num conjunto particionado, cada mês tem seu próprio cache e os meses são lidos em paralelo
+    """
+    tabela = csv_path.stem
+    if ARMAZENAMENTO != "csv":
+        return tipar(carregar_dataframe(csv_path), tabela)
+    with _trava_journal:
+        lidas = _em_paralelo(lambda parte: _partes_tipadas(parte, tabela), partes_do_conjunto(csv_path))
+    partes = [parte for partes_arquivo in lidas for parte in partes_arquivo]
+    if not partes:
+        return tipar(pd.DataFrame(columns=list(ESQUEMAS[tabela])), tabela)
+    if len(partes) == 1:
+        return partes[0]
+    df = pd.concat(partes)
+    # concat de categorias diferentes vira texto: reaplica as categorias
+    for coluna, tipo in ESQUEMAS[tabela].items():
+        if tipo == "categoria":
+            df[coluna] = df[coluna].astype("category")
+        elif tipo == "status":
+            df[coluna] = pd.Categorical(df[coluna], categories=STATUS_AGENDAMENTO)
+    return df
+
+_travas_mantidas = threading.local()
+# Travas que este processo segura; uma thread renova o mtime delas para que terminais
+# de outras máquinas (pasta compartilhada) não as tomem como abandonadas
+_travas_do_processo = set()
+_renovador_travas = None
+_DONO_TRAVA = f"{os.getpid()}@{platform.node()}"
+
+def _processo_vivo(pid: int) -> bool:
+    if os.name == "nt":
+        # No Windows, os.kill(pid, 0) mandaria um CTRL+C ao processo
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        processo = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not processo:
+            return kernel32.GetLastError() == 5  # acesso negado: existe, mas é de outro usuário
+        codigo = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(processo, ctypes.byref(codigo))
+        kernel32.CloseHandle(processo)
+        return codigo.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _trava_abandonada(trava: Path, expira: float) -> bool:
+    """Se quem criou a trava morreu; de outra máquina, se ela parou de ser renovada há `expira` segundos"""
+    dono = trava.read_text(encoding="utf-8")
+    pid, _, maquina = dono.partition("@")
+    if maquina == platform.node() and pid.isdigit():
+        return int(pid) != os.getpid() and not _processo_vivo(int(pid))
+    # Dono em outra máquina ou arquivo ainda sem dono (o criador caiu logo após criá-lo)
+    return time.time() - trava.stat().st_mtime > expira
+
+def _tomar_trava_abandonada(trava: Path, expira: float) -> bool:
+    """Remove a trava se ela estiver abandonada; retorna se removeu
+
+    Dois terminais podem julgar a mesma trava abandonada ao mesmo tempo, e o segundo
+    apagaria a trava nova do primeiro. Por isso a decisão é refeita sob uma segunda trava
+    exclusiva (.roubo), e só o arquivo julgado (mesmo inode) sai do lugar
+    """
+    roubo = trava.with_name(trava.name + ".roubo")
+    try:
+        os.close(os.open(roubo, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        # A .roubo só dura alguns microssegundos; antiga assim, quem tomava a trava caiu no meio
+        try:
+            if time.time() - roubo.stat().st_mtime > expira:
+                roubo.unlink()
+        except FileNotFoundError:
+            pass
+        return False
+    try:
+        julgada = trava.stat()
+        if not _trava_abandonada(trava, expira):
+            return False
+        removida = trava.with_name(f"{trava.name}.{os.getpid()}.{threading.get_ident()}.removida")
+        os.replace(trava, removida)
+        try:
+            if removida.stat().st_ino != julgada.st_ino:
+                # O dono soltou e outro terminal travou entre a decisão e a troca: devolve a trava dele
+                try:
+                    os.link(removida, trava)
+                except FileExistsError:
+                    pass
+                return False
+            return True
+        finally:
+            removida.unlink()
+    finally:
+        roubo.unlink()
+
+def _renovar_travas():
+    while True:
+        time.sleep(5)
+        for trava in list(_travas_do_processo):
+            try:
+                os.utime(trava)
+            except FileNotFoundError:
+                pass
+
+@contextmanager
+def trava_arquivo(path: Path, timeout: float = 10.0, expira: float = 30.0):
+    """Trava entre processos/terminais por meio de um arquivo .lock criado de forma exclusiva
+
+    É reentrante na mesma thread, então operações compostas podem aninhar a trava.
+    O arquivo guarda "pid@máquina" do dono: a trava só é tomada de um processo que
+    não existe mais, ou de outra máquina que deixou de renová-la por `expira` segundos
+    """
+    trava = path.with_name(path.name + ".lock")
+    mantidas = _travas_mantidas.__dict__.setdefault("contagem", defaultdict(int))
+    if mantidas[trava]:
+        mantidas[trava] += 1
+        try:
+            yield
+        finally:
+            mantidas[trava] -= 1
+        return
+    global _renovador_travas
+    limite = time.monotonic() + timeout
+    espera = 0.005
+    while True:
+        try:
+            fd = os.open(trava, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, _DONO_TRAVA.encode("utf-8"))
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                # Trava abandonada por um terminal que caiu
+                if _tomar_trava_abandonada(trava, expira):
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > limite:
+                raise TimeoutError(f"Arquivo {path} travado por outro terminal")
+            time.sleep(espera)
+            espera = min(espera * 2, 0.1)
+    mantidas[trava] = 1
+    _travas_do_processo.add(trava)
+    if _renovador_travas is None:
+        _renovador_travas = threading.Thread(target=_renovar_travas, daemon=True, name="renovador-travas")
+        _renovador_travas.start()
     try:
-        df.to_excel(xlsx_path, index=False)
+        yield
+    finally:
+        mantidas[trava] = 0
+        _travas_do_processo.discard(trava)
+        try:
+            trava.unlink()
+        except FileNotFoundError:
+            pass
+
+def _versoes(*arquivos: Path) -> tuple:
+    versoes = []
+    for arq in arquivos:
         try:
-            wb = load_workbook(xlsx_path)
-            ws = wb.active
+            st = arq.stat()
+            versoes.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            versoes.append(None)
+    return tuple(versoes)
+
+def _sem_ja_compactados(partes: list) -> list:
+    """[snapshot, journal] sem as linhas do journal que o snapshot já tem
+
+    Quem compacta troca o snapshot e só depois apaga o journal; quem lê nesse
+    intervalo veria essas linhas duas vezes. Os IDs são estáveis, então o snapshot vale
+    """
+    if len(partes) == 2 and partes[0].index.isin(partes[1].index).any():
+        partes[1] = partes[1][~partes[1].index.isin(partes[0].index)]
+    return partes
+
+def _ler_consistente(csv_path: Path, ler):
+    """Executa `ler()` sem trava e, se o snapshot ou o journal mudou no meio, repete com a trava do arquivo
+
+    Entre as duas leituras outro terminal pode compactar (snapshot novo, journal apagado)
+    ou estar no meio de uma linha do journal. Leitores não disputam a trava entre si nem
+    com quem grava, a não ser quando a corrida acontece de fato
+    """
+    arquivos = (csv_path, caminho_journal(csv_path))
+    antes = _versoes(*arquivos)
+    try:
+        resultado = ler()
+    except Exception:
+        if _versoes(*arquivos) == antes:
+            raise
+    else:
+        if _versoes(*arquivos) == antes:
+            return resultado
+    with trava_arquivo(csv_path):
+        return ler()
+
+def _trava_conjunto(csv_path: Path):
+    """Trava que operações compostas seguram sobre um conjunto (ex.: gravar e atualizar um derivado)
+
+    No modo remoto os arquivos do conjunto são do servidor, que já serializa as
+    gravações; os terminais que dividem a pasta só se coordenam entre si
+    """
+    if ARMAZENAMENTO == "remoto":
+        return trava_arquivo(csv_path.with_name(f".{csv_path.stem}.cliente"))
+    return trava_arquivo(csv_path)
+
+def _temporario(path: Path) -> Path:
+    """Arquivo temporário exclusivo deste processo, trocado depois com os.replace"""
+    return path.with_name(f".{path.stem}.{os.getpid()}.{threading.get_ident()}{path.suffix}")
+
+@medido("exportar_xlsx", linhas=lambda r, df, *a, **k: len(df), bytes_gravados=lambda r, df, xlsx_path, *a, **k: _tamanho_em_disco(xlsx_path))
+def exportar_xlsx(df: pd.DataFrame, xlsx_path: Path):
+    """Gera o XLSX com cabeçalho formatado numa única gravação"""
+    from openpyxl.styles import Font, Alignment
+    temporario = _temporario(xlsx_path)
+    try:
+        with pd.ExcelWriter(temporario, engine="openpyxl") as writer:
+            df.to_excel(writer, index=False)
+            ws = next(iter(writer.sheets.values()))
             header_font = Font(bold=True)
-            for cell in next(ws.iter_rows(min_row=1, max_row=1)):
+            for cell in ws[1]:
                 cell.font = header_font
                 cell.alignment = Alignment(horizontal="center")
-            wb.save(xlsx_path)
-        except Exception:
+        os.replace(temporario, xlsx_path)
+    except Exception as e:
+        _instrumentacao.erro_engolido("exportar_xlsx", e)
+        try:
+            temporario.unlink()
+        except FileNotFoundError:
             pass
-    except Exception:
-        df.to_csv(csv_path, index=False)
 
-def calcular_duracao(data_str: str, entrada_str: str, saida_str: str) -> str:
-    try:
-        data = datetime.strptime(data_str, "%d/%m/%Y")
-        entrada = datetime.strptime(entrada_str, "%H:%M").time()
-        saida = datetime.strptime(saida_str, "%H:%M").time()
-        dt_entrada = datetime.combine(data.date(), entrada)
-        dt_saida = datetime.combine(data.date(), saida)
-        if dt_saida < dt_entrada:
-            dt_saida += timedelta(days=1)
-        delta = dt_saida - dt_entrada
-        horas = int(delta.total_seconds() // 3600)
-        minutos = int((delta.total_seconds() % 3600) // 60)
-        return f"{horas:02d}:{minutos:02d}"
-    except Exception:
-        return ""
+def _exportar(fonte, xlsx_path: Path, csv_path: Path = None):
+    df = fonte() if callable(fonte) else fonte
+    if csv_path is not None:
+        # O processo pode encerrar no meio (com --sem-xlsx ninguém espera): nunca deixa o CSV pela metade
+        temporario = _temporario(csv_path)
+        df.to_csv(temporario, index=False)
+        os.replace(temporario, csv_path)
+    exportar_xlsx(df, xlsx_path)
+
+def agendar_exportacao(fonte, xlsx_path: Path, csv_path: Path = None):
+    """Exporta em segundo plano ou na hora, conforme XLSX_EM_SEGUNDO_PLANO"""
+    if XLSX_EM_SEGUNDO_PLANO:
+        _exportador_xlsx.agendar(fonte, xlsx_path, csv_path)
+    else:
+        _exportar(fonte, xlsx_path, csv_path)
+
+class ExportadorXLSX:
+    """Thread que gera as exportações em segundo plano, mantendo só a versão mais recente de cada arquivo"""
+    
+    def __init__(self):
+        self._pendentes = {}
+        self._em_andamento = 0
+        self._cond = threading.Condition()
+        self._thread = None
+    
+    def agendar(self, fonte, xlsx_path: Path, csv_path: Path = None):
+        """Enfileira a exportação; `fonte` é um DataFrame ou uma função que o carrega"""
+        with self._cond:
+            # Um salvamento ainda não exportado é simplesmente substituído pelo novo
+            self._pendentes[xlsx_path] = (fonte, csv_path)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+    
+    def _executar(self):
+        while True:
+            with self._cond:
+                while not self._pendentes:
+                    self._cond.wait()
+                xlsx_path, (fonte, csv_path) = self._pendentes.popitem()
+                self._em_andamento += 1
+            try:
+                _exportar(fonte, xlsx_path, csv_path)
+            finally:
+                with self._cond:
+                    self._em_andamento -= 1
+                    self._cond.notify_all()
+    
+    def aguardar(self, timeout: float = None) -> bool:
+        """Bloqueia até todas as exportações pendentes terminarem"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pendentes and not self._em_andamento, timeout)
+
+_exportador_xlsx = ExportadorXLSX()
+
+class ArmazenamentoCSV:
+    """Armazenamento em arquivos CSV, com journal de inclusões e XLSX exportado"""
+    
+    @staticmethod
+    def _com_ids(df: pd.DataFrame, deslocamento: int = 0) -> pd.DataFrame:
+        """Usa a coluna id como índice; arquivos antigos sem id recebem a posição da linha"""
+        if "id" in df.columns:
+            df = df.set_index("id")
+            df.index = df.index.astype("int64")
+            df.index.name = None
+        else:
+            df.index = pd.RangeIndex(deslocamento, deslocamento + len(df))
+        return df
+    
+    def carregar(self, path: Path, cols=None) -> pd.DataFrame:
+        with _trava_journal:
+            return self._ler(path, cols)
+    
+    def _ler(self, path: Path, cols=None) -> pd.DataFrame:
+        """Snapshot + journal sem pegar _trava_journal (quem chama já a segura)
+
+        Erros de leitura sobem: um conjunto vazio aqui acabaria em cache ou gravado por cima dos dados
+        """
+        journal = caminho_journal(path)
+        if not path.exists() and not journal.exists():
+            if cols:
+                return pd.DataFrame(columns=cols)
+            return pd.DataFrame()
+
+        def ler():
+            partes = []
+            for p in (path, journal):
+                if p.exists() and p.stat().st_size > 0:
+                    partes.append(self._com_ids(pd.read_csv(p), sum(len(parte) for parte in partes)))
+            return _sem_ja_compactados(partes)
+        partes = _ler_consistente(path, ler)
+        if not partes:
+            return pd.DataFrame(columns=cols) if cols else pd.DataFrame()
+        if len(partes) == 1:
+            return partes[0]
+        return pd.concat(partes)
+    
+    def _blocos(self, path: Path):
+        """Lê snapshot e journal em blocos de TAMANHO_BLOCO linhas"""
+        lidas = 0
+        for p in (path, caminho_journal(path)):
+            if not p.exists() or p.stat().st_size == 0:
+                continue
+            for bloco in pd.read_csv(p, chunksize=TAMANHO_BLOCO, dtype=str):
+                yield self._com_ids(bloco, lidas)
+                lidas += len(bloco)
+    
+    def consultar(self, path: Path, filtros: dict, inicio: int, limite: int) -> tuple[pd.DataFrame, int]:
+        # Só as linhas da página pedida ficam em memória; as demais são apenas contadas
+        pagina = []
+        total = 0
+        vazia = pd.DataFrame()
+        with _trava_journal:
+            for bloco in self._blocos(path):
+                bloco = bloco[_mascara_filtros(bloco, filtros)]
+                if not len(vazia.columns):
+                    # Página vazia mantém as colunas, como no SQLite
+                    vazia = bloco.iloc[:0]
+                de, ate = max(inicio - total, 0), inicio + limite - total
+                if de < len(bloco) and ate > 0:
+                    pagina.append(bloco.iloc[de:ate])
+                total += len(bloco)
+        return (pd.concat(pagina) if pagina else vazia), total
+    
+    def iterar(self, path: Path, filtros: dict):
+        """Registros que casam com o filtro, em blocos de até TAMANHO_BLOCO linhas"""
+        with _trava_journal:
+            for bloco in self._blocos(path):
+                bloco = bloco[_mascara_filtros(bloco, filtros)]
+                if len(bloco):
+                    yield bloco
+    
+    def _filtrar(self, path: Path, filtros: dict, maximo: int) -> tuple[int, pd.DataFrame]:
+        """Conta as linhas que casam com o filtro e guarda só as `maximo` primeiras (sem travar)"""
+        guardadas = []
+        total = 0
+        for bloco in self._blocos(path):
+            bloco = bloco[_mascara_filtros(bloco, filtros)]
+            if total < maximo:
+                guardadas.append(bloco.iloc[:maximo - total])
+            total += len(bloco)
+        return total, (pd.concat(guardadas) if guardadas else pd.DataFrame())
+    
+    def _linhas(self, path: Path):
+        """Percorre snapshot e journal com o módulo csv, sem pandas: (id, registro)"""
+        lidas = 0
+        for p in (path, caminho_journal(path)):
+            if not p.exists() or p.stat().st_size == 0:
+                continue
+            with open(p, newline="", encoding="utf-8") as f:
+                for linha in csv.DictReader(f):
+                    id_linha = linha.pop("id", None)
+                    yield (int(id_linha) if id_linha not in (None, "") else lidas), linha
+                    lidas += 1
+    
+    def _pequeno(self, path: Path) -> bool:
+        tamanho = 0
+        for p in (path, caminho_journal(path)):
+            if p.exists():
+                tamanho += p.stat().st_size
+        return tamanho <= LIMITE_LEITURA_RAPIDA
+    
+    def buscar(self, path: Path, id_registro: int):
+        with _trava_journal:
+            if self._pequeno(path):
+                return next((linha for id_linha, linha in self._linhas(path) if id_linha == id_registro), None)
+            for bloco in self._blocos(path):
+                if id_registro in bloco.index:
+                    return bloco.loc[id_registro]
+        return None
+    
+    def salvar(self, df: pd.DataFrame, csv_path: Path, xlsx_path: Path):
+        # O CSV é a fonte de verdade e é gravado de forma síncrona; a troca
+        # atômica evita que outro terminal leia um arquivo pela metade
+        with _trava_journal, trava_arquivo(csv_path):
+            temporario = _temporario(csv_path)
+            df.to_csv(temporario, index=True, index_label="id")
+            os.replace(temporario, csv_path)
+            # O DataFrame salvo já é a visão completa: o journal pendente foi absorvido
+            _descartar_journal(csv_path)
+            if len(df):
+                _acompanhar_sequencia(csv_path, int(df.index.max()))
+        agendar_exportacao(df.copy(), xlsx_path)
+    
+    def inserir(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list) -> list:
+        return anexar_registros(registros, csv_path, xlsx_path, cols)
+    
+    @staticmethod
+    def _aplicar(df: pd.DataFrame, alteracoes: dict, esperado: dict = None) -> list:
+        """Aplica {índice: {coluna: valor}} no DataFrame; com `esperado`, só nas linhas que o satisfazem"""
+        aplicados = []
+        for idx, campos in alteracoes.items():
+            if esperado is not None and (idx not in df.index or any(df.loc[idx, c] != v for c, v in esperado.items())):
+                continue
+            for coluna, valor in campos.items():
+                df.loc[idx, coluna] = valor
+            aplicados.append(idx)
+        return aplicados
+    
+    def atualizar(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, visao: pd.DataFrame = None):
+        with _trava_journal, trava_arquivo(csv_path):
+            if visao is None:
+                visao = self.carregar(csv_path)
+                self._aplicar(visao, alteracoes)
+            self.salvar(visao, csv_path, xlsx_path)
+    
+    def atualizar_se(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, esperado: dict) -> list:
+        # Relê o arquivo dentro da trava: só as linhas pedidas são verificadas e alteradas
+        with _trava_journal, trava_arquivo(csv_path):
+            df = self.carregar(csv_path)
+            aplicados = self._aplicar(df, alteracoes, esperado)
+            if aplicados:
+                self.salvar(df, csv_path, xlsx_path)
+        return aplicados
+    
+    def inserir_unicos(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list, chave: list,
+                       tudo_ou_nada: bool = False) -> list:
+        # Dentro da trava, confere as chaves já gravadas e só acrescenta as novas ao journal
+        with _trava_journal, trava_arquivo(csv_path):
+            novos = self._novos_por_chave(self.carregar(csv_path, cols), registros, chave, tudo_ou_nada)
+            ids = self.inserir(novos, csv_path, xlsx_path, cols) if novos else []
+        return [{**registro, "id": id_novo} for registro, id_novo in zip(novos, ids)]
+    
+    @staticmethod
+    def _novos_por_chave(df: pd.DataFrame, registros: list, chave: list, tudo_ou_nada: bool = False) -> list:
+        """Registros cuja chave não está no DataFrame nem se repete no lote"""
+        existentes = set(zip(*(df[c] for c in chave))) if not df.empty else set()
+        novos = []
+        for registro in registros:
+            valor_chave = tuple(registro[c] for c in chave)
+            if valor_chave in existentes:
+                continue
+            existentes.add(valor_chave)
+            novos.append(registro)
+        if tudo_ou_nada and len(novos) < len(registros):
+            return []
+        return novos
+    
+    def excluir(self, csv_path: Path, xlsx_path: Path, indices: list):
+        with _trava_journal, trava_arquivo(csv_path):
+            df = self.carregar(csv_path)
+            self.salvar(df.drop(indices), csv_path, xlsx_path)
+    
+    def limpar(self, csv_path: Path, xlsx_path: Path):
+        with _trava_journal, trava_arquivo(csv_path):
+            for arq in (csv_path, caminho_journal(csv_path), xlsx_path):
+                try:
+                    if arq.exists(): arq.unlink()
+                except Exception as e:
+                    _instrumentacao.erro_engolido("limpar", e)
+            _pendentes_journal[csv_path] = 0
+    
+    def existe(self, csv_path: Path) -> bool:
+        return csv_path.exists() or caminho_journal(csv_path).exists()
+    
+    def assinatura(self, csv_path: Path):
+        """mtime e tamanho do CSV e do journal"""
+        versao = []
+        for arq in (csv_path, caminho_journal(csv_path)):
+            try:
+                st = arq.stat()
+                versao.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                versao.append(None)
+        return tuple(versao)
+    
+    def so_gravacao_propria(self, csv_path: Path, antes, depois, linhas: int) -> bool:
+        """Se a assinatura foi de `antes` a `depois` só pela gravação de quem segura _trava_conjunto
+
+        `linhas` é quantas linhas essa gravação incluiu ou excluiu. No CSV todo escritor
+        segura a trava do conjunto (a da raiz, nos particionados), então nada de fora entra
+        enquanto ela está com quem chama
+        """
+        return True
+    
+    def arquivos_backup(self) -> list:
+        return []
+
+class ArmazenamentoCSVParticionado(ArmazenamentoCSV):
+    """Backend CSV com os conjuntos de PARTICOES_MENSAIS divididos em uma pasta por mês
+
+    Consultas abrem só as partições do intervalo pedido, lidas em paralelo, e
+    alterações regravam só as partições das linhas alteradas. Conjuntos não
+    particionados seguem exatamente o ArmazenamentoCSV
+    """
+    
+    def carregar(self, path: Path, cols=None) -> pd.DataFrame:
+        if not particionado(path):
+            return super().carregar(path, cols)
+        with _trava_journal:
+            partes = [df for df in _em_paralelo(self._ler, partes_do_conjunto(path)) if len(df)]
+        if not partes:
+            return pd.DataFrame(columns=cols) if cols else pd.DataFrame()
+        return pd.concat(partes).sort_index() if len(partes) > 1 else partes[0]
+    
+    def consultar(self, path: Path, filtros: dict, inicio: int, limite: int) -> tuple[pd.DataFrame, int]:
+        if not particionado(path):
+            return super().consultar(path, filtros, inicio, limite)
+        de_mes = mes_do_registro(filtros["data_inicio"]) if filtros.get("data_inicio") else None
+        ate_mes = mes_do_registro(filtros["data_fim"]) if filtros.get("data_fim") else None
+        # Cada partição devolve quantas linhas casam e no máximo as inicio + limite primeiras
+        with _trava_journal:
+            arquivos = [caminho_particao(path, mes) for mes in particoes(path, de_mes, ate_mes)]
+            resultados = _em_paralelo(lambda parte: self._filtrar(parte, filtros, inicio + limite), arquivos)
+        pagina = []
+        total = 0
+        vazia = next((linhas.iloc[:0] for _, linhas in resultados if len(linhas.columns)), pd.DataFrame())
+        for quantidade, linhas in resultados:
+            de, ate = max(inicio - total, 0), inicio + limite - total
+            if de < len(linhas) and ate > 0:
+                pagina.append(linhas.iloc[de:ate])
+            total += quantidade
+        return (pd.concat(pagina) if pagina else vazia), total
+    
+    def iterar(self, path: Path, filtros: dict):
+        if not particionado(path):
+            yield from super().iterar(path, filtros)
+            return
+        # Mês a mês, em ordem: só um bloco de uma partição fica em memória por vez
+        de_mes = mes_do_registro(filtros["data_inicio"]) if filtros.get("data_inicio") else None
+        ate_mes = mes_do_registro(filtros["data_fim"]) if filtros.get("data_fim") else None
+        with _trava_journal:
+            for mes in particoes(path, de_mes, ate_mes):
+                yield from super().iterar(caminho_particao(path, mes), filtros)
+    
+    def buscar(self, path: Path, id_registro: int):
+        if not particionado(path):
+            return super().buscar(path, id_registro)
+        # Do mês mais recente para o mais antigo: quase sempre se busca uma sessão recente
+        with _trava_journal:
+            for parte in reversed(partes_do_conjunto(path)):
+                registro = super().buscar(parte, id_registro)
+                if registro is not None:
+                    return registro
+        return None
+    
+    def salvar(self, df: pd.DataFrame, csv_path: Path, xlsx_path: Path):
+        if not particionado(csv_path):
+            return super().salvar(df, csv_path, xlsx_path)
+        with _trava_journal, trava_arquivo(csv_path):
+            sobrando = set(particoes(csv_path))
+            if len(df):
+                for mes, parte in df.groupby(_meses_vetorizado(df[PARTICOES_MENSAIS[csv_path.stem]])):
+                    self._gravar_particao(parte, csv_path, xlsx_path, mes)
+                    sobrando.discard(mes)
+            for mes in sobrando:
+                super().limpar(caminho_particao(csv_path, mes), caminho_particao(xlsx_path, mes))
+    
+    def _gravar_particao(self, df: pd.DataFrame, csv_path: Path, xlsx_path: Path, mes: str):
+        parte = caminho_particao(csv_path, mes)
+        parte.parent.mkdir(parents=True, exist_ok=True)
+        ArmazenamentoCSV.salvar(self, df, parte, caminho_particao(xlsx_path, mes))
+    
+    def inserir(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list) -> list:
+        if not particionado(csv_path):
+            return super().inserir(registros, csv_path, xlsx_path, cols)
+        coluna = PARTICOES_MENSAIS[csv_path.stem]
+        por_mes = defaultdict(list)
+        for posicao, registro in enumerate(registros):
+            por_mes[mes_do_registro(registro.get(coluna))].append(posicao)
+        ids = [None] * len(registros)
+        # Todo escritor de um conjunto particionado trava a raiz e depois as partições
+        with _trava_journal, trava_arquivo(csv_path):
+            for mes, posicoes in por_mes.items():
+                parte = caminho_particao(csv_path, mes)
+                parte.parent.mkdir(parents=True, exist_ok=True)
+                novos = anexar_registros([registros[p] for p in posicoes], parte, caminho_particao(xlsx_path, mes), cols)
+                for posicao, id_novo in zip(posicoes, novos):
+                    ids[posicao] = id_novo
+        return ids
+    
+    def _reescrever(self, csv_path: Path, xlsx_path: Path, ids: list, editar):
+        """Aplica `editar` só às partições que contêm `ids` e regrava apenas essas
+
+        `editar(df)` devolve (df alterado ou None se nada mudou, resultado). Linhas cuja
+        data passou para outro mês mudam de partição mantendo o ID
+        """
+        coluna = PARTICOES_MENSAIS[csv_path.stem]
+        with _trava_journal, trava_arquivo(csv_path), ExitStack() as travas:
+            procurados = set(ids)
+            lidas = {}
+            for mes in reversed(particoes(csv_path)):
+                if not procurados:
+                    break
+                parte = caminho_particao(csv_path, mes)
+                travas.enter_context(trava_arquivo(parte))
+                df = self._ler(parte)
+                if procurados.intersection(df.index):
+                    procurados.difference_update(df.index)
+                    lidas[mes] = df
+            df, resultado = editar(pd.concat(lidas.values()) if lidas else pd.DataFrame())
+            if df is None:
+                return resultado
+            meses = _meses_vetorizado(df[coluna]) if len(df) else pd.Series(dtype=object)
+            for mes in sorted(set(lidas) | set(meses)):
+                parte = caminho_particao(csv_path, mes)
+                linhas = df[meses == mes]
+                if mes not in lidas:
+                    # Partição que só recebe linhas vindas de outro mês
+                    parte.parent.mkdir(parents=True, exist_ok=True)
+                    travas.enter_context(trava_arquivo(parte))
+                    linhas = pd.concat([self._ler(parte), linhas]).sort_index()
+                if len(linhas):
+                    self._gravar_particao(linhas, csv_path, xlsx_path, mes)
+                else:
+                    super().limpar(parte, caminho_particao(xlsx_path, mes))
+        return resultado
+    
+    def atualizar(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, visao: pd.DataFrame = None):
+        if not particionado(csv_path):
+            return super().atualizar(csv_path, xlsx_path, alteracoes, visao)
+        # A visão completa não é regravada: só as partições das linhas alteradas
+        def editar(df):
+            self._aplicar(df, alteracoes)
+            return df, None
+        self._reescrever(csv_path, xlsx_path, list(alteracoes), editar)
+    
+    def atualizar_se(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, esperado: dict) -> list:
+        if not particionado(csv_path):
+            return super().atualizar_se(csv_path, xlsx_path, alteracoes, esperado)
+        def editar(df):
+            aplicados = self._aplicar(df, alteracoes, esperado)
+            return (df if aplicados else None), aplicados
+        return self._reescrever(csv_path, xlsx_path, list(alteracoes), editar)
+    
+    def excluir(self, csv_path: Path, xlsx_path: Path, indices: list):
+        if not particionado(csv_path):
+            return super().excluir(csv_path, xlsx_path, indices)
+        self._reescrever(csv_path, xlsx_path, indices, lambda df: (df.drop(indices), None))
+    
+    def limpar(self, csv_path: Path, xlsx_path: Path):
+        if not particionado(csv_path):
+            return super().limpar(csv_path, xlsx_path)
+        with _trava_journal, trava_arquivo(csv_path):
+            for mes in particoes(csv_path):
+                super().limpar(caminho_particao(csv_path, mes), caminho_particao(xlsx_path, mes))
+    
+    def existe(self, csv_path: Path) -> bool:
+        if not particionado(csv_path):
+            return super().existe(csv_path)
+        return bool(particoes(csv_path))
+    
+    def assinatura(self, csv_path: Path):
+        """Assinatura de cada partição, junto com o mês"""
+        if not particionado(csv_path):
+            return super().assinatura(csv_path)
+        return tuple((mes, ArmazenamentoCSV.assinatura(self, caminho_particao(csv_path, mes))) for mes in particoes(csv_path))
+
+class _LoteRecusado(Exception):
+    """Interrompe a transação de um lote tudo-ou-nada que encontrou uma chave já gravada"""
+
+class ArmazenamentoSQLite:
+    """Armazenamento transacional em SQLite (modo WAL); CSV e XLSX passam a ser exportações"""
+    
+    TABELAS = {"alunos": COLUNAS_ALUNOS, "relatorios": COLUNAS_REL, "agendamentos": COLUNAS_AG}
+    COLUNAS_INDEXADAS = ("pc", "data", "professor", "horario")
+    
+    def __init__(self, db_path: Path = None):
+        self.db_path = db_path or ARQ_DB
+        self._trava = threading.RLock()
+        self.con = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        # lower() do SQLite só conhece ASCII; os filtros comparam como o str.lower do backend CSV
+        self.con.create_function("minusculas", 1, lambda texto: None if texto is None else str(texto).lower(),
+                                 deterministic=True)
+        with self.con:
+            for tabela, cols in self.TABELAS.items():
+                colunas = ", ".join(f'"{c}" TEXT' for c in cols)
+                self.con.execute(f'CREATE TABLE IF NOT EXISTS {tabela} (id INTEGER PRIMARY KEY, {colunas})')
+                # Bancos criados por versões anteriores ganham as colunas novas
+                existentes = {linha[1] for linha in self.con.execute(f"PRAGMA table_info({tabela})")}
+                for col in cols:
+                    if col not in existentes:
+                        self.con.execute(f'ALTER TABLE {tabela} ADD COLUMN "{col}" TEXT')
+                for col in self.COLUNAS_INDEXADAS:
+                    if col in cols:
+                        self.con.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{col} ON {tabela}("{col}")')
+            # Versão persistida por tabela: gatilhos a incrementam em qualquer escrita,
+            # de qualquer processo, então a assinatura é comparável entre execuções
+            self.con.execute("CREATE TABLE IF NOT EXISTS versoes (tabela TEXT PRIMARY KEY, versao INTEGER NOT NULL)")
+            for tabela in self.TABELAS:
+                self.con.execute("INSERT OR IGNORE INTO versoes (tabela, versao) VALUES (?, 0)", (tabela,))
+                for evento in ("INSERT", "UPDATE", "DELETE"):
+                    self.con.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS versao_{tabela}_{evento.lower()} AFTER {evento} ON {tabela} "
+                        f"BEGIN UPDATE versoes SET versao = versao + 1 WHERE tabela = '{tabela}'; END")
+    
+    def _tabela(self, csv_path: Path) -> tuple[str, list]:
+        tabela = csv_path.stem
+        if tabela not in self.TABELAS:
+            raise ValueError(f"Conjunto de dados desconhecido: {csv_path}")
+        return tabela, self.TABELAS[tabela]
+    
+    def _exportar_depois(self, csv_path: Path, xlsx_path: Path):
+        agendar_exportacao(lambda: self.carregar(csv_path), xlsx_path, csv_path)
+    
+    def carregar(self, path: Path, cols=None) -> pd.DataFrame:
+        tabela, colunas = self._tabela(path)
+        with self._trava:
+            df = pd.read_sql_query(f"SELECT * FROM {tabela} ORDER BY id", self.con, index_col="id")
+        df.index.name = None
+        return df
+    
+    @staticmethod
+    def _where(filtros: dict) -> tuple[str, list]:
+        """Cláusula WHERE e parâmetros equivalentes a _mascara_filtros"""
+        condicoes, parametros = [], []
+        if filtros.get("ids") is not None:
+            condicoes.append(f"id IN ({', '.join('?' * len(filtros['ids']))})" if filtros["ids"] else "0")
+            parametros.extend(int(i) for i in filtros["ids"])
+        if filtros.get("pc"):
+            condicoes.append("pc = ?")
+            parametros.append(filtros["pc"])
+        if filtros.get("pcs"):
+            condicoes.append(f"pc IN ({', '.join('?' * len(filtros['pcs']))})")
+            parametros.extend(filtros["pcs"])
+        if filtros.get("nome"):
+            # Prefixo comparado literalmente: % e _ digitados não são curingas como no LIKE
+            prefixo = filtros["nome"].lower()
+            condicoes.append("substr(minusculas(nome), 1, ?) = ?")
+            parametros.extend([len(prefixo), prefixo])
+        if filtros.get("professor"):
+            condicoes.append("minusculas(professor) = ?")
+            parametros.append(filtros["professor"].lower())
+        # Datas gravadas como DD/MM/AAAA: compara na ordem AAAAMMDD
+        data_ordenavel = "substr(data, 7, 4) || substr(data, 4, 2) || substr(data, 1, 2)"
+        for chave, operador in (("data_inicio", ">="), ("data_fim", "<=")):
+            if filtros.get(chave):
+                d, m, a = filtros[chave].split("/")
+                condicoes.append(f"{data_ordenavel} {operador} ?")
+                parametros.append(f"{a}{m}{d}")
+        return (f"WHERE {' AND '.join(condicoes)}" if condicoes else ""), parametros
+    
+    def consultar(self, path: Path, filtros: dict, inicio: int, limite: int) -> tuple[pd.DataFrame, int]:
+        tabela, _ = self._tabela(path)
+        where, parametros = self._where(filtros)
+        with self._trava:
+            total = self.con.execute(f"SELECT COUNT(*) FROM {tabela} {where}", parametros).fetchone()[0]
+            df = pd.read_sql_query(
+                f"SELECT * FROM {tabela} {where} ORDER BY id LIMIT ? OFFSET ?",
+                self.con, params=[*parametros, limite, inicio], index_col="id"
+            )
+        df.index.name = None
+        return df, total
+    
+    def iterar(self, path: Path, filtros: dict):
+        tabela, _ = self._tabela(path)
+        where, parametros = self._where(filtros)
+        with self._trava:
+            for bloco in pd.read_sql_query(f"SELECT * FROM {tabela} {where} ORDER BY id", self.con,
+                                           params=parametros, index_col="id", chunksize=TAMANHO_BLOCO):
+                bloco.index.name = None
+                yield bloco
+    
+    def buscar(self, path: Path, id_registro: int):
+        tabela, _ = self._tabela(path)
+        with self._trava:
+            df = pd.read_sql_query(f"SELECT * FROM {tabela} WHERE id = ?", self.con, params=[int(id_registro)], index_col="id")
+        return df.iloc[0] if not df.empty else None
+    
+    def gravar_tabela(self, df: pd.DataFrame, csv_path: Path):
+        """Substitui o conteúdo da tabela numa única transação, preservando o índice como id"""
+        tabela, cols = self._tabela(csv_path)
+        dados = df.reindex(columns=cols).astype(object)
+        dados = dados.where(dados.notna(), None)
+        linhas = [(int(idx), *valores) for idx, valores in zip(dados.index, dados.itertuples(index=False))]
+        marcadores = ", ".join("?" * (len(cols) + 1))
+        nomes = ", ".join(f'"{c}"' for c in cols)
+        with self._trava, self.con:
+            self.con.execute(f"DELETE FROM {tabela}")
+            self.con.executemany(f"INSERT INTO {tabela} (id, {nomes}) VALUES ({marcadores})", linhas)
+    
+    def salvar(self, df: pd.DataFrame, csv_path: Path, xlsx_path: Path):
+        self.gravar_tabela(df, csv_path)
+        self._exportar_depois(csv_path, xlsx_path)
+    
+    def inserir(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list) -> list:
+        tabela, colunas = self._tabela(csv_path)
+        nomes = ", ".join(f'"{c}"' for c in colunas)
+        comando = f"INSERT INTO {tabela} ({nomes}) VALUES ({', '.join('?' * len(colunas))})"
+        # Um execute por linha para obter cada ID; continua sendo uma única transação
+        with self._trava, self.con:
+            ids = [self.con.execute(comando, [registro.get(c) for c in colunas]).lastrowid for registro in registros]
+        self._exportar_depois(csv_path, xlsx_path)
+        return ids
+    
+    def atualizar(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, visao: pd.DataFrame = None):
+        tabela, _ = self._tabela(csv_path)
+        with self._trava, self.con:
+            for idx, campos in alteracoes.items():
+                atribuicoes = ", ".join(f'"{c}" = ?' for c in campos)
+                self.con.execute(f"UPDATE {tabela} SET {atribuicoes} WHERE id = ?", [*campos.values(), int(idx)])
+        self._exportar_depois(csv_path, xlsx_path)
+    
+    def atualizar_se(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, esperado: dict) -> list:
+        # UPDATE condicional: a própria linha decide quem chegou primeiro
+        tabela, _ = self._tabela(csv_path)
+        condicao = "".join(f' AND "{c}" = ?' for c in esperado)
+        aplicados = []
+        with self._trava, self.con:
+            for idx, campos in alteracoes.items():
+                atribuicoes = ", ".join(f'"{c}" = ?' for c in campos)
+                cursor = self.con.execute(
+                    f"UPDATE {tabela} SET {atribuicoes} WHERE id = ?{condicao}",
+                    [*campos.values(), int(idx), *esperado.values()]
+                )
+                if cursor.rowcount:
+                    aplicados.append(idx)
+        if aplicados:
+            self._exportar_depois(csv_path, xlsx_path)
+        return aplicados
+    
+    def inserir_unicos(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list, chave: list,
+                       tudo_ou_nada: bool = False) -> list:
+        # INSERT ... WHERE NOT EXISTS é um único comando, atômico entre conexões; o lote inteiro é uma transação
+        tabela, colunas = self._tabela(csv_path)
+        nomes = ", ".join(f'"{c}"' for c in colunas)
+        condicao = " AND ".join(f'"{c}" = ?' for c in chave)
+        comando = (
+            f"INSERT INTO {tabela} ({nomes}) SELECT {', '.join('?' * len(colunas))} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {tabela} WHERE {condicao})"
+        )
+        inseridos = []
+        try:
+            with self._trava, self.con:
+                for registro in registros:
+                    cursor = self.con.execute(comando, [*(registro.get(c) for c in colunas), *(registro[c] for c in chave)])
+                    if cursor.rowcount:
+                        inseridos.append({**registro, "id": cursor.lastrowid})
+                    elif tudo_ou_nada:
+                        raise _LoteRecusado
+        except _LoteRecusado:
+            # Sair do `with self.con` pela exceção desfaz o que o lote já tinha inserido
+            inseridos = []
+        if inseridos:
+            self._exportar_depois(csv_path, xlsx_path)
+        return inseridos
+    
+    def excluir(self, csv_path: Path, xlsx_path: Path, indices: list):
+        tabela, _ = self._tabela(csv_path)
+        with self._trava, self.con:
+            self.con.executemany(f"DELETE FROM {tabela} WHERE id = ?", [(int(i),) for i in indices])
+        self._exportar_depois(csv_path, xlsx_path)
+    
+    def limpar(self, csv_path: Path, xlsx_path: Path):
+        tabela, _ = self._tabela(csv_path)
+        with self._trava, self.con:
+            self.con.execute(f"DELETE FROM {tabela}")
+        for arq in (csv_path, xlsx_path):
+            try:
+                if arq.exists(): arq.unlink()
+            except Exception as e:
+                _instrumentacao.erro_engolido("limpar", e)
+    
+    def existe(self, csv_path: Path) -> bool:
+        tabela, _ = self._tabela(csv_path)
+        with self._trava:
+            return self.con.execute(f"SELECT EXISTS(SELECT 1 FROM {tabela})").fetchone()[0] == 1
+    
+    def assinatura(self, csv_path: Path):
+        """Versão persistida da tabela, mantida pelos gatilhos de escrita"""
+        tabela, _ = self._tabela(csv_path)
+        with self._trava:
+            linha = self.con.execute("SELECT versao FROM versoes WHERE tabela = ?", (tabela,)).fetchone()
+        return ("sqlite", tabela, linha[0] if linha else 0)
+    
+    def so_gravacao_propria(self, csv_path: Path, antes, depois, linhas: int) -> bool:
+        # Os gatilhos somam 1 por linha escrita, venha de qual processo vier
+        return depois[2] - antes[2] == linhas
+    
+    def arquivos_backup(self) -> list:
+        # Leva o conteúdo do WAL para o arquivo principal antes da cópia
+        with self._trava:
+            self.con.execute("PRAGMA wal_checkpoint(FULL)")
+        return [self.db_path]
+
+# Modo servidor: um processo (ServidorLab) mantém os conjuntos em memória e aplica
+# todas as gravações numa única fila; com LAB_ARMAZENAMENTO=remoto, os terminais
+# usam o ArmazenamentoRemoto e não tocam mais nos arquivos.
+# Protocolo: uma linha JSON por pedido ({"op", "conjunto", ...}) e uma por resposta
+# ({"ok": true, "resultado"} ou {"ok": false, "tipo", "erro"}). Fora do loopback o servidor
+# só sobe com LAB_TOKEN, e todo pedido leva o mesmo token no campo "token"
+ERROS_REMOTOS = {"ValueError": ValueError, "EntradaInvalida": EntradaInvalida, "AgendaLegada": AgendaLegada,
+                 "KeyError": KeyError, "TimeoutError": TimeoutError, "PermissionError": PermissionError}
+
+def _json_nativo(valor):
+    """Converte escalares do numpy/pandas que o json não conhece"""
+    return valor.item() if hasattr(valor, "item") else str(valor)
+
+def _df_para_json(df: pd.DataFrame) -> dict:
+    return {"index": [int(i) for i in df.index], "columns": list(df.columns), "data": df.values.tolist()}
+
+def _df_de_json(dados: dict) -> pd.DataFrame:
+    df = pd.DataFrame(dados["data"], columns=dados["columns"])
+    df.index = pd.Index(dados["index"], dtype="int64")
+    return df
+
+def _endereco(texto: str) -> tuple[str, int]:
+    host, _, porta = texto.rpartition(":")
+    return host or "127.0.0.1", int(porta)
+
+def _loopback(host: str) -> bool:
+    import ipaddress
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def aplicar_alteracao(df: pd.DataFrame, alteracao: list) -> pd.DataFrame:
+    """Reaplica uma gravação (inserir, atualizar ou excluir) numa cópia em memória do conjunto"""
+    tipo = alteracao[0]
+    if tipo == "inserir":
+        _, ids, registros = alteracao
+        novos = pd.DataFrame(registros, index=pd.Index(ids, dtype="int64"), columns=df.columns if len(df.columns) else None)
+        return pd.concat([df, novos]) if len(df) else novos
+    if tipo == "atualizar":
+        ArmazenamentoCSV._aplicar(df, {int(i): campos for i, campos in alteracao[1].items()})
+        return df
+    if tipo == "excluir":
+        return df.drop(alteracao[1], errors="ignore")
+    raise ValueError(f"Alteração desconhecida: {tipo}")
+
+class ArmazenamentoRemoto:
+    """Cliente do ServidorLab com a mesma interface dos backends locais
+
+    Guarda uma cópia de cada conjunto; quando a versão no servidor muda, recebe
+    só as alterações feitas desde a versão que já tem, sem reler arquivo nenhum
+    """
+    
+    def __init__(self, endereco: str = None):
+        self.endereco = endereco or SERVIDOR
+        self._trava = threading.Lock()
+        self._trava_copias = threading.Lock()
+        self._conexao = None
+        self._copias = {}  # conjunto -> (assinatura, DataFrame)
+    
+    def _conectar(self):
+        import socket
+        sock = socket.create_connection(_endereco(self.endereco), timeout=30)
+        # Pedidos pequenos e seguidos: sem o atraso do algoritmo de Nagle
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock.makefile("rwb")
+    
+    def _pedir(self, op: str, csv_path: Path = None, **args):
+        pedido = {"op": op, **args}
+        if TOKEN_SERVIDOR:
+            pedido["token"] = TOKEN_SERVIDOR
+        if csv_path is not None:
+            pedido["conjunto"] = csv_path.stem
+        linha = (json.dumps(pedido, default=_json_nativo) + "\n").encode("utf-8")
+        with self._trava:
+            for tentativa in range(2):
+                enviado = False
+                try:
+                    if self._conexao is None:
+                        self._conexao = self._conectar()
+                    self._conexao.write(linha)
+                    self._conexao.flush()
+                    enviado = True
+                    resposta = self._conexao.readline()
+                    if not resposta:
+                        raise ConnectionError("conexão encerrada pelo servidor")
+                    break
+                except OSError as e:
+                    self._conexao = None
+                    # Só reenvia o que o servidor com certeza não recebeu (conexão antiga caída)
+                    if tentativa or enviado:
+                        raise ConnectionError(f"Servidor do laboratório indisponível em {self.endereco}: {e}") from e
+        resposta = json.loads(resposta)
+        if not resposta["ok"]:
+            raise ERROS_REMOTOS.get(resposta["tipo"], RuntimeError)(resposta["erro"])
+        return resposta["resultado"]
+    
+    def carregar(self, path: Path, cols=None) -> pd.DataFrame:
+        with self._trava_copias:
+            assinatura, df = self._copias.get(path.stem, (None, None))
+            resposta = self._pedir("alteracoes", path, desde=assinatura)
+            if "completo" in resposta:
+                df = _df_de_json(resposta["completo"])
+            else:
+                for alteracao in resposta["alteracoes"]:
+                    df = aplicar_alteracao(df, alteracao)
+            self._copias[path.stem] = (tuple(resposta["assinatura"]), df)
+        if df.empty and cols:
+            return pd.DataFrame(columns=cols)
+        return df.copy()
+    
+    def consultar(self, path: Path, filtros: dict, inicio: int, limite: int) -> tuple[pd.DataFrame, int]:
+        resposta = self._pedir("consultar", path, filtros=filtros, inicio=inicio, limite=limite)
+        return _df_de_json(resposta["pagina"]), resposta["total"]
+    
+    def iterar(self, path: Path, filtros: dict):
+        # O servidor filtra uma vez e devolve só os IDs; os blocos vêm depois por ID, sem refazer o filtro
+        ids = self._pedir("ids", path, filtros=filtros)
+        for i in range(0, len(ids), TAMANHO_BLOCO):
+            bloco, _ = self.consultar(path, {"ids": ids[i:i + TAMANHO_BLOCO]}, 0, TAMANHO_BLOCO)
+            if len(bloco):
+                yield bloco
+    
+    def buscar(self, path: Path, id_registro: int):
+        return self._pedir("buscar", path, id=int(id_registro))
+    
+    def salvar(self, df: pd.DataFrame, csv_path: Path, xlsx_path: Path):
+        self._pedir("salvar", csv_path, df=_df_para_json(df))
+    
+    def inserir(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list) -> list:
+        return self._pedir("inserir", csv_path, registros=registros)
+    
+    def atualizar(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, visao: pd.DataFrame = None):
+        # A visão completa fica local: o servidor recebe só as linhas alteradas
+        self._pedir("atualizar", csv_path, alteracoes=alteracoes)
+    
+    def atualizar_se(self, csv_path: Path, xlsx_path: Path, alteracoes: dict, esperado: dict) -> list:
+        return self._pedir("atualizar_se", csv_path, alteracoes=alteracoes, esperado=esperado)
+    
+    def inserir_unicos(self, registros: list, csv_path: Path, xlsx_path: Path, cols: list, chave: list,
+                       tudo_ou_nada: bool = False) -> list:
+        return self._pedir("inserir_unicos", csv_path, registros=registros, chave=chave, tudo_ou_nada=tudo_ou_nada)
+    
+    def excluir(self, csv_path: Path, xlsx_path: Path, indices: list):
+        self._pedir("excluir", csv_path, indices=[int(i) for i in indices])
+    
+    def limpar(self, csv_path: Path, xlsx_path: Path):
+        self._pedir("limpar", csv_path)
+    
+    def existe(self, csv_path: Path) -> bool:
+        return self._pedir("existe", csv_path)
+    
+    def assinatura(self, csv_path: Path):
+        """Instância do servidor e versão do conjunto nela"""
+        return tuple(self._pedir("assinatura", csv_path))
+    
+    def so_gravacao_propria(self, csv_path: Path, antes, depois, linhas: int) -> bool:
+        # O servidor avança a versão do conjunto uma vez por gravação
+        return depois[0] == antes[0] and depois[1] - antes[1] == 1
+    
+    def criar_backup(self) -> str:
+        """Pede ao servidor um snapshot dos arquivos que ele mantém; retorna o caminho no servidor"""
+        return self._pedir("backup")
+    
+    def analise_uso(self, reconstruir: bool = False) -> dict:
+        """Agregados de uso que o servidor mantém (veja AnaliseUso)"""
+        return self._pedir("analise", reconstruir=reconstruir)
+    
+    def arquivos_backup(self) -> list:
+        # Os arquivos estão no servidor, que faz os próprios backups
+        return []
+
+class ServidorLab:
+    """Servidor asyncio que mantém os conjuntos em memória e serializa as gravações
+
+    Leituras são respondidas direto da memória. Gravações entram numa fila com uma
+    única tarefa escritora, que persiste no backend local (CSV ou SQLite) numa thread
+    e só então atualiza a memória e a versão do conjunto
+    """
+    
+    LEITURAS = ("alteracoes", "consultar", "ids", "buscar", "existe", "assinatura")
+    GRAVACOES = ("salvar", "inserir", "atualizar", "atualizar_se", "inserir_unicos", "excluir", "limpar", "backup")
+    # Os agregados de uso são alterados pela tarefa escritora, então também são lidos na fila dela
+    NA_FILA = GRAVACOES + ("analise",)
+    
+    def __init__(self, host: str = "127.0.0.1", porta: int = 0, token: str = None):
+        self.host = host
+        self.porta = porta
+        self.token = TOKEN_SERVIDOR if token is None else token
+        if not self.token and not _loopback(host):
+            raise EntradaInvalida(f"Para escutar em {host}, fora do loopback, defina o token compartilhado em LAB_TOKEN.")
+        self.backend = ArmazenamentoSQLite() if ARMAZENAMENTO == "sqlite" else ArmazenamentoCSVParticionado()
+        # Muda a cada execução: cópias de clientes feitas antes de um reinício não valem mais
+        self.instancia = f"{os.getpid()}-{time.time_ns()}"
+        self.conjuntos = {}
+        self.versoes = defaultdict(int)
+        self.historico = defaultdict(lambda: deque(maxlen=LIMITE_HISTORICO_SERVIDOR))
+        self.pedidos = 0
+        self.gravacoes = 0
+        self._loop = None
+        self._parada = None
+        self._thread = None
+        self._conexoes = set()
+    
+    def _caminhos(self, nome: str) -> tuple:
+        caminhos = {
+            "alunos": (ARQ_ALUNOS, ARQ_ALUNOS_XLSX, COLUNAS_ALUNOS),
+            "relatorios": (ARQ_REL, ARQ_REL_XLSX, COLUNAS_REL),
+            "agendamentos": (ARQ_AG, ARQ_AG_XLSX, COLUNAS_AG),
+        }
+        if nome not in caminhos:
+            raise ValueError(f"Conjunto desconhecido: {nome}")
+        return caminhos[nome]
+    
+    def _df(self, nome: str) -> pd.DataFrame:
+        if nome not in self.conjuntos:
+            csv_path, _, cols = self._caminhos(nome)
+            self.conjuntos[nome] = self.backend.carregar(csv_path, cols)
+        return self.conjuntos[nome]
+    
+    def _ler(self, pedido: dict):
+        op, nome = pedido["op"], pedido.get("conjunto")
+        df = self._df(nome)
+        assinatura = [self.instancia, self.versoes[nome]]
+        if op == "assinatura":
+            return assinatura
+        if op == "existe":
+            return len(df) > 0 or self.backend.existe(self._caminhos(nome)[0])
+        if op == "buscar":
+            return df.loc[pedido["id"]].to_dict() if pedido["id"] in df.index else None
+        if op == "consultar":
+            filtrado = df[_mascara_filtros(df, pedido["filtros"])] if len(df) else df
+            pagina = filtrado.iloc[pedido["inicio"]:pedido["inicio"] + pedido["limite"]]
+            return {"pagina": _df_para_json(pagina), "total": len(filtrado)}
+        if op == "ids":
+            return df.index[_mascara_filtros(df, pedido["filtros"])].tolist() if len(df) else []
+        # alteracoes: só o que mudou desde a versão do cliente, se o histórico ainda cobrir
+        desde = pedido.get("desde")
+        if desde and desde[0] == self.instancia:
+            faltando = [a for versao, a in self.historico[nome] if versao > desde[1]]
+            if len(faltando) == self.versoes[nome] - desde[1] and all(a is not None for a in faltando):
+                return {"assinatura": assinatura, "alteracoes": faltando}
+        return {"assinatura": assinatura, "completo": _df_para_json(df)}
+    
+    def _gravar(self, pedido: dict):
+        """Persiste no backend local (roda na thread do escritor); retorna (resultado, alteração)
+
+        A memória só é lida aqui: quem a altera é a tarefa escritora, depois da gravação
+        """
+        op = pedido["op"]
+        if op == "backup":
+            with _trava_journal:
+                criar_backup(avisar=False)
+            snapshots = _listar_snapshots()
+            return (str(snapshots[-1]) if snapshots else None), None
+        if op == "analise":
+            if pedido.get("reconstruir"):
+                analise_uso().reconstruir()
+            # Cópia: a resposta é serializada fora desta thread, enquanto a próxima gravação já altera os agregados
+            return {chave: dict(valor) if isinstance(valor, dict) else valor
+                    for chave, valor in analise_uso()._atuais().items()}, None
+        csv_path, xlsx_path, cols = self._caminhos(pedido["conjunto"])
+        df = self._df(pedido["conjunto"])
+        uso = pedido["conjunto"] == "alunos"
+        if op == "inserir":
+            gravar = lambda: self.backend.inserir(pedido["registros"], csv_path, xlsx_path, cols)
+            ids = analise_uso()._alterar(gravar, [], pedido["registros"]) if uso else gravar()
+            return ids, ["inserir", ids, pedido["registros"]]
+        if op == "inserir_unicos":
+            # Com um único escritor, conferir as chaves na memória basta
+            novos = ArmazenamentoCSV._novos_por_chave(df, pedido["registros"], pedido["chave"], pedido["tudo_ou_nada"])
+            ids = self.backend.inserir(novos, csv_path, xlsx_path, cols) if novos else []
+            return [{**registro, "id": id_novo} for registro, id_novo in zip(novos, ids)], ["inserir", ids, novos]
+        if op in ("atualizar", "atualizar_se"):
+            alteracoes = {int(i): campos for i, campos in pedido["alteracoes"].items()}
+            visao = df.copy()
+            aplicados = ArmazenamentoCSV._aplicar(visao, alteracoes, pedido.get("esperado"))
+            alteracoes = {i: alteracoes[i] for i in aplicados}
+            if alteracoes:
+                gravar = lambda: self.backend.atualizar(csv_path, xlsx_path, alteracoes, visao)
+                if uso:
+                    analise_uso()._alterar(gravar, [df.loc[i].to_dict() for i in alteracoes],
+                                           [visao.loc[i].to_dict() for i in alteracoes])
+                else:
+                    gravar()
+            return aplicados, ["atualizar", alteracoes]
+        if op == "excluir":
+            gravar = lambda: self.backend.excluir(csv_path, xlsx_path, pedido["indices"])
+            if uso:
+                analise_uso()._alterar(gravar, [df.loc[i].to_dict() for i in pedido["indices"] if i in df.index], [])
+            else:
+                gravar()
+            return None, ["excluir", pedido["indices"]]
+        if op == "salvar":
+            novo = _df_de_json(pedido["df"])
+            self.backend.salvar(novo, csv_path, xlsx_path)
+            return None, ["substituir", novo]
+        if op == "limpar":
+            self.backend.limpar(csv_path, xlsx_path)
+            return None, ["substituir", pd.DataFrame(columns=cols)]
+        raise ValueError(f"Operação desconhecida: {op}")
+    
+    def _registrar(self, nome: str, alteracao: list):
+        """Aplica a alteração na memória e publica a nova versão"""
+        if alteracao[0] == "substituir":
+            self.conjuntos[nome] = alteracao[1]
+            alteracao = None  # clientes precisam da cópia completa
+        elif alteracao[0] != "atualizar" or alteracao[1]:
+            self.conjuntos[nome] = aplicar_alteracao(self.conjuntos[nome], alteracao)
+        else:
+            return
+        self.versoes[nome] += 1
+        self.historico[nome].append((self.versoes[nome], alteracao))
+    
+    async def _escritor(self, fila, disco):
+        while True:
+            pedido, futuro = await fila.get()
+            try:
+                resultado, alteracao = await self._loop.run_in_executor(disco, self._gravar, pedido)
+                if alteracao is not None:
+                    self._registrar(pedido["conjunto"], alteracao)
+                    self.gravacoes += 1
+                    solicitar_backup()
+                futuro.set_result(resultado)
+            except Exception as e:
+                futuro.set_exception(e)
+            finally:
+                fila.task_done()
+    
+    async def _atender(self, leitor, escritor, fila):
+        self._conexoes.add(escritor)
+        try:
+            while linha := await leitor.readline():
+                self.pedidos += 1
+                try:
+                    pedido = json.loads(linha)
+                    if self.token and not hmac.compare_digest(str(pedido.pop("token", "")).encode(), self.token.encode()):
+                        raise PermissionError("Token do servidor ausente ou inválido (LAB_TOKEN).")
+                    if pedido["op"] in self.LEITURAS:
+                        resultado = self._ler(pedido)
+                    elif pedido["op"] in self.NA_FILA:
+                        futuro = self._loop.create_future()
+                        await fila.put((pedido, futuro))
+                        resultado = await futuro
+                    else:
+                        raise ValueError(f"Operação desconhecida: {pedido['op']}")
+                    resposta = {"ok": True, "resultado": resultado}
+                except Exception as e:
+                    resposta = {"ok": False, "tipo": type(e).__name__, "erro": str(e)}
+                escritor.write((json.dumps(resposta, default=_json_nativo) + "\n").encode("utf-8"))
+                await escritor.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._conexoes.discard(escritor)
+            escritor.close()
+    
+    async def executar(self, pronto: threading.Event = None):
+        """Atende até parar() ser chamado; `pronto` é sinalizado quando a porta está aberta"""
+        import asyncio
+        self._loop = asyncio.get_running_loop()
+        self._parada = asyncio.Event()
+        for nome in ("alunos", "relatorios", "agendamentos"):
+            self._df(nome)
+        fila = asyncio.Queue()
+        disco = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="escritor")
+        tarefa_escritora = asyncio.create_task(self._escritor(fila, disco))
+        # Sem limite prático de linha: um salvar leva o conjunto inteiro numa linha só
+        servidor = await asyncio.start_server(lambda l, e: self._atender(l, e, fila), self.host, self.porta, limit=1 << 30)
+        self.porta = servidor.sockets[0].getsockname()[1]
+        if threading.current_thread() is threading.main_thread():
+            # Ctrl+C ou kill: termina as gravações na fila antes de sair
+            import signal
+            for sinal in (signal.SIGINT, signal.SIGTERM):
+                self._loop.add_signal_handler(sinal, self._parada.set)
+        if pronto is not None:
+            pronto.set()
+        async with servidor:
+            await self._parada.wait()
+            await fila.join()
+            # Fecha quem ainda está conectado: os leitores veem fim de arquivo e saem sozinhos
+            for escritor in list(self._conexoes):
+                escritor.close()
+            await asyncio.sleep(0)
+        tarefa_escritora.cancel()
+        disco.shutdown()
+    
+    def em_segundo_plano(self) -> "ServidorLab":
+        """Sobe o servidor numa thread deste processo (porta 0 escolhe uma livre), para testes no loopback"""
+        import asyncio
+        pronto = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.executar(pronto)), daemon=True)
+        self._thread.start()
+        if not pronto.wait(30):
+            raise TimeoutError("O servidor não subiu a tempo")
+        return self
+    
+    def parar(self):
+        """Termina as gravações na fila e fecha o servidor"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._parada.set)
+        if self._thread is not None:
+            self._thread.join()
+
+_armazenamento = None
+
+def armazenamento():
+    """Backend de armazenamento ativo, escolhido por ARMAZENAMENTO"""
+    global _armazenamento
+    if _armazenamento is None:
+        if ARMAZENAMENTO == "remoto":
+            _armazenamento = ArmazenamentoRemoto()
+        elif ARMAZENAMENTO == "sqlite":
+            _armazenamento = ArmazenamentoSQLite()
+        else:
+            _armazenamento = ArmazenamentoCSVParticionado()
+    return _armazenamento
+
+def migrar_csv_para_sqlite(db_path: Path = None, forcar: bool = False) -> dict:
+    """Copia os CSVs atuais (incluindo journais) para o banco SQLite, uma única vez"""
+    origem = ArmazenamentoCSVParticionado()
+    destino = ArmazenamentoSQLite(db_path)
+    resultado = {}
+    for csv_path, cols in ((ARQ_ALUNOS, COLUNAS_ALUNOS), (ARQ_REL, COLUNAS_REL), (ARQ_AG, COLUNAS_AG)):
+        if destino.existe(csv_path) and not forcar:
+            resultado[csv_path.stem] = None
+            continue
+        df = origem.carregar(csv_path, cols)
+        destino.gravar_tabela(df, csv_path)
+        resultado[csv_path.stem] = len(df)
+    return resultado
+
+# Vários laboratórios: cada um tem uma pasta em DIR_DADOS com os mesmos arquivos
+# do layout antigo (ARQUIVOS_DO_LAB), o próprio laboratorio.json e os próprios backups
+def labs_disponiveis() -> list:
+    """Laboratórios com pasta em DIR_DADOS"""
+    if not DIR_DADOS.is_dir():
+        return []
+    return sorted(p.name for p in DIR_DADOS.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+def selecionar_lab(nome: str):
+    """Passa a ler e gravar os dados em DIR_DADOS/<nome>, criando a pasta se preciso"""
+    global DIR_LAB, LAB_ATUAL, DIR_BACKUP, DIR_BACKUP_OBJETOS, DIR_BACKUP_SNAPSHOTS
+    global _armazenamento, _config_lab, _analise_uso, _indice_relatorios, _indice_sessoes, _ultimo_manifesto
+    nome = nome.strip()
+    if not nome or nome.startswith(".") or Path(nome).name != nome:
+        raise EntradaInvalida(f"Nome de laboratório inválido: {nome!r}")
+    # O backup pendente ainda é do laboratório anterior
+    _agendador_backup.finalizar()
+    pasta = DIR_DADOS / nome
+    pasta.mkdir(parents=True, exist_ok=True)
+    for variavel in ARQUIVOS_DO_LAB:
+        globals()[variavel] = pasta / globals()[variavel].name
+    DIR_LAB, LAB_ATUAL = pasta, nome
+    DIR_BACKUP = pasta / "backup"
+    DIR_BACKUP_OBJETOS = DIR_BACKUP / "objetos"
+    DIR_BACKUP_SNAPSHOTS = DIR_BACKUP / "snapshots"
+    if isinstance(_armazenamento, ArmazenamentoSQLite):
+        _armazenamento.con.close()
+    _armazenamento = None
+    _config_lab = _analise_uso = _indice_relatorios = _ultimo_manifesto = None
+    _indice_sessoes = (None, None)
+
+def migrar_para_lab(nome: str, forcar: bool = False) -> dict:
+    """Copia os dados do layout de um laboratório só para DIR_DADOS/<nome>
+
+    As sessões são divididas por mês, os IDs são preservados e os arquivos
+    antigos ficam onde estão. O banco SQLite, se existir, é copiado inteiro
+    """
+    if LAB_ATUAL is not None:
+        raise EntradaInvalida(f"Os dados já estão no laboratório {LAB_ATUAL}")
+    legado = ArmazenamentoCSV()
+    conjuntos = ((ARQ_ALUNOS, COLUNAS_ALUNOS), (ARQ_REL, COLUNAS_REL), (ARQ_AG, COLUNAS_AG))
+    dados = {csv_path.stem: legado.carregar(csv_path, cols) for csv_path, cols in conjuntos if legado.existe(csv_path)}
+    db_legado = ARQ_DB
+    selecionar_lab(nome)
+    destino = ArmazenamentoCSVParticionado()
+    resultado = {"laboratorio": nome}
+    for csv_path, xlsx_path in ((ARQ_ALUNOS, ARQ_ALUNOS_XLSX), (ARQ_REL, ARQ_REL_XLSX), (ARQ_AG, ARQ_AG_XLSX)):
+        if csv_path.stem not in dados or (destino.existe(csv_path) and not forcar):
+            resultado[csv_path.stem] = None
+            continue
+        destino.salvar(dados[csv_path.stem], csv_path, xlsx_path)
+        resultado[csv_path.stem] = len(dados[csv_path.stem])
+    resultado["banco"] = db_legado.exists() and (forcar or not ARQ_DB.exists())
+    if resultado["banco"]:
+        with sqlite3.connect(db_legado) as origem, sqlite3.connect(ARQ_DB) as copia:
+            origem.backup(copia)
+    return resultado
+
+# Partições mensais: com um laboratório selecionado, os conjuntos de PARTICOES_MENSAIS
+# ficam em <lab>/<AAAA-MM>/<arquivo>, cada mês com snapshot, journal e XLSX próprios.
+# Os IDs continuam únicos no conjunto inteiro (uma só sequência, na pasta do laboratório)
+_RE_MES = re.compile(r"\d{4}-\d{2}")
+MES_SEM_DATA = "0000-00"  # partição das linhas sem data válida
+
+def _pasta_de_mes(pasta: Path) -> bool:
+    return _RE_MES.fullmatch(pasta.name) is not None
+
+def particionado(csv_path: Path) -> bool:
+    """O conjunto é dividido em partições mensais (e `csv_path` não é uma delas)"""
+    return LAB_ATUAL is not None and csv_path.stem in PARTICOES_MENSAIS and not _pasta_de_mes(csv_path.parent)
+
+def caminho_particao(path: Path, mes: str) -> Path:
+    return path.parent / mes / path.name
+
+def _raiz_particao(path: Path) -> Path:
+    """Caminho do conjunto a que o arquivo de uma partição pertence"""
+    return path.parent.parent / path.name if _pasta_de_mes(path.parent) else path
+
+def particoes(csv_path: Path, de_mes: str = None, ate_mes: str = None) -> list:
+    """Meses (AAAA-MM) com dados do conjunto, em ordem, opcionalmente limitados ao intervalo"""
+    if not csv_path.parent.is_dir():
+        return []
+    meses = []
+    for pasta in csv_path.parent.iterdir():
+        if not _pasta_de_mes(pasta) or (de_mes and pasta.name < de_mes) or (ate_mes and pasta.name > ate_mes):
+            continue
+        arquivo = pasta / csv_path.name
+        if arquivo.exists() or caminho_journal(arquivo).exists():
+            meses.append(pasta.name)
+    return sorted(meses)
+
+def mes_do_registro(data: str) -> str:
+    """Partição (AAAA-MM) de uma data DD/MM/AAAA"""
+    try:
+        return datetime.strptime(str(data).strip(), "%d/%m/%Y").strftime("%Y-%m")
+    except ValueError:
+        return MES_SEM_DATA
+
+def _meses_vetorizado(datas: pd.Series) -> pd.Series:
+    convertidas = pd.to_datetime(datas.astype("string").str.strip(), format="%d/%m/%Y", errors="coerce")
+    return convertidas.dt.strftime("%Y-%m").fillna(MES_SEM_DATA)
+
+def partes_do_conjunto(csv_path: Path) -> list:
+    """Arquivos CSV que formam o conjunto: as partições mensais ou o próprio arquivo"""
+    if particionado(csv_path):
+        return [caminho_particao(csv_path, mes) for mes in particoes(csv_path)]
+    return [csv_path]
+
+def arquivos_do_conjunto(csv_path: Path, xlsx_path: Path = None) -> list:
+    """Snapshot e journal (e o XLSX, se informado) de cada parte do conjunto"""
+    arquivos = []
+    for parte in partes_do_conjunto(csv_path):
+        arquivos += [parte, caminho_journal(parte)]
+        if xlsx_path is not None:
+            arquivos.append(parte.with_name(xlsx_path.name))
+    return arquivos
+
+_leitores = None
+
+def _em_paralelo(funcao, itens: list) -> list:
+    """Aplica `funcao` aos itens em até LEITORES_PARALELOS threads, mantendo a ordem
+
+    As threads não podem pegar _trava_journal: quem chama a segura durante toda a leitura
+    """
+    global _leitores
+    if len(itens) < 2 or LEITORES_PARALELOS < 2:
+        return [funcao(item) for item in itens]
+    if _leitores is None:
+        _leitores = concurrent.futures.ThreadPoolExecutor(LEITORES_PARALELOS, thread_name_prefix="particoes")
+    return list(_leitores.map(funcao, itens))
+
+# Journal de inclusões: novos registros são acrescentados em O(1) e
+# compactados no snapshot CSV/XLSX em segundo plano ao atingir LIMITE_JOURNAL
+_trava_journal = threading.RLock()
+_pendentes_journal = {}
+
+def caminho_journal(csv_path: Path) -> Path:
+    return csv_path.with_name(f"{csv_path.stem}.journal.csv")
+
+def _contar_pendentes(journal: Path) -> int:
+    if not journal.exists():
+        return 0
+    with open(journal, encoding="utf-8") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+def _descartar_journal(csv_path: Path):
+    journal = caminho_journal(csv_path)
+    if journal.exists():
+        journal.unlink()
+    _pendentes_journal[csv_path] = 0
+
+def _caminho_sequencia(csv_path: Path) -> Path:
+    # As partições mensais compartilham a sequência do conjunto
+    raiz = _raiz_particao(csv_path)
+    return raiz.with_name(f"{raiz.stem}.seq")
+
+def proximo_id(csv_path: Path, quantidade: int = 1) -> int:
+    """Reserva `quantidade` IDs estáveis consecutivos sem ler o CSV inteiro; retorna o primeiro"""
+    seq = _caminho_sequencia(csv_path)
+    with trava_arquivo(seq):
+        if seq.exists():
+            atual = int(seq.read_text() or -1)
+        else:
+            # Primeira vez: parte do maior ID já gravado
+            csv_backend = ArmazenamentoCSV()
+            atual = -1
+            for parte in partes_do_conjunto(_raiz_particao(csv_path)):
+                if csv_backend._pequeno(parte):
+                    maior = max((id_linha for id_linha, _ in csv_backend._linhas(parte)), default=-1)
+                else:
+                    maior = max((int(b.index.max()) for b in csv_backend._blocos(parte) if len(b)), default=-1)
+                atual = max(atual, maior)
+        seq.write_text(str(atual + quantidade))
+    return atual + 1
+
+def _acompanhar_sequencia(csv_path: Path, maior_id: int):
+    """Garante que a sequência nunca fique atrás dos IDs gravados por um salvamento completo"""
+    seq = _caminho_sequencia(csv_path)
+    with trava_arquivo(seq):
+        if not seq.exists() or int(seq.read_text() or -1) < maior_id:
+            seq.write_text(str(maior_id))
+
+def anexar_registros(registros: list, csv_path: Path, xlsx_path: Path, cols: list) -> list:
+    """Acrescenta registros ao journal sem reescrever o snapshot; retorna os IDs atribuídos"""
+    journal = caminho_journal(csv_path)
+    with _trava_journal, trava_arquivo(csv_path):
+        if csv_path not in _pendentes_journal:
+            _pendentes_journal[csv_path] = _contar_pendentes(journal)
+        novo = not journal.exists() or journal.stat().st_size == 0
+        primeiro = proximo_id(csv_path, len(registros))
+        with open(journal, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["id", *cols])
+            if novo:
+                writer.writeheader()
+            writer.writerows({"id": primeiro + i, **registro} for i, registro in enumerate(registros))
+        _pendentes_journal[csv_path] += len(registros)
+        pendentes = _pendentes_journal[csv_path]
+    if pendentes >= LIMITE_JOURNAL:
+        threading.Thread(target=compactar_journal, args=(csv_path, xlsx_path, cols), daemon=True).start()
+    return list(range(primeiro, primeiro + len(registros)))
+
+@medido("compactar_journal")
+def compactar_journal(csv_path: Path, xlsx_path: Path, cols=None) -> bool:
+    """Incorpora o journal pendente ao snapshot CSV/XLSX"""
+    # Numa partição mensal, a assinatura que os caches guardam é a do conjunto inteiro.
+    # A raiz é travada antes da partição, na mesma ordem de _reescrever: os derivados
+    # renovados abaixo travam a raiz de novo
+    raiz = _raiz_particao(csv_path)
+    with _trava_journal, trava_arquivo(raiz), trava_arquivo(csv_path):
+        if not caminho_journal(csv_path).exists():
+            return False
+        try:
+            antes = assinatura_dataset(raiz)
+            csv_backend = ArmazenamentoCSV()
+            csv_backend.salvar(csv_backend.carregar(csv_path, cols), csv_path, xlsx_path)
+            _compactacoes[raiz] = (antes, assinatura_dataset(raiz))
+            if raiz == ARQ_ALUNOS:
+                analise_uso().renovar_assinatura(antes)
+            elif raiz == ARQ_REL:
+                indice_relatorios().renovar_assinatura(antes)
+            return True
+        except Exception as e:
+            _instrumentacao.erro_engolido("compactar_journal", e)
+            return False
+
+# Última compactação de cada conjunto: (assinatura antes, depois). O conteúdo não muda,
+# então quem tinha os dados da versão "antes" em cache pode adotar a "depois"
+_compactacoes = {}
+
+@atexit.register
+def _finalizar_ao_sair():
+    """Espera as exportações pendentes (a não ser que XLSX_AO_SAIR esteja desligado) e faz o backup pendente
+
+    Os journais não são compactados aqui: isso fica para LIMITE_JOURNAL ou para
+    compactar_conjuntos, senão cada comando curto pagaria a reescrita do snapshot
+    """
+    if XLSX_AO_SAIR:
+        _exportador_xlsx.aguardar()
+    _agendador_backup.finalizar()
+
+def compactar_conjuntos() -> int:
+    """Compacta os journais pendentes de todos os conjuntos e espera os XLSX; retorna quantos
+
+    Feito para rodar agendado (cron, Agendador de Tarefas), fora do horário de aula
+    """
+    compactados = 0
+    for csv_path, xlsx_path, cols in ((ARQ_ALUNOS, ARQ_ALUNOS_XLSX, COLUNAS_ALUNOS), (ARQ_REL, ARQ_REL_XLSX, COLUNAS_REL),
+                                      (ARQ_AG, ARQ_AG_XLSX, COLUNAS_AG)):
+        for parte in partes_do_conjunto(csv_path):
+            compactados += compactar_journal(parte, parte.parent / xlsx_path.name, cols)
+    _exportador_xlsx.aguardar()
+    return compactados
+
+def validar_sessoes_em_lote(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Valida e calcula a duração de um lote de sessões com operações vetorizadas
+
+    Aplica as mesmas regras do cadastro interativo, sem a restrição de horário no
+    passado (as folhas de presença são sempre do próprio dia ou anteriores).
+    Retorna (aceitas, rejeitadas); as rejeitadas trazem a linha da planilha e os motivos
+    """
+    faltando = [c for c in ("pc", "nome", "data", "entrada", "saida") if c not in df.columns]
+    if faltando:
+        raise EntradaInvalida(f"Colunas ausentes na planilha: {', '.join(faltando)}")
+    cfg = config_lab()
+    dados = df[["pc", "nome", "data", "entrada", "saida"]].astype("string").apply(lambda col: col.str.strip())
+    motivos = pd.DataFrame(index=df.index)
+
+    numero = dados["pc"].str.upper().str.replace("PC", "", regex=False).str.strip()
+    pc = "PC" + numero.str.zfill(2)
+    motivos["PC inválido"] = ~(numero.str.isdigit() & pc.isin(pcs_do_lab()))
+
+    nome = dados["nome"].str.replace(" ", "", regex=False)
+    motivos["Nome inválido"] = ~nome.str.isalpha().fillna(False)
+
+    # Aceita DD/MM/AAAA e o formato que o Excel devolve (AAAA-MM-DD ...)
+    data = pd.to_datetime(dados["data"], format="%d/%m/%Y", errors="coerce").fillna(
+        pd.to_datetime(dados["data"].str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+    )
+    motivos["Data inválida"] = data.isna()
+
+    horas = {}
+    for coluna, rotulo in (("entrada", "Entrada inválida (use HH:MM)"), ("saida", "Saída inválida (use HH:MM)")):
+        hora = pd.to_datetime(dados[coluna].str.slice(0, 5), format="%H:%M", errors="coerce")
+        motivos[rotulo] = hora.isna()
+        horas[coluna] = hora.dt.hour * 60 + hora.dt.minute
+
+    abertura, fechamento = _minutos(cfg["abertura"]), _minutos(cfg["fechamento"])
+    fora = pd.Series(False, index=df.index)
+    for minutos in horas.values():
+        fora |= (minutos < abertura) | (minutos > fechamento)
+    motivos[f"Horário fora do expediente ({cfg['abertura']} - {cfg['fechamento']})"] = fora
+
+    # Mesma regra de calcular_duracao: saída antes da entrada atravessa a meia-noite
+    duracao = (horas["saida"] - horas["entrada"]) % (24 * 60)
+    motivos["Tempo mínimo de uso é 30 minutos"] = duracao < 30
+
+    motivos = motivos.fillna(False).astype(bool)
+    rejeitada = motivos.any(axis=1)
+
+    aceitas = pd.DataFrame({
+        "pc": pc,
+        "nome": dados["nome"].str.title(),
+        "data": data.dt.strftime("%d/%m/%Y"),
+        "entrada": _hhmm_vetorizado(horas["entrada"]),
+        "saida": _hhmm_vetorizado(horas["saida"]),
+        "duracao": _hhmm_vetorizado(duracao)
+    })[~rejeitada]
+
+    ruins = motivos[rejeitada]
+    rejeitadas = pd.DataFrame({
+        "linha": ruins.index + 2,  # cabeçalho ocupa a linha 1 da planilha
+        "motivos": ruins.dot(ruins.columns + "; ").str.rstrip("; ")
+    })
+    return aceitas[COLUNAS_ALUNOS], rejeitadas
+
+def _hhmm_vetorizado(minutos: pd.Series) -> pd.Series:
+    m = minutos.fillna(0).astype(int)
+    return (m // 60).astype(str).str.zfill(2) + ":" + (m % 60).astype(str).str.zfill(2)
+
+def importar_sessoes(caminho: Path) -> tuple[int, pd.DataFrame]:
+    """Importa uma folha de presença (CSV/XLSX) numa única gravação e um único backup
+
+    Retorna a quantidade de sessões aceitas e as linhas rejeitadas com os motivos
+    """
+    if caminho.suffix.lower() in (".xlsx", ".xls"):
+        df = pd.read_excel(caminho, dtype=str)
+    else:
+        df = pd.read_csv(caminho, dtype=str, sep=None, engine="python")
+    df.columns = df.columns.str.strip().str.lower()
+    # Linhas totalmente vazias no fim da planilha são ignoradas (o índice preserva a numeração)
+    df = df.dropna(how="all")
+    aceitas, rejeitadas = validar_sessoes_em_lote(df)
+    if not aceitas.empty:
+        registros = aceitas.to_dict("records")
+        inserir_sessoes(registros)
+        solicitar_backup()
+    return len(aceitas), rejeitadas
+
+class DerivadoPersistido(ABC):
+    """Estrutura derivada de um conjunto de dados, guardada em JSON com a assinatura do conjunto que reflete
+
+    Quem grava no conjunto atualiza a estrutura na mesma operação; se o conjunto
+    mudar por outro caminho, a assinatura deixa de bater e a estrutura é reconstruída.
+    As atualizações incrementais são acrescentadas como deltas numerados a um log
+    (<arquivo>.journal.jsonl); o JSON inteiro só é regravado ao reconstruir ou a cada
+    LIMITE_LOG_DERIVADO deltas, e os deltas que ele já inclui são pulados ao reler o log
+    """
+
+    def __init__(self, arquivo: Path, csv_path: Path):
+        self.arquivo = arquivo
+        self.log = arquivo.with_name(f"{arquivo.stem}.journal.jsonl")
+        self.csv_path = csv_path
+        self.dados = None
+        self._mtime = None
+        self._versao_log = None
+        self._ultimo_delta = 0
+        self._deltas_no_log = 0
+        # Muda a cada alteração de `dados`; serve de chave para caches derivados deles
+        self.versao = 0
+        self.reconstrucoes = 0
+
+    @abstractmethod
+    def _vazio(self) -> dict:
+        """Conteúdo de `dados` para um conjunto sem registros"""
+
+    @abstractmethod
+    def _aplicar_delta(self, delta):
+        """Repete em `dados` uma alteração registrada com _registrar_delta"""
+
+    def _ler(self):
+        """Relê o JSON e o log apenas se outro terminal os alterou"""
+        try:
+            mtime = self.arquivo.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self.dados is None or mtime != self._mtime:
+            try:
+                self.dados = {**self._vazio(), **json.loads(self.arquivo.read_text(encoding="utf-8"))}
+            except Exception:
+                self.dados = self._vazio()
+            self._mtime = mtime
+            self._ultimo_delta = self.dados.get("ultimo_delta", 0)
+            self._versao_log = None
+            self.versao += 1
+        try:
+            st = self.log.stat()
+            versao_log = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            versao_log = None
+        if versao_log == self._versao_log:
+            return
+        # O log tem no máximo LIMITE_LOG_DERIVADO linhas: é relido inteiro e os deltas já aplicados são pulados
+        self._deltas_no_log = 0
+        if versao_log is not None:
+            with open(self.log, encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        entrada = json.loads(linha)
+                    except ValueError:
+                        continue  # linha cortada por uma gravação interrompida
+                    self._deltas_no_log += 1
+                    if entrada["n"] > self._ultimo_delta:
+                        self._aplicar_delta(entrada["delta"])
+                        self.dados["assinatura"] = entrada["assinatura"]
+                        self._ultimo_delta = entrada["n"]
+            self.versao += 1
+        self._versao_log = versao_log
+
+    def _gravar(self):
+        """Regrava o JSON inteiro, já com os deltas do log, e descarta o log"""
+        self.dados["assinatura"] = repr(assinatura_dataset(self.csv_path))
+        self.dados["ultimo_delta"] = self._ultimo_delta
+        temporario = _temporario(self.arquivo)
+        temporario.write_text(json.dumps(self.dados, ensure_ascii=False, default=_json_nativo), encoding="utf-8")
+        os.replace(temporario, self.arquivo)
+        self._mtime = self.arquivo.stat().st_mtime_ns
+        self.log.unlink(missing_ok=True)
+        self._versao_log = None
+        self._deltas_no_log = 0
+        self.versao += 1
+
+    def _registrar_delta(self, delta):
+        """Aplica `delta` a `dados` e o acrescenta ao log (quem chama segura _trava_conjunto e já chamou _ler)"""
+        self._aplicar_delta(delta)
+        self._ultimo_delta += 1
+        self.dados["assinatura"] = repr(assinatura_dataset(self.csv_path))
+        self.versao += 1
+        if self._deltas_no_log + 1 >= LIMITE_LOG_DERIVADO:
+            self._gravar()
+            return
+        linha = json.dumps({"n": self._ultimo_delta, "assinatura": self.dados["assinatura"], "delta": delta},
+                           ensure_ascii=False, default=_json_nativo)
+        with open(self.log, "a+b") as f:
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")  # uma linha cortada no fim não pode colar na próxima
+            f.write(linha.encode("utf-8") + b"\n")
+        st = self.log.stat()
+        self._versao_log = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self._deltas_no_log += 1
+
+    def _em_dia(self) -> bool:
+        return self.dados["assinatura"] == repr(assinatura_dataset(self.csv_path))
+
+    def renovar_assinatura(self, antes):
+        """Após uma reescrita que preserva o conteúdo (compactação), evita reconstruir à toa"""
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            if self.dados["assinatura"] == repr(antes):
+                self._gravar()
+
+class AnaliseUso(DerivadoPersistido):
+    """Agregados de uso do laboratório, atualizados a cada sessão gravada em vez de reprocessar o histórico
+
+    Os totais (em minutos) ficam em ARQ_ANALISE junto da assinatura do conjunto de
+    alunos que refletem, e cada gravação acrescenta ao log as sessões que entraram e
+    saíram; se o arquivo de alunos mudar por outro caminho, os agregados são
+    reconstruídos uma vez a partir dele
+    """
+
+    AGREGADOS = ("por_pc", "por_pc_mes", "por_dia", "por_semana", "mapa", "por_usuario", "uso_pc_hora")
+    CAMPOS = ("pc", "nome", "data", "entrada", "saida")  # o que _aplicar usa de cada sessão
+    DIAS_SEMANA = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+
+    def __init__(self, arquivo: Path = None, csv_path: Path = None):
+        super().__init__(arquivo or ARQ_ANALISE, csv_path or ARQ_ALUNOS)
+
+    def _vazio(self) -> dict:
+        return {"assinatura": None, "sessoes": 0, **{agregado: {} for agregado in self.AGREGADOS}}
+
+    @staticmethod
+    def fatias_por_hora(registro: dict) -> list:
+        """Divide uma sessão em (início da hora, minutos usados), inclusive quando passa da meia-noite"""
+        try:
+            dia = datetime.strptime(str(registro["data"]).strip(), "%d/%m/%Y")
+            # Mesma leitura do esquema tipado usado por reconstruir: só HH:MM, segundos ignorados
+            inicio = datetime.combine(dia.date(), datetime.strptime(str(registro["entrada"]).strip()[:5], "%H:%M").time())
+            fim = datetime.combine(dia.date(), datetime.strptime(str(registro["saida"]).strip()[:5], "%H:%M").time())
+        except (KeyError, TypeError, ValueError):
+            return []
+        if fim < inicio:
+            fim += timedelta(days=1)
+        fatias = []
+        cursor = inicio
+        while cursor < fim:
+            hora = cursor.replace(minute=0, second=0, microsecond=0)
+            proxima = min(hora + timedelta(hours=1), fim)
+            fatias.append((hora, int((proxima - cursor).total_seconds() // 60)))
+            cursor = proxima
+        return fatias
+
+    def _somar(self, agregado: str, chave: str, minutos: int):
+        tabela = self.dados[agregado]
+        total = tabela.get(chave, 0) + minutos
+        if total:
+            tabela[chave] = total
+        else:
+            tabela.pop(chave, None)
+
+    def _aplicar(self, registro: dict, sinal: int):
+        fatias = self.fatias_por_hora(registro)
+        if not fatias:
+            return
+        pc, nome = registro.get("pc"), registro.get("nome")
+        pc = pc.strip() if isinstance(pc, str) else ""
+        nome = nome.strip() if isinstance(nome, str) else ""
+        self.dados["sessoes"] += sinal
+        for hora, minutos in fatias:
+            dia = hora.strftime("%Y-%m-%d")
+            ano, semana, _ = hora.isocalendar()
+            for agregado, chave in (
+                ("por_pc", pc),
+                ("por_pc_mes", f"{pc}|{hora:%Y-%m}"),
+                ("por_dia", dia),
+                ("por_semana", f"{ano}-S{semana:02d}"),
+                ("mapa", f"{hora.weekday()}|{hora:%H}"),
+                ("por_usuario", nome),
+                ("uso_pc_hora", f"{dia}|{pc}|{hora:%H}"),
+            ):
+                self._somar(agregado, chave, sinal * minutos)
+
+    def _aplicar_delta(self, delta):
+        for registro in delta["antigos"]:
+            self._aplicar(registro, -1)
+        for registro in delta["novos"]:
+            self._aplicar(registro, 1)
+
+    def reconstruir(self):
+        """Recalcula todos os agregados a partir do conjunto de alunos"""
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            self.dados = self._vazio()
+            fatias = self.fatias_vetorizadas(carregar_tipado(self.csv_path))
+            self.dados["sessoes"] = int(fatias["sessao"].nunique())
+            if not fatias.empty:
+                # Agrupa por chaves numéricas e só formata as chaves dos grupos resultantes
+                hora = fatias["hora"]
+                dia = hora.dt.normalize()
+                iso = hora.dt.isocalendar()
+                dias = {d: d.strftime("%Y-%m-%d") for d in dia.unique()}
+                grupos = {
+                    "por_pc": ([fatias["pc"]], lambda pc: pc),
+                    "por_pc_mes": ([fatias["pc"], hora.dt.year, hora.dt.month], lambda pc, a, m: f"{pc}|{a}-{m:02d}"),
+                    "por_dia": ([dia], lambda d: dias[d]),
+                    "por_semana": ([iso["year"], iso["week"]], lambda a, s: f"{a}-S{s:02d}"),
+                    "mapa": ([hora.dt.weekday, hora.dt.hour], lambda d, h: f"{d}|{h:02d}"),
+                    "por_usuario": ([fatias["nome"]], lambda nome: nome),
+                    "uso_pc_hora": ([dia, fatias["pc"], hora.dt.hour], lambda d, pc, h: f"{dias[d]}|{pc}|{h:02d}"),
+                }
+                for agregado, (chaves, formatar) in grupos.items():
+                    totais = fatias["minutos"].groupby(chaves).sum()
+                    self.dados[agregado] = {
+                        formatar(*(k if isinstance(k, tuple) else (k,))): int(v) for k, v in totais.items() if v
+                    }
+            self.reconstrucoes += 1
+            self._gravar()
+
+    @staticmethod
+    def fatias_vetorizadas(df: pd.DataFrame) -> pd.DataFrame:
+        """Mesma divisão de fatias_por_hora, sobre todo o histórico tipado de uma vez"""
+        validas = df[df["data"].notna() & df["entrada"].notna() & df["saida"].notna()]
+        duracao = ((validas["saida"] - validas["entrada"]) % (24 * 60)).astype("int64")
+        validas, duracao = validas[duracao > 0], duracao[duracao > 0]
+        entrada = validas["entrada"].astype("int64")
+        inicio = validas["data"] + pd.to_timedelta(entrada, unit="m")
+        fim = inicio + pd.to_timedelta(duracao, unit="m")
+        quantidade = ((entrada % 60 + duracao + 59) // 60).to_numpy()
+        posicoes = pd.RangeIndex(len(validas)).repeat(quantidade)
+        ordem = pd.Series(posicoes).groupby(posicoes).cumcount().to_numpy()
+        hora = inicio.dt.floor("h").iloc[posicoes].reset_index(drop=True) + pd.to_timedelta(ordem, unit="h")
+        de = pd.concat([inicio.iloc[posicoes].reset_index(drop=True), hora], axis=1).max(axis=1)
+        ate = pd.concat([fim.iloc[posicoes].reset_index(drop=True), hora + pd.Timedelta(hours=1)], axis=1).min(axis=1)
+        return pd.DataFrame({
+            "sessao": posicoes,
+            "hora": hora,
+            "minutos": ((ate - de).dt.total_seconds() // 60).astype("int64"),
+            "pc": validas["pc"].astype(object).fillna("").to_numpy()[posicoes],
+            "nome": validas["nome"].astype(object).fillna("").to_numpy()[posicoes],
+        })
+
+    def _alterar(self, gravar, antigos: list, novos: list):
+        """Executa a gravação e aplica só a diferença; se os agregados estavam defasados, reconstrói"""
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            em_dia = self._em_dia()
+            resultado = gravar()
+            if not em_dia:
+                self.reconstruir()
+                return resultado
+            self._registrar_delta({
+                "antigos": [{c: registro.get(c) for c in self.CAMPOS} for registro in antigos],
+                "novos": [{c: registro.get(c) for c in self.CAMPOS} for registro in novos],
+            })
+            return resultado
+
+    def registrar(self, registros: list, gravar):
+        """Grava novas sessões via `gravar()` e soma-as aos agregados"""
+        return self._alterar(gravar, [], registros)
+
+    def atualizar(self, antigo: dict, novo: dict, gravar):
+        """Grava a edição de uma sessão e troca a contribuição antiga pela nova"""
+        return self._alterar(gravar, [antigo], [novo])
+
+    def remover(self, antigos: list, gravar):
+        """Grava a exclusão de sessões e desconta-as dos agregados"""
+        return self._alterar(gravar, antigos, [])
+
+    def _atuais(self) -> dict:
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            if not self._em_dia():
+                self.reconstruir()
+            return self.dados
+
+    @staticmethod
+    def _horas(minutos) -> float:
+        return round(minutos / 60, 2)
+
+    def horas_por_pc(self, mes: str = None) -> pd.DataFrame:
+        """Horas de uso por PC; `mes` no formato AAAA-MM restringe ao mês"""
+        dados = self._atuais()
+        if mes:
+            linhas = [(chave.split("|")[0], m) for chave, m in dados["por_pc_mes"].items() if chave.endswith(f"|{mes}")]
+        else:
+            linhas = list(dados["por_pc"].items())
+        return pd.DataFrame(
+            [(pc, self._horas(m)) for pc, m in sorted(linhas)], columns=["pc", "horas"]
+        )
+
+    def horas_por_dia(self, data_inicio: str = None, data_fim: str = None) -> pd.DataFrame:
+        """Horas de uso por dia, opcionalmente dentro de um intervalo DD/MM/AAAA"""
+        inicio = datetime.strptime(data_inicio, "%d/%m/%Y").strftime("%Y-%m-%d") if data_inicio else ""
+        fim = datetime.strptime(data_fim, "%d/%m/%Y").strftime("%Y-%m-%d") if data_fim else "9999"
+        linhas = [
+            (datetime.strptime(dia, "%Y-%m-%d").strftime("%d/%m/%Y"), self._horas(m))
+            for dia, m in sorted(self._atuais()["por_dia"].items()) if inicio <= dia <= fim
+        ]
+        return pd.DataFrame(linhas, columns=["data", "horas"])
+
+    def horas_por_semana(self) -> pd.DataFrame:
+        """Horas de uso por semana ISO"""
+        linhas = [(semana, self._horas(m)) for semana, m in sorted(self._atuais()["por_semana"].items())]
+        return pd.DataFrame(linhas, columns=["semana", "horas"])
+
+    def mapa_ocupacao(self) -> pd.DataFrame:
+        """Horas de uso acumuladas por hora do dia (linhas) e dia da semana (colunas)"""
+        mapa = self._atuais()["mapa"]
+        horas = sorted({chave.split("|")[1] for chave in mapa})
+        df = pd.DataFrame(0.0, index=[f"{h}:00" for h in horas], columns=self.DIAS_SEMANA)
+        for chave, m in mapa.items():
+            dia, hora = chave.split("|")
+            df.loc[f"{hora}:00", self.DIAS_SEMANA[int(dia)]] = self._horas(m)
+        return df
+
+    def top_usuarios(self, quantidade: int = 10) -> pd.DataFrame:
+        """Usuários com mais horas de uso"""
+        ranking = sorted(self._atuais()["por_usuario"].items(), key=lambda item: -item[1])[:quantidade]
+        return pd.DataFrame([(nome, self._horas(m)) for nome, m in ranking], columns=["nome", "horas"])
+
+    def agendado_vs_usado(self, servico: "AgendamentoService", data_inicio: str = None, data_fim: str = None) -> tuple[pd.DataFrame, dict]:
+        """Compara cada reserva com o uso registrado no PC durante o horário (granularidade de hora)"""
+        uso = self._atuais()["uso_pc_hora"]
+        reservas = servico.get_horarios_agendados(data_inicio, data_fim)
+        linhas = []
+        for reserva in reservas.to_dict("records"):
+            try:
+                dia = datetime.strptime(reserva["data"], "%d/%m/%Y").strftime("%Y-%m-%d")
+                inicio, fim = (_minutos(h.strip()) for h in reserva["horario"].split("-"))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            usados = sum(
+                uso.get(f"{dia}|{reserva['pc']}|{h:02d}", 0)
+                for h in range(inicio // 60, (fim - 1) // 60 + 1)
+            )
+            linhas.append({
+                "data": reserva["data"], "pc": reserva["pc"], "horario": reserva["horario"],
+                "professor": reserva["professor"], "minutos_usados": min(usados, fim - inicio),
+                "minutos_reservados": fim - inicio
+            })
+        detalhe = pd.DataFrame(linhas, columns=["data", "pc", "horario", "professor", "minutos_reservados", "minutos_usados"])
+        utilizadas = int((detalhe["minutos_usados"] > 0).sum())
+        resumo = {
+            "reservas": len(detalhe),
+            "utilizadas": utilizadas,
+            "taxa_utilizacao": utilizadas / len(detalhe) if len(detalhe) else 0.0,
+            "horas_reservadas": self._horas(int(detalhe["minutos_reservados"].sum())),
+            "horas_usadas_em_reservas": self._horas(int(detalhe["minutos_usados"].sum())),
+        }
+        return detalhe, resumo
+
+class AnaliseUsoRemota(AnaliseUso):
+    """Agregados de uso mantidos pelo servidor do laboratório (LAB_ARMAZENAMENTO=remoto)
+
+    O servidor os atualiza a cada gravação no conjunto de alunos; o terminal só os
+    consulta e não guarda cópia própria na pasta de trabalho
+    """
+
+    def _alterar(self, gravar, antigos: list, novos: list):
+        return gravar()
+
+    def renovar_assinatura(self, antes):
+        pass
+
+    def reconstruir(self):
+        self.dados = armazenamento().analise_uso(reconstruir=True)
+        self.reconstrucoes += 1
+
+    def _atuais(self) -> dict:
+        self.dados = armazenamento().analise_uso()
+        return self.dados
+
+_analise_uso = None
+
+def analise_uso() -> AnaliseUso:
+    """Agregados de uso compartilhados pelo processo"""
+    global _analise_uso
+    if _analise_uso is None:
+        _analise_uso = AnaliseUsoRemota() if ARMAZENAMENTO == "remoto" else AnaliseUso()
+    return _analise_uso
+
+PALAVRAS_VAZIAS = frozenset(
+    "ao aos as com da das de do dos em na nas no nos os ou para pela pelas pelo pelos por que se sem um uma umas uns".split()
+)
+
+def termos_busca(texto: str) -> list:
+    """Palavras do texto sem acentos e em minúsculas, na forma usada pelo índice de relatórios"""
+    sem_acentos = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return [t for t in re.findall(r"[a-z0-9]+", sem_acentos.casefold()) if len(t) > 1 and t not in PALAVRAS_VAZIAS]
+
+class IndiceRelatorios(DerivadoPersistido):
+    """Índice invertido dos relatórios (termo → IDs) sobre o texto, o professor e o usuário
+
+    Cada relatório novo entra no índice na mesma gravação, como um delta no log com
+    os seus termos; a busca não lê o texto dos relatórios, só os IDs da página exibida
+    """
+
+    COLUNAS = ("relatorio", "professor", "usuario")
+
+    def __init__(self, arquivo: Path = None, csv_path: Path = None):
+        super().__init__(arquivo or ARQ_INDICE_REL, csv_path or ARQ_REL)
+        self._ordenados = (-1, [])
+
+    def _vazio(self) -> dict:
+        return {"assinatura": None, "documentos": 0, "termos": {}}
+
+    def _postagem(self, id_registro: int, registro: dict) -> list:
+        """[ID, termos do relatório]"""
+        texto = " ".join(str(registro.get(c) or "") for c in self.COLUNAS)
+        return [int(id_registro), sorted(set(termos_busca(texto)))]
+
+    def _aplicar_delta(self, delta):
+        termos = self.dados["termos"]
+        for id_registro, termos_relatorio in delta:
+            for termo in termos_relatorio:
+                termos.setdefault(termo, []).append(id_registro)
+            self.dados["documentos"] += 1
+
+    def reconstruir(self):
+        """Reindexa todos os relatórios do conjunto"""
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            self.dados = self._vazio()
+            if dataset_existe(self.csv_path):
+                df = carregar_dataframe(self.csv_path, cols=COLUNAS_REL).fillna("")
+                self._aplicar_delta([self._postagem(i, registro) for i, registro in zip(df.index, df.to_dict("records"))])
+            self._gravar()
+            self.reconstrucoes += 1
+
+    def registrar(self, registros: list, gravar) -> list:
+        """Grava relatórios novos via `gravar()` (que retorna os IDs) e os acrescenta ao índice"""
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            em_dia = self._em_dia()
+            ids = gravar()
+            if not em_dia:
+                self.reconstruir()
+                return ids
+            self._registrar_delta([self._postagem(i, registro) for i, registro in zip(ids, registros)])
+            return ids
+
+    def _termos_ordenados(self) -> list:
+        # A lista ordenada permite achar por bisect todos os termos com um prefixo
+        if self._ordenados[0] != self.versao:
+            self._ordenados = (self.versao, sorted(self.dados["termos"]))
+        return self._ordenados[1]
+
+    def buscar(self, consulta: str) -> list:
+        """IDs dos relatórios com todas as palavras da consulta (cada uma como prefixo), do mais novo ao mais antigo"""
+        palavras = termos_busca(consulta)
+        if not palavras:
+            return []
+        with _trava_journal, _trava_conjunto(self.csv_path):
+            self._ler()
+            if not self._em_dia():
+                self.reconstruir()
+            termos, ordenados = self.dados["termos"], self._termos_ordenados()
+            encontrados = None
+            for palavra in palavras:
+                ids = set()
+                for i in range(bisect_left(ordenados, palavra), len(ordenados)):
+                    if not ordenados[i].startswith(palavra):
+                        break
+                    ids.update(termos[ordenados[i]])
+                encontrados = ids if encontrados is None else encontrados & ids
+                if not encontrados:
+                    return []
+        return sorted(encontrados, reverse=True)
+
+_indice_relatorios = None
+
+def indice_relatorios() -> IndiceRelatorios:
+    """Índice de busca dos relatórios compartilhado pelo processo"""
+    global _indice_relatorios
+    if _indice_relatorios is None:
+        _indice_relatorios = IndiceRelatorios()
+    return _indice_relatorios
+
+@medido("buscar_relatorios", linhas=lambda r, *a, **k: len(r[0]))
+def buscar_relatorios(consulta: str, pagina: int = 0, tamanho: int = TAMANHO_PAGINA) -> tuple[pd.DataFrame, int]:
+    """Uma página dos relatórios que casam com a consulta, mais novos primeiro, e o total encontrado"""
+    ids = indice_relatorios().buscar(consulta)
+    da_pagina = ids[pagina * tamanho:(pagina + 1) * tamanho]
+    if not da_pagina:
+        return pd.DataFrame(columns=COLUNAS_REL), len(ids)
+    # Só as linhas da página: no CSV a leitura é em blocos e o resto do arquivo não fica em memória
+    dados, _ = consultar_registros(ARQ_REL, {"ids": da_pagina}, 0, len(da_pagina))
+    return dados.reindex([i for i in da_pagina if i in dados.index]), len(ids)
+
+class IndiceSessoes:
+    """Sessões de alunos como intervalos em minutos absolutos, em baldes por PC e dia de entrada
+
+    Cada balde (inícios, fins, IDs) fica ordenado pelo início e só tem as sessões de um
+    PC num dia, então incluir, editar ou excluir acha o balde num dicionário e a posição
+    por bisect, e só desloca uma lista pequena. Sessões que passam da meia-noite terminam
+    no dia seguinte: a busca olha também os dias anteriores que a duração máxima do PC alcança
+    """
+    
+    def __init__(self, df: pd.DataFrame):
+        self.dias, self.duracao_max = {}, {}
+        inicio, fim = self.intervalos(df)
+        frame = pd.DataFrame({"pc": df["pc"].astype(object), "inicio": inicio, "fim": fim}).dropna()
+        frame = frame.astype({"inicio": "int64", "fim": "int64"}).sort_values(["pc", "inicio"], kind="stable")
+        dia = frame["inicio"] // 1440
+        # Um balde começa a cada troca de PC ou de dia na ordem (pc, início)
+        cortes = (frame["pc"].ne(frame["pc"].shift()) | dia.ne(dia.shift())).to_numpy().nonzero()[0].tolist()
+        pcs, inicios, fins, ids = frame["pc"].tolist(), frame["inicio"].tolist(), frame["fim"].tolist(), frame.index.tolist()
+        for de, ate in zip(cortes, cortes[1:] + [len(frame)]):
+            self.dias.setdefault(pcs[de], {})[inicios[de] // 1440] = (inicios[de:ate], fins[de:ate], ids[de:ate])
+        self.duracao_max = {pc: int(d) for pc, d in (frame["fim"] - frame["inicio"]).groupby(frame["pc"]).max().items()}
+    
+    @staticmethod
+    def intervalos(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+        """(início, fim) em minutos desde 01/01/1970 de cada sessão de um conjunto tipado"""
+        dias = (df["data"] - pd.Timestamp(0)).dt.days.astype("float64")
+        entrada = df["entrada"].astype("float64")
+        inicio = dias * 1440 + entrada
+        return inicio, inicio + (df["saida"].astype("float64") - entrada) % 1440
+    
+    @staticmethod
+    def intervalo(data: str, entrada: str, saida: str) -> tuple[int, int]:
+        """(início, fim) em minutos absolutos de uma sessão em texto"""
+        dias = (datetime.strptime(data, "%d/%m/%Y") - datetime(1970, 1, 1)).days
+        # Como no conjunto tipado, só HH:MM conta (segundos são ignorados)
+        entrada, saida = _minutos(entrada[:5]), _minutos(saida[:5])
+        inicio = dias * 1440 + entrada
+        return inicio, inicio + (saida - entrada) % 1440
+    
+    def _intervalo_registro(self, registro: dict):
+        try:
+            return self.intervalo(registro["data"], registro["entrada"], registro["saida"])
+        except (TypeError, ValueError, AttributeError):
+            return None  # sessão com data ou horário inválido, que o índice não guarda
+    
+    def adicionar(self, id_sessao: int, registro: dict):
+        """Inclui uma sessão gravada no balde do seu PC e dia, mantendo a ordem pelo início"""
+        intervalo = self._intervalo_registro(registro)
+        if intervalo is None:
+            return
+        inicio, fim = intervalo
+        pc = registro["pc"]
+        inicios, fins, ids = self.dias.setdefault(pc, {}).setdefault(inicio // 1440, ([], [], []))
+        # Depois das sessões com o mesmo início, como a ordenação estável da construção
+        posicao = bisect_right(inicios, inicio)
+        inicios.insert(posicao, inicio)
+        fins.insert(posicao, fim)
+        ids.insert(posicao, id_sessao)
+        self.duracao_max[pc] = max(self.duracao_max.get(pc, 0), fim - inicio)
+    
+    def remover(self, id_sessao: int, registro: dict):
+        """Retira uma sessão pelo ID; `registro` são os valores com que ela foi indexada"""
+        dias = self.dias.get(registro["pc"])
+        if not dias:
+            return
+        intervalo = self._intervalo_registro(registro)
+        # Sem intervalo válido não se sabe o dia: procura em todos os baldes do PC
+        for dia in ([intervalo[0] // 1440] if intervalo else list(dias)):
+            inicios, fins, ids = dias.get(dia, ([], [], []))
+            de, ate = (bisect_left(inicios, intervalo[0]), bisect_right(inicios, intervalo[0])) if intervalo else (0, len(ids))
+            for posicao in range(de, ate):
+                if ids[posicao] == id_sessao:
+                    del inicios[posicao], fins[posicao], ids[posicao]
+                    if not ids:
+                        del dias[dia]
+                    # duracao_max continua um limite superior válido, então não precisa ser recalculada
+                    return
+    
+    def sobrepostas(self, pc: str, inicio: int, fim: int, ignorar: int = None) -> list:
+        """IDs das sessões do PC que se sobrepõem a [inicio, fim), pela ordem de início"""
+        dias = self.dias.get(pc)
+        if not dias:
+            return []
+        # Só sessões que começam depois de inicio - duração máxima podem alcançar o intervalo
+        desde = inicio - self.duracao_max[pc]
+        sobrepostas = []
+        for dia in range(desde // 1440, (fim - 1) // 1440 + 1):
+            if dia not in dias:
+                continue
+            inicios, fins, ids = dias[dia]
+            de, ate = bisect_right(inicios, desde), bisect_left(inicios, fim)
+            sobrepostas.extend(ids[i] for i in range(de, ate) if fins[i] > inicio and ids[i] != ignorar)
+        return sobrepostas
+    
+    def auditar(self) -> list:
+        """Todos os pares sobrepostos (pc, id_a, id_b, minutos) numa varredura por PC"""
+        pares = []
+        for pc, dias in self.dias.items():
+            # Sessões ainda abertas no ponto da varredura, pela ordem de término
+            abertas = []
+            for inicio, fim, id_sessao in (sessao for dia in sorted(dias) for sessao in zip(*dias[dia])):
+                while abertas and abertas[0][0] <= inicio:
+                    heapq.heappop(abertas)
+                for fim_aberta, id_aberta in abertas:
+                    pares.append((pc, id_aberta, id_sessao, min(fim, fim_aberta) - inicio))
+                heapq.heappush(abertas, (fim, id_sessao))
+        return pares
+
+_indice_sessoes = (None, None)
+
+def indice_sessoes() -> IndiceSessoes:
+    """Índice de intervalos das sessões, reconstruído só quando o conjunto de alunos muda"""
+    global _indice_sessoes
+    assinatura = assinatura_dataset(ARQ_ALUNOS)
+    guardada, indice = _indice_sessoes
+    if indice is not None and (assinatura == guardada or _compactacoes.get(ARQ_ALUNOS) == (guardada, assinatura)):
+        _indice_sessoes = (assinatura, indice)
+        return indice
+    indice = IndiceSessoes(carregar_tipado(ARQ_ALUNOS))
+    _indice_sessoes = (assinatura, indice)
+    return indice
+
+def _gravar_sessoes(gravar, linhas: int, aplicar):
+    """Executa `gravar()` e repete a alteração no índice de sessões em memória com `aplicar(indice, resultado)`
+
+    Como em renovar_assinatura, o índice só adota a nova assinatura se estava em dia com
+    a anterior e a mudança foi só esta gravação de `linhas` linhas; senão é descartado
+    """
+    global _indice_sessoes
+    with _trava_journal, _trava_conjunto(ARQ_ALUNOS):
+        antes = assinatura_dataset(ARQ_ALUNOS)
+        resultado = gravar()
+        guardada, indice = _indice_sessoes
+        if indice is not None:
+            depois = assinatura_dataset(ARQ_ALUNOS)
+            if (guardada == antes or _compactacoes.get(ARQ_ALUNOS) == (guardada, antes)) and \
+                    armazenamento().so_gravacao_propria(ARQ_ALUNOS, antes, depois, linhas):
+                aplicar(indice, resultado)
+                _indice_sessoes = (depois, indice)
+            else:
+                _indice_sessoes = (None, None)
+    return resultado
+
+def inserir_sessoes(registros: list) -> list:
+    """Grava sessões de alunos atualizando os agregados de uso e o índice de intervalos; retorna os IDs"""
+    def aplicar(indice, ids):
+        for id_sessao, registro in zip(ids, registros):
+            indice.adicionar(id_sessao, registro)
+    return analise_uso().registrar(registros, lambda: _gravar_sessoes(
+        lambda: inserir_registros(registros, ARQ_ALUNOS, ARQ_ALUNOS_XLSX, COLUNAS_ALUNOS), len(registros), aplicar
+    ))
+
+def atualizar_sessao(idx: int, antigo: dict, campos: dict):
+    """Grava a edição de uma sessão atualizando os agregados de uso e o índice de intervalos"""
+    def aplicar(indice, _):
+        indice.remover(idx, antigo)
+        indice.adicionar(idx, {**antigo, **campos})
+    analise_uso().atualizar(antigo, {**antigo, **campos}, lambda: _gravar_sessoes(
+        lambda: atualizar_registros(ARQ_ALUNOS, ARQ_ALUNOS_XLSX, {idx: campos}), 1, aplicar
+    ))
+
+def excluir_sessoes(registros: dict):
+    """Exclui as sessões {ID: registro} atualizando os agregados de uso e o índice de intervalos"""
+    def aplicar(indice, _):
+        for idx, registro in registros.items():
+            indice.remover(idx, registro)
+    analise_uso().remover(list(registros.values()), lambda: _gravar_sessoes(
+        lambda: excluir_registros(ARQ_ALUNOS, ARQ_ALUNOS_XLSX, list(registros)), len(registros), aplicar
+    ))
+
+def sessoes_sobrepostas(pc: str, data: str, entrada: str, saida: str, ignorar: int = None) -> pd.DataFrame:
+    """Sessões já registradas no PC que se sobrepõem à informada; `ignorar` é o ID em edição"""
+    ids = indice_sessoes().sobrepostas(pc, *IndiceSessoes.intervalo(data, entrada, saida), ignorar)
+    registros = {i: dict(r) for i, r in ((i, buscar_registro(ARQ_ALUNOS, i)) for i in ids) if r is not None}
+    return pd.DataFrame.from_dict(registros, orient="index", columns=COLUNAS_ALUNOS)
+
+@medido("auditar_sobreposicoes", linhas=lambda r, *a, **k: len(r))
+def auditar_sobreposicoes() -> pd.DataFrame:
+    """Pares de sessões do mesmo PC com horários sobrepostos em todo o histórico"""
+    pares = pd.DataFrame(indice_sessoes().auditar(), columns=["pc", "id_a", "id_b", "minutos"])
+    if pares.empty:
+        return pares
+    alunos = carregar_dataframe(ARQ_ALUNOS, cols=COLUNAS_ALUNOS)[["nome", "data", "entrada", "saida"]]
+    for lado in ("a", "b"):
+        pares = pares.join(alunos.add_suffix(f"_{lado}"), on=f"id_{lado}")
+    return pares.sort_values(["pc", "id_a", "id_b"], ignore_index=True)
+
+def pedir_filtros_alunos() -> dict:
+    """Pergunta os filtros da listagem de alunos; em branco não filtra"""
+    filtros = {}
+    print("\nFiltros (deixe em branco para não filtrar):")
+    pc = input("PC (ex: 05): ").strip().upper().replace("PC", "")
+    if pc:
+        if validar_numero(pc):
+            filtros["pc"] = f"PC{pc.zfill(2)}"
+        else:
+            msg("PC inválido, filtro ignorado.", "warn")
+    nome = input("Nome começando com: ").strip()
+    if nome:
+        filtros["nome"] = nome
+    for chave, rotulo in (("data_inicio", "De (DD/MM/AAAA): "), ("data_fim", "Até (DD/MM/AAAA): ")):
+        valor = input(rotulo).strip()
+        if valor:
+            data = validar_data(valor)
+            if data:
+                filtros[chave] = data
+            else:
+                msg("Data inválida, filtro ignorado.", "warn")
+    return filtros
+
+def listar_alunos_paginado(filtros: dict):
+    """Mostra os registros filtrados página a página, lendo só a página exibida"""
+    pagina = 0
+    while True:
+        dados, total = consultar_registros(ARQ_ALUNOS, filtros, pagina)
+        if total == 0:
+            msg("Nenhum aluno encontrado.", "warn")
+            return
+        paginas = (total + TAMANHO_PAGINA - 1) // TAMANHO_PAGINA
+        print("\n=== Alunos Cadastrados ===")
+        print(tabulate(dados, headers=["ID", *dados.columns], tablefmt="grid", showindex=True))
+        print(f"Página {pagina + 1} de {paginas} ({total} registro(s))")
+        acao = input("[P]róxima, [A]nterior ou [S]air: ").strip().lower()
+        if acao == "p" and pagina + 1 < paginas:
+            pagina += 1
+        elif acao == "a" and pagina > 0:
+            pagina -= 1
+        elif acao in ("s", ""):
+            return
 
-def carregar_dataframe(path: Path, cols=None):
-    if not path.exists():
-        if cols:
-            return pd.DataFrame(columns=cols)
-        return pd.DataFrame()
-    try:
-        return pd.read_csv(path)
-    except Exception:
-        return pd.DataFrame()
+def pedir_id_aluno(acao: str):
+    """Pede o ID estável de um registro, permitindo listar antes de escolher"""
+    while True:
+        resposta = input(f"Digite o ID do registro que deseja {acao} (L para listar): ").strip()
+        if resposta.lower() == "l":
+            listar_alunos_paginado(pedir_filtros_alunos())
+            continue
+        try:
+            return int(resposta)
+        except ValueError:
+            msg("Entrada inválida.", "warn")
+            return None
+
+def confirmar_sobreposicao(pc: str, data: str, entrada: str, saida: str, ignorar: int = None) -> bool:
+    """Mostra as sessões do PC que colidem com a informada e pergunta se grava mesmo assim"""
+    conflitos = sessoes_sobrepostas(pc, data, entrada, saida, ignorar)
+    if conflitos.empty:
+        return True
+    msg(f"{pc} já tem sessão(ões) registrada(s) nesse intervalo:", "warn")
+    print(tabulate(conflitos, headers=["ID", *conflitos.columns], tablefmt="grid", showindex=True))
+    return confirmar_sn("Deseja gravar mesmo assim?") == "s"
 
 def menu_computadores(usuario_logado: str):
     while True:
@@ -323,14 +3763,16 @@ def menu_computadores(usuario_logado: str):
         print("2 - Consultar alunos cadastrados")
         print("3 - Editar aluno")
         print("4 - Excluir aluno")
-        print("5 - Voltar ao menu principal")
+        print("5 - Importar sessões de planilha (CSV/XLSX)")
+        print("6 - Auditar sessões sobrepostas")
+        print("7 - Voltar ao menu principal")
         escolha = input("Escolha uma opção: ").strip()
 
         if escolha == "1":
             numero_pc = pedir_validado("Digite o número do PC (ex: 01, 02...): ", validar_numero)
             
             if not validar_pc_existente(numero_pc):
-                msg("Número de PC inválido. Use números de 01 a 20.", "err")
+                msg(f"Número de PC inválido. Use números de 01 a {config_lab()['pcs']:02d}.", "err")
                 continue
                 
             pc = f"PC{numero_pc.zfill(2)}"
@@ -383,156 +3825,456 @@ def menu_computadores(usuario_logado: str):
                 if confirmar_sn("Deseja continuar mesmo assim?") == "n":
                     continue
 
+            if not confirmar_sobreposicao(pc, data, entrada, saida):
+                continue
+
             duracao = calcular_duracao(data, entrada, saida)
 
-            novo_registro = pd.DataFrame([{
+            novo_registro = {
                 "pc": pc,
                 "nome": nome,
                 "data": data,
                 "entrada": entrada,
                 "saida": saida,
                 "duracao": duracao
-            }])
-
-            df = carregar_dataframe(ARQ_ALUNOS, cols=["pc", "nome", "data", "entrada", "saida", "duracao"])
-            if not df.empty:
-                df = pd.concat([df, novo_registro], ignore_index=True)
-            else:
-                df = novo_registro
+            }
 
-            salvar_csv_xlsx(df, ARQ_ALUNOS, ARQ_ALUNOS_XLSX)
-            criar_backup()
+            inserir_sessoes([novo_registro])
+            solicitar_backup()
             msg("Registro salvo com sucesso!", "ok")
 
         elif escolha == "2":
-            msg("Carregando dados dos alunos...", "info")
-            time.sleep(0.6)
-            dados = carregar_dataframe(ARQ_ALUNOS)
-            if dados.empty:
-                msg("Nenhum aluno cadastrado ainda.", "warn")
-            else:
-                print("\n=== Alunos Cadastrados ===")
-                print(tabulate(dados, headers="keys", tablefmt="grid", showindex=True))
+            listar_alunos_paginado(pedir_filtros_alunos())
 
         elif escolha == "3":
-            if not ARQ_ALUNOS.exists():
+            if not dataset_existe(ARQ_ALUNOS):
                 msg("Nenhum arquivo encontrado para edição.", "warn")
                 continue
-            dados = carregar_dataframe(ARQ_ALUNOS)
-            if dados.empty:
-                msg("Nenhum aluno cadastrado para editar.", "warn")
-                continue
-            print("\nAlunos cadastrados:")
-            print(tabulate(dados, headers="keys", tablefmt="grid", showindex=True))
-            try:
-                idx = int(input("Digite o índice do aluno que deseja editar: ").strip())
-            except Exception:
-                msg("Entrada inválida.", "warn")
+            idx = pedir_id_aluno("editar")
+            if idx is None:
                 continue
-            if idx not in dados.index:
-                msg("Índice inválido.", "warn")
+            registro = buscar_registro(ARQ_ALUNOS, idx)
+            if registro is None:
+                msg("ID inválido.", "warn")
                 continue
             print("\nDeixe em branco para não alterar.")
-            novo_pc = input(f"PC atual ({dados.loc[idx,'pc']}): ").strip()
+            novo_pc = input(f"PC atual ({registro['pc']}): ").strip()
             if novo_pc:
                 num = validar_numero(novo_pc.replace("PC", "").replace("pc", ""))
                 if num and validar_pc_existente(num):
                     novo_pc = f"PC{num.zfill(2)}"
                 else:
                     msg("Número de PC inválido. Mantendo valor anterior.", "warn")
-                    novo_pc = dados.loc[idx, "pc"]
+                    novo_pc = registro["pc"]
             else:
-                novo_pc = dados.loc[idx, "pc"]
+                novo_pc = registro["pc"]
 
-            novo_nome = input(f"Nome atual ({dados.loc[idx,'nome']}): ").strip()
+            novo_nome = input(f"Nome atual ({registro['nome']}): ").strip()
             if novo_nome:
                 valid = validar_nome(novo_nome)
-                novo_nome = valid if valid else dados.loc[idx, "nome"]
+                novo_nome = valid if valid else registro["nome"]
             else:
-                novo_nome = dados.loc[idx, "nome"]
+                novo_nome = registro["nome"]
 
-            nova_data = input(f"Data atual ({dados.loc[idx,'data']}): ").strip()
+            nova_data = input(f"Data atual ({registro['data']}): ").strip()
             if nova_data:
-                nova_data = validar_data(nova_data) or dados.loc[idx, "data"]
+                nova_data = validar_data(nova_data) or registro["data"]
             else:
-                nova_data = dados.loc[idx, "data"]
+                nova_data = registro["data"]
 
-            nova_entrada = input(f"Entrada atual ({dados.loc[idx,'entrada']}): ").strip()
+            nova_entrada = input(f"Entrada atual ({registro['entrada']}): ").strip()
             if nova_entrada:
-                nova_entrada = validar_hora(nova_entrada) or dados.loc[idx, "entrada"]
+                nova_entrada = validar_hora(nova_entrada) or registro["entrada"]
             else:
-                nova_entrada = dados.loc[idx, "entrada"]
+                nova_entrada = registro["entrada"]
 
-            nova_saida = input(f"Saída atual ({dados.loc[idx,'saida']}): ").strip()
+            nova_saida = input(f"Saída atual ({registro['saida']}): ").strip()
             if nova_saida:
-                nova_saida = validar_hora(nova_saida) or dados.loc[idx, "saida"]
+                nova_saida = validar_hora(nova_saida) or registro["saida"]
             else:
-                nova_saida = dados.loc[idx, "saida"]
+                nova_saida = registro["saida"]
 
-            duracao = calcular_duracao(nova_data, nova_entrada, nova_saida)
+            if not confirmar_sobreposicao(novo_pc, nova_data, nova_entrada, nova_saida, ignorar=idx):
+                msg("Edição cancelada.", "warn")
+                continue
 
-            dados.loc[idx, "pc"] = novo_pc
-            dados.loc[idx, "nome"] = novo_nome
-            dados.loc[idx, "data"] = nova_data
-            dados.loc[idx, "entrada"] = nova_entrada
-            dados.loc[idx, "saida"] = nova_saida
-            dados.loc[idx, "duracao"] = duracao
+            duracao = calcular_duracao(nova_data, nova_entrada, nova_saida)
 
-            salvar_csv_xlsx(dados, ARQ_ALUNOS, ARQ_ALUNOS_XLSX)
-            criar_backup()
+            campos = {
+                "pc": novo_pc,
+                "nome": novo_nome,
+                "data": nova_data,
+                "entrada": nova_entrada,
+                "saida": nova_saida,
+                "duracao": duracao
+            }
+            atualizar_sessao(idx, registro, campos)
+            solicitar_backup()
             msg("Registro atualizado com sucesso!", "ok")
 
         elif escolha == "4":
-            if not ARQ_ALUNOS.exists():
+            if not dataset_existe(ARQ_ALUNOS):
                 msg("Nenhum arquivo encontrado para exclusão.", "warn")
                 continue
-            dados = carregar_dataframe(ARQ_ALUNOS)
-            if dados.empty:
-                msg("Nenhum aluno cadastrado para excluir.", "warn")
-                continue
-            print("\nAlunos cadastrados:")
-            print(tabulate(dados, headers="keys", tablefmt="grid", showindex=True))
-            try:
-                idx = int(input("Digite o índice do aluno que deseja excluir: ").strip())
-            except Exception:
-                msg("Entrada inválida.", "warn")
+            idx = pedir_id_aluno("excluir")
+            if idx is None:
                 continue
-            if idx not in dados.index:
-                msg("Índice inválido.", "warn")
+            registro = buscar_registro(ARQ_ALUNOS, idx)
+            if registro is None:
+                msg("ID inválido.", "warn")
                 continue
-            if confirmar_sn(f"Tem certeza que deseja excluir o registro de {dados.loc[idx,'nome']} no dia {dados.loc[idx,'data']}?") == "s":
+            if confirmar_sn(f"Tem certeza que deseja excluir o registro de {registro['nome']} no dia {registro['data']}?") == "s":
                 msg("Apagando registro...", "info")
                 time.sleep(0.6)
-                dados = dados.drop(idx).reset_index(drop=True)
-                salvar_csv_xlsx(dados, ARQ_ALUNOS, ARQ_ALUNOS_XLSX)
-                criar_backup()
+                excluir_sessoes({idx: registro})
+                solicitar_backup()
                 msg("Registro excluído com sucesso!", "ok")
             else:
                 msg("Exclusão cancelada.", "warn")
 
         elif escolha == "5":
+            caminho = Path(input("Caminho da planilha: ").strip().strip('"'))
+            if not caminho.exists():
+                msg("Arquivo não encontrado.", "err")
+                continue
+            try:
+                aceitas, rejeitadas = importar_sessoes(caminho)
+            except Exception as e:
+                msg(f"Erro ao importar: {e}", "err")
+                continue
+            msg(f"{aceitas} sessão(ões) importada(s).", "ok" if aceitas else "warn")
+            if not rejeitadas.empty:
+                msg(f"{len(rejeitadas)} linha(s) rejeitada(s):", "warn")
+                print(tabulate(rejeitadas, headers="keys", tablefmt="grid", showindex=False))
+
+        elif escolha == "6":
+            pares = auditar_sobreposicoes()
+            if pares.empty:
+                msg("Nenhuma sessão sobreposta.", "ok")
+                continue
+            msg(f"{len(pares)} par(es) de sessões sobrepostas:", "warn")
+            print(tabulate(pares, headers="keys", tablefmt="grid", showindex=False))
+
+        elif escolha == "7":
             return
         else:
             msg("Opção inválida.", "warn")
 
+def salvar_relatorio(novo_rel: dict) -> int:
+    """Grava um relatório e o acrescenta ao índice de busca; retorna o ID"""
+    ids = indice_relatorios().registrar(
+        [novo_rel], lambda: [inserir_registro(novo_rel, ARQ_REL, ARQ_REL_XLSX, COLUNAS_REL)]
+    )
+    solicitar_backup()
+    return ids[0]
+
 def gerar_relatorio(usuario_logado: str):
     print("\n=== RELATÓRIO DE AULA ===")
     professor = pedir_validado("Digite seu nome (professor): ", validar_nome)
     descricao = input("Digite o relatório da aula: ").strip()
     msg("Salvando relatório...", "info")
     time.sleep(0.6)
-    novo_rel = pd.DataFrame([{"professor": professor, "relatorio": descricao, "usuario": usuario_logado}])
-    df = carregar_dataframe(ARQ_REL, cols=["professor", "relatorio", "usuario"])
-    if not df.empty:
-        df = pd.concat([df, novo_rel], ignore_index=True)
-    else:
-        df = novo_rel
-    salvar_csv_xlsx(df, ARQ_REL, ARQ_REL_XLSX)
-    criar_backup()
+    novo_rel = {"professor": professor, "relatorio": descricao, "usuario": usuario_logado}
+    salvar_relatorio(novo_rel)
     msg("Relatório salvo com sucesso!", "ok")
 
+def paginar_relatorios(buscar_pagina, titulo: str):
+    """Mostra relatórios página a página; `buscar_pagina(pagina)` retorna (dados, total)"""
+    pagina = 0
+    while True:
+        dados, total = buscar_pagina(pagina)
+        if total == 0:
+            msg("Nenhum relatório encontrado.", "warn")
+            return
+        paginas = (total + TAMANHO_PAGINA - 1) // TAMANHO_PAGINA
+        print(f"\n=== {titulo} ===")
+        print(tabulate(dados, headers=["ID", *dados.columns], tablefmt="grid", showindex=True, maxcolwidths=[None, 20, 60, 12]))
+        print(f"Página {pagina + 1} de {paginas} ({total} relatório(s))")
+        acao = input("[P]róxima, [A]nterior ou [S]air: ").strip().lower()
+        if acao == "p" and pagina + 1 < paginas:
+            pagina += 1
+        elif acao == "a" and pagina > 0:
+            pagina -= 1
+        elif acao in ("s", ""):
+            return
+
+def menu_relatorios(usuario_logado: str):
+    while True:
+        print("\n=== RELATÓRIOS ===")
+        print("1 - Novo relatório de aula")
+        print("2 - Buscar relatórios")
+        print("3 - Listar relatórios")
+        print("4 - Voltar ao menu principal")
+        escolha = input("Escolha uma opção: ").strip()
+
+        if escolha == "1":
+            gerar_relatorio(usuario_logado)
+
+        elif escolha == "2":
+            consulta = input("Palavras a buscar (sem acento ou maiúsculas, ex: diretoria): ").strip()
+            if not termos_busca(consulta):
+                msg("Digite ao menos uma palavra com duas letras ou mais.", "warn")
+                continue
+            paginar_relatorios(lambda pagina: buscar_relatorios(consulta, pagina), f"Relatórios com \"{consulta}\"")
+
+        elif escolha == "3":
+            paginar_relatorios(lambda pagina: consultar_registros(ARQ_REL, {}, pagina), "Relatórios")
+
+        elif escolha == "4":
+            return
+        else:
+            msg("Opção inválida.", "warn")
+
+def pedir_data_agenda() -> str:
+    """Pede a data do agendamento; em branco usa a data de hoje"""
+    while True:
+        valor = input("Data (DD/MM/AAAA, em branco para hoje): ").strip()
+        if not valor:
+            return datetime.now().strftime("%d/%m/%Y")
+        data = validar_data(valor)
+        if data and datetime.strptime(data, "%d/%m/%Y").date() >= datetime.now().date():
+            return data
+        msg("Data inválida ou no passado.", "warn")
+
+def agendar_em_lote(agendamento_service: AgendamentoService, professor: str):
+    """Pede PCs, horários e recorrência e reserva todas as células numa única gravação"""
+    print("\nHorários do laboratório:")
+    print(tabulate([[h] for h in agendamento_service.horarios], headers=["Horário"], tablefmt="grid", showindex=True))
+    try:
+        horarios = [agendamento_service.horarios[int(i)] for i in input("Índices dos horários (separados por vírgula): ").split(",")]
+        pcs = [f"PC{n.strip().upper().replace('PC', '').zfill(2)}" for n in input("PCs (ex: 01,02,05): ").split(",")]
+    except (ValueError, IndexError):
+        msg("Formato inválido. Use os índices listados separados por vírgula.", "err")
+        return
+    data_inicio = pedir_data_agenda()
+    frequencia = {"1": None, "2": "diaria", "3": "semanal"}.get(
+        input("Repetição: 1 - nenhuma, 2 - diária, 3 - semanal: ").strip()
+    )
+    data_fim, dias_semana = None, None
+    if frequencia:
+        data_fim = pedir_validado("Repetir até (DD/MM/AAAA): ", validar_data)
+        if frequencia == "diaria" and confirmar_sn("Só dias úteis?") == "s":
+            dias_semana = [0, 1, 2, 3, 4]
+    try:
+        celulas = expandir_recorrencia([(pc, h) for pc in pcs for h in horarios], data_inicio, data_fim, frequencia, dias_semana)
+    except ValueError as e:
+        msg(str(e), "err")
+        return
+    if not celulas:
+        msg("Nenhuma data no período escolhido.", "warn")
+        return
+    tudo_ou_nada = confirmar_sn(f"{len(celulas)} reserva(s). Cancelar tudo se alguma falhar?") == "s"
+    
+    resultados = pd.DataFrame(agendamento_service.agendar_lote(celulas, professor, tudo_ou_nada))
+    reservadas = int(resultados["reservado"].sum())
+    if reservadas:
+        solicitar_backup()
+        msg(f"{reservadas} de {len(resultados)} reserva(s) realizada(s).", "ok")
+    else:
+        msg("Nenhuma reserva realizada.", "err")
+    falhas = resultados[~resultados["reservado"]]
+    if not falhas.empty:
+        print(tabulate(falhas[["data", "pc", "horario", "motivo"]], headers="keys", tablefmt="grid", showindex=False))
+
+def procurar_capacidade(agendamento_service: AgendamentoService, professor: str):
+    """Lista os slots com PCs livres suficientes para uma turma e oferece reservar a sugestão"""
+    minimo = pedir_validado("Quantos PCs a turma precisa? ", lambda v: int(v) if v.isdigit() and int(v) > 0 else None)
+    if minimo > len(agendamento_service.pcs):
+        msg(f"O laboratório tem só {len(agendamento_service.pcs)} PCs.", "warn")
+        return
+    data_inicio = pedir_data_agenda()
+    data_fim = validar_data(input("Até (DD/MM/AAAA, em branco para o mesmo dia): ").strip())
+    if data_fim and datetime.strptime(data_fim, "%d/%m/%Y") < datetime.strptime(data_inicio, "%d/%m/%Y"):
+        msg("A data final é anterior à inicial.", "warn")
+        return
+    adjacentes = confirmar_sn("Somente PCs vizinhos?") == "s"
+    slots = agendamento_service.buscar_capacidade(minimo, data_inicio, data_fim, adjacentes)
+    if not slots:
+        msg("Nenhum horário com PCs livres suficientes.", "warn")
+        return
+    tabela = pd.DataFrame(slots)
+    tabela["adjacentes"] = tabela["adjacentes"].map({True: "sim", False: "não"})
+    tabela["pcs"] = tabela["pcs"].map(", ".join)
+    print(tabulate(tabela.head(TAMANHO_PAGINA), headers="keys", tablefmt="grid", showindex=True))
+    if len(tabela) > TAMANHO_PAGINA:
+        msg(f"Mostrando {TAMANHO_PAGINA} de {len(tabela)} horários.", "info")
+    escolha = input("Número do horário para reservar os PCs sugeridos (Enter para voltar): ").strip()
+    if not escolha:
+        return
+    try:
+        slot = slots[int(escolha)]
+    except (ValueError, IndexError):
+        msg("Entrada inválida.", "warn")
+        return
+    resultados = agendamento_service.agendar_lote([(slot["data"], pc, slot["horario"]) for pc in slot["pcs"]], professor)
+    if all(r["reservado"] for r in resultados):
+        solicitar_backup()
+        msg(f"{len(resultados)} PC(s) reservado(s) em {slot['data']}, {slot['horario']}.", "ok")
+    else:
+        msg("Os PCs sugeridos não estão mais livres; nada foi reservado.", "err")
+
+class GradeAgenda:
+    """Agenda de um dia em tela cheia (curses): PCs nas colunas, horários nas linhas
+
+    Cada posição da tela guarda o que foi escrito nela, e só as células cujo texto ou
+    cor mudou são reescritas. A cada ATUALIZAR_MS sem tecla, a agenda é relida se a
+    assinatura mudou (reserva feita em outro terminal)
+    """
+
+    LARGURA = 6  # colunas de tela por PC, com o espaço separador
+    ROTULO = 15  # coluna dos horários
+    ATUALIZAR_MS = 500
+
+    def __init__(self, tela, servico: AgendamentoService, professor: str, admin: bool = False):
+        import curses
+        self.tela = tela
+        self.servico = servico
+        self.professor = professor
+        self.admin = admin
+        self.dia = datetime.now().date()
+        self.linha = self.coluna = 0
+        self.topo = self.esquerda = 0
+        self.indice = None
+        self.status = ""
+        self.na_tela = {}  # (y, x) -> (texto, atributo)
+        self.cores = {}
+        tela.timeout(self.ATUALIZAR_MS)
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        if curses.has_colors():
+            curses.use_default_colors()
+            for par, (tipo, cor) in enumerate((("livre", curses.COLOR_GREEN), ("minha", curses.COLOR_CYAN),
+                                               ("ocupada", curses.COLOR_RED)), start=1):
+                curses.init_pair(par, cor, -1)
+                self.cores[tipo] = curses.color_pair(par)
+
+    def _pintar(self, y: int, x: int, texto: str, atributo: int = 0):
+        """Escreve na posição só se ela mostra outra coisa"""
+        import curses
+        if self.na_tela.get((y, x)) == (texto, atributo):
+            return
+        self.na_tela[(y, x)] = (texto, atributo)
+        try:
+            self.tela.addstr(y, x, texto, atributo)
+        except curses.error:
+            # Escrever no último caractere da tela move o cursor para fora dela; o texto já foi escrito
+            pass
+
+    def _celula(self, data: str, pc: str, horario: str) -> tuple[str, str]:
+        ocupante = self.indice.ocupante(data, pc, horario)
+        if ocupante is None:
+            return ".", "livre"
+        if ocupante == self.professor:
+            return "EU", "minha"
+        return ocupante[:self.LARGURA - 2], "ocupada"
+
+    def desenhar(self):
+        import curses
+        altura, largura = self.tela.getmaxyx()
+        pcs, horarios = self.servico.pcs, self.servico.horarios
+        colunas = max((largura - self.ROTULO) // self.LARGURA, 1)
+        linhas = max(altura - 4, 1)
+        # Rolagem mínima para o cursor continuar visível
+        self.esquerda = max(min(self.esquerda, self.coluna, max(len(pcs) - colunas, 0)), self.coluna - colunas + 1)
+        self.topo = max(min(self.topo, self.linha, max(len(horarios) - linhas, 0)), self.linha - linhas + 1)
+        data = self.dia.strftime("%d/%m/%Y")
+        dia_semana = AnaliseUso.DIAS_SEMANA[self.dia.weekday()]
+        titulo = f"Agenda de {data} ({dia_semana})   setas: mover  Enter: reservar/liberar  < >: dia  t: hoje  q: sair"
+        self._pintar(0, 0, titulo[:largura - 1].ljust(largura - 1), curses.A_BOLD)
+        for j, pc in enumerate(pcs[self.esquerda:self.esquerda + colunas]):
+            self._pintar(1, self.ROTULO + j * self.LARGURA, pc.center(self.LARGURA - 1), curses.A_BOLD)
+        for i, horario in enumerate(horarios[self.topo:self.topo + linhas]):
+            self._pintar(2 + i, 0, horario.ljust(self.ROTULO), curses.A_BOLD)
+            for j, pc in enumerate(pcs[self.esquerda:self.esquerda + colunas]):
+                texto, tipo = self._celula(data, pc, horario)
+                atributo = self.cores.get(tipo, 0)
+                if (self.topo + i, self.esquerda + j) == (self.linha, self.coluna):
+                    atributo |= curses.A_REVERSE
+                self._pintar(2 + i, self.ROTULO + j * self.LARGURA, texto.center(self.LARGURA - 1), atributo)
+        pc, horario = pcs[self.coluna], horarios[self.linha]
+        ocupante = self.indice.ocupante(data, pc, horario)
+        detalhe = f"{pc}, {horario}: " + ("livre" if ocupante is None else f"reservado por {ocupante}")
+        self._pintar(altura - 2, 0, detalhe[:largura - 1].ljust(largura - 1))
+        self._pintar(altura - 1, 0, self.status[:largura - 1].ljust(largura - 1), curses.A_BOLD)
+        self.tela.refresh()
+
+    def alternar(self):
+        """Reserva a célula do cursor se estiver livre, ou a libera se for do usuário (admin libera qualquer uma)"""
+        data = self.dia.strftime("%d/%m/%Y")
+        pc, horario = self.servico.pcs[self.coluna], self.servico.horarios[self.linha]
+        if self.dia < datetime.now().date():
+            self.status = "Data no passado."
+            return
+        ocupante = self.indice.ocupante(data, pc, horario)
+        if ocupante is None:
+            feito = self.servico.agendar_horario(data, pc, horario, self.professor)
+            self.status = f"{pc}, {horario} reservado." if feito else f"{pc}, {horario} foi reservado em outro terminal."
+        elif ocupante == self.professor or self.admin:
+            feito = self.servico.cancelar_agendamento(data, pc, horario, None if self.admin else self.professor)
+            self.status = f"{pc}, {horario} liberado." if feito else f"Não foi possível liberar {pc}, {horario}."
+        else:
+            self.status = f"{pc}, {horario} é de {ocupante}."
+            return
+        if feito:
+            solicitar_backup()
+
+    def executar(self):
+        import curses
+        movimentos = {
+            curses.KEY_UP: (-1, 0), ord("k"): (-1, 0), curses.KEY_DOWN: (1, 0), ord("j"): (1, 0),
+            curses.KEY_LEFT: (0, -1), ord("h"): (0, -1), curses.KEY_RIGHT: (0, 1), ord("l"): (0, 1),
+        }
+        while True:
+            # Relê do disco só se a assinatura da agenda mudou
+            self.indice = self.servico.indice()
+            self.desenhar()
+            tecla = self.tela.getch()
+            if tecla == -1:
+                continue
+            if tecla in (ord("q"), ord("Q"), 27):
+                return
+            if tecla in movimentos:
+                dl, dc = movimentos[tecla]
+                self.linha = min(max(self.linha + dl, 0), len(self.servico.horarios) - 1)
+                self.coluna = min(max(self.coluna + dc, 0), len(self.servico.pcs) - 1)
+            elif tecla in (curses.KEY_ENTER, 10, 13, ord(" ")):
+                self.alternar()
+            elif tecla in (ord(">"), ord("."), curses.KEY_NPAGE):
+                self.dia += timedelta(days=1)
+            elif tecla in (ord("<"), ord(","), curses.KEY_PPAGE):
+                self.dia -= timedelta(days=1)
+            elif tecla in (ord("t"), ord("T")):
+                self.dia = datetime.now().date()
+            elif tecla == curses.KEY_RESIZE:
+                self.tela.erase()
+                self.na_tela.clear()
+
+def grade_agenda(agendamento_service: AgendamentoService, usuario_logado: str) -> bool:
+    """Abre a GradeAgenda; retorna False se este terminal não suporta curses"""
+    try:
+        import curses
+    except ImportError:
+        # No Windows o módulo vem do pacote windows-curses
+        return False
+    if not (sys.stdin.isatty() and sys.stdout.isatty()):
+        return False
+    import locale
+    locale.setlocale(locale.LC_ALL, "")
+    # Sem isso o ESC para sair demora um segundo
+    os.environ.setdefault("ESCDELAY", "25")
+    professor = USERS[usuario_logado]["nome"]
+    try:
+        curses.wrapper(lambda tela: GradeAgenda(tela, agendamento_service, professor, usuario_logado == "admin").executar())
+    except curses.error as e:
+        _instrumentacao.erro_engolido("grade_agenda", e)
+        return False
+    return True
+
 def menu_agendamento(usuario_logado: str):
     agendamento_service = AgendamentoService()
+    professor = USERS[usuario_logado]["nome"]
     
     while True:
         print("\n=== AGENDAMENTOS ===")
@@ -540,59 +4282,66 @@ def menu_agendamento(usuario_logado: str):
         print("2 - Ver horários já agendados")
         print("3 - Agendar horário (PC único)")
         print("4 - Agendar múltiplos PCs")
-        print("5 - Voltar ao menu principal")
+        print("5 - Cancelar agendamento")
+        print("6 - Agendamento em lote / recorrente")
+        print("7 - Procurar horários para uma turma")
+        print("8 - Grade interativa (PCs x horários)")
+        print("9 - Voltar ao menu principal")
         escolha = input("Escolha uma opção: ").strip()
 
         if escolha == "1":
-            disponiveis = agendamento_service.get_horarios_disponiveis()
+            data = pedir_data_agenda()
+            disponiveis = agendamento_service.get_horarios_disponiveis(data)
             if disponiveis.empty:
                 msg("Não há horários disponíveis", "warn")
             else:
-                print("\nHorários disponíveis:")
+                print(f"\nHorários disponíveis em {data}:")
                 print(tabulate(disponiveis[["pc", "horario"]], headers="keys", tablefmt="grid", showindex=True))
 
         elif escolha == "2":
-            agendados = agendamento_service.get_horarios_agendados()
+            data_inicio = validar_data(input("De (DD/MM/AAAA, em branco para todos): ").strip())
+            data_fim = validar_data(input("Até (DD/MM/AAAA, em branco para todos): ").strip())
+            agendados = agendamento_service.get_horarios_agendados(data_inicio, data_fim)
             if agendados.empty:
                 msg("Nenhum horário agendado", "warn")
             else:
                 print("\nHorários agendados:")
-                print(tabulate(agendados[["pc", "horario", "professor"]], headers="keys", tablefmt="grid", showindex=True))
+                print(tabulate(agendados[["data", "pc", "horario", "professor"]], headers="keys", tablefmt="grid", showindex=True))
 
         elif escolha == "3":
-            disponiveis = agendamento_service.get_horarios_disponiveis()
+            data = pedir_data_agenda()
+            disponiveis = agendamento_service.get_horarios_disponiveis(data)
             if disponiveis.empty:
                 msg("Nenhum horário disponível para agendamento", "warn")
                 return
-            print("\nHorários disponíveis:")
+            print(f"\nHorários disponíveis em {data}:")
             print(tabulate(disponiveis[["pc", "horario"]], headers="keys", tablefmt="grid", showindex=True))
             try:
                 escolha_idx = int(input("Digite o número do horário que deseja agendar: ").strip())
+                celula = disponiveis.loc[escolha_idx]
             except Exception:
                 msg("Entrada inválida.", "warn")
                 return
                 
-            if agendamento_service.agendar_horario(escolha_idx, USERS[usuario_logado]["nome"]):
-                criar_backup()
+            if agendamento_service.agendar_horario(data, celula["pc"], celula["horario"], professor):
+                solicitar_backup()
                 msg("Agendamento realizado com sucesso!", "ok")
             else:
-                msg("Não foi possível realizar o agendamento. Verifique se você já tem um horário neste período.", "err")
+                msg("Não foi possível realizar o agendamento. Verifique se o horário ainda está livre.", "err")
 
         elif escolha == "4":
-            disponiveis = agendamento_service.get_horarios_disponiveis()
-            if disponiveis.empty:
+            data = pedir_data_agenda()
+            # Agrupar horários disponíveis
+            horarios_agrupados = agendamento_service.get_horarios_agrupados(data)
+            if not any(horarios_agrupados.values()):
                 msg("Nenhum horário disponível para agendamento", "warn")
                 continue
-
-            # Agrupar horários disponíveis
-            horarios_agrupados = agendamento_service.get_horarios_agrupados()
             
-            print("\nHorários disponíveis agrupados:")
+            print(f"\nHorários disponíveis agrupados em {data}:")
             for horario, pcs in horarios_agrupados.items():
-                pcs_disponiveis = pcs[pcs['status'] == 'Disponível']
-                if not pcs_disponiveis.empty:
+                if pcs:
                     print(f"\n🕒 {horario}:")
-                    print(tabulate(pcs_disponiveis[['pc']], headers=['PCs Disponíveis'], tablefmt="grid", showindex=True))
+                    print(tabulate([[pc] for pc in pcs], headers=['PCs Disponíveis'], tablefmt="grid", showindex=True))
 
             # Selecionar horário
             horario_escolhido = input("\nDigite o horário que deseja agendar (ex: 08:00 - 09:00): ").strip()
@@ -601,29 +4350,28 @@ def menu_agendamento(usuario_logado: str):
                 msg("Horário inválido.", "err")
                 continue
 
-            pcs_horario = horarios_agrupados[horario_escolhido]
-            pcs_disponiveis = pcs_horario[pcs_horario['status'] == 'Disponível']
+            pcs_disponiveis = horarios_agrupados[horario_escolhido]
             
-            if pcs_disponiveis.empty:
+            if not pcs_disponiveis:
                 msg("Não há PCs disponíveis neste horário.", "warn")
                 continue
 
             print(f"\nPCs disponíveis para {horario_escolhido}:")
-            print(tabulate(pcs_disponiveis[['pc']], headers=['PC', 'Índice'], tablefmt="grid", showindex=True))
+            print(tabulate([[pc] for pc in pcs_disponiveis], headers=['PC'], tablefmt="grid", showindex=True))
             
             # Selecionar múltiplos PCs
             indices_input = input("\nDigite os índices dos PCs que deseja agendar (separados por vírgula): ").strip()
             try:
-                indices = [int(idx.strip()) for idx in indices_input.split(',')]
-            except ValueError:
-                msg("Formato inválido. Use números separados por vírgula.", "err")
+                pcs_escolhidos = [pcs_disponiveis[int(idx.strip())] for idx in indices_input.split(',')]
+            except (ValueError, IndexError):
+                msg("Formato inválido. Use os índices listados separados por vírgula.", "err")
                 continue
 
             # Agendar múltiplos PCs
-            resultados = agendamento_service.agendar_multiplos_pcs(indices, USERS[usuario_logado]["nome"])
+            resultados = agendamento_service.agendar_multiplos_pcs(data, horario_escolhido, pcs_escolhidos, professor)
             
             if resultados['sucessos']:
-                criar_backup()
+                solicitar_backup()
                 msg("\n✅ Agendamentos realizados com sucesso:", "ok")
                 for sucesso in resultados['sucessos']:
                     print(f"  ✓ {sucesso}")
@@ -634,10 +4382,183 @@ def menu_agendamento(usuario_logado: str):
                     print(f"  ✗ {falha}")
 
         elif escolha == "5":
+            agendados = agendamento_service.get_horarios_agendados()
+            if usuario_logado != "admin":
+                agendados = agendados[agendados["professor"] == professor]
+            if agendados.empty:
+                msg("Nenhum agendamento para cancelar", "warn")
+                continue
+            print("\nAgendamentos:")
+            print(tabulate(agendados[["data", "pc", "horario", "professor"]], headers="keys", tablefmt="grid", showindex=True))
+            try:
+                reserva = agendados.loc[int(input("Digite o número do agendamento que deseja cancelar: ").strip())]
+            except Exception:
+                msg("Entrada inválida.", "warn")
+                continue
+            dono = None if usuario_logado == "admin" else professor
+            if agendamento_service.cancelar_agendamento(reserva["data"], reserva["pc"], reserva["horario"], dono):
+                solicitar_backup()
+                msg("Agendamento cancelado.", "ok")
+            else:
+                msg("Não foi possível cancelar o agendamento.", "err")
+
+        elif escolha == "6":
+            agendar_em_lote(agendamento_service, professor)
+
+        elif escolha == "7":
+            procurar_capacidade(agendamento_service, professor)
+
+        elif escolha == "8":
+            if not grade_agenda(agendamento_service, usuario_logado):
+                msg("A grade precisa de um terminal com curses (no Windows: pip install windows-curses). "
+                    "Use as opções 1 a 5.", "warn")
+
+        elif escolha == "9":
             return
         else:
             msg("Opção inválida", "warn")
 
+def pedir_mes() -> str:
+    """Pede um mês MM/AAAA (em branco = todos) e retorna no formato AAAA-MM"""
+    while True:
+        texto = input("Mês (MM/AAAA, Enter para todo o histórico): ").strip()
+        if not texto:
+            return None
+        try:
+            return datetime.strptime(texto, "%m/%Y").strftime("%Y-%m")
+        except ValueError:
+            msg("Mês inválido. Use MM/AAAA.", "warn")
+
+def pedir_intervalo() -> tuple:
+    """Pede datas de início e fim opcionais (DD/MM/AAAA)"""
+    datas = []
+    for rotulo in ("inicial", "final"):
+        while True:
+            texto = input(f"Data {rotulo} (DD/MM/AAAA, Enter para sem limite): ").strip()
+            if not texto:
+                datas.append(None)
+                break
+            data = validar_data(texto)
+            if data:
+                datas.append(data)
+                break
+    return tuple(datas)
+
+def mostrar_tabela(df: pd.DataFrame, vazio: str = "Nenhum uso registrado.", showindex: bool = False):
+    if df.empty:
+        msg(vazio, "warn")
+    else:
+        print(tabulate(df, headers="keys", tablefmt="grid", showindex=showindex))
+
+def menu_analise(usuario_logado: str):
+    analise = analise_uso()
+    while True:
+        print("\n=== ANÁLISE DE USO ===")
+        print("1 - Horas por PC")
+        print("2 - Horas por dia")
+        print("3 - Horas por semana")
+        print("4 - Mapa de ocupação (dia da semana x hora)")
+        print("5 - Usuários que mais usaram")
+        print("6 - Agendado x utilizado")
+        print("7 - Recalcular agregados")
+        print("8 - Exportar registros filtrados (XLSX/CSV)")
+        print("9 - Voltar ao menu principal")
+        escolha = input("Escolha uma opção: ").strip()
+
+        if escolha == "1":
+            mostrar_tabela(analise.horas_por_pc(pedir_mes()))
+        elif escolha == "2":
+            mostrar_tabela(analise.horas_por_dia(*pedir_intervalo()))
+        elif escolha == "3":
+            mostrar_tabela(analise.horas_por_semana())
+        elif escolha == "4":
+            mostrar_tabela(analise.mapa_ocupacao(), showindex=True)
+        elif escolha == "5":
+            mostrar_tabela(analise.top_usuarios())
+        elif escolha == "6":
+            detalhe, resumo = analise.agendado_vs_usado(AgendamentoService(), *pedir_intervalo())
+            mostrar_tabela(detalhe, "Nenhuma reserva no período.")
+            if resumo["reservas"]:
+                msg(
+                    f"{resumo['utilizadas']}/{resumo['reservas']} reserva(s) utilizada(s) "
+                    f"({resumo['taxa_utilizacao']:.0%}); {resumo['horas_usadas_em_reservas']}h usadas "
+                    f"de {resumo['horas_reservadas']}h reservadas.", "info"
+                )
+        elif escolha == "7":
+            analise.reconstruir()
+            msg("Agregados recalculados a partir dos registros.", "ok")
+        elif escolha == "8":
+            menu_exportar()
+        elif escolha == "9":
+            return
+        else:
+            msg("Opção inválida.", "warn")
+
+def converter_agenda_legada() -> int:
+    """Converte a grade antiga sem datas: mantém só as reservas, datadas de hoje
+
+    Um backup é criado antes; se ele falhar, nada é convertido. Retorna quantas reservas
+    ficaram, ou -1 se a agenda já estava no formato atual
+    """
+    with _trava_conjunto(ARQ_AG):
+        df = carregar_dataframe(ARQ_AG, cols=COLUNAS_AG)
+        if not _grade_legada(df):
+            return -1
+        if not (armazenamento().criar_backup() if ARMAZENAMENTO == "remoto" else criar_backup(avisar=False)):
+            raise OSError("não foi possível criar o backup antes da conversão")
+        if "data" not in df.columns:
+            df["data"] = None
+        df = df[df["status"] == "Agendado"].copy()
+        df["data"] = df["data"].fillna(datetime.now().strftime("%d/%m/%Y"))
+        salvar_csv_xlsx(df[COLUNAS_AG], ARQ_AG, ARQ_AG_XLSX)
+    return len(df)
+
+def exigir_agenda_convertida():
+    """Recusa ler as reservas por fora do AgendamentoService enquanto a grade antiga não for convertida"""
+    primeira, _ = consultar_registros(ARQ_AG, {}, 0, 1)
+    if len(primeira) and _grade_legada(primeira):
+        raise AgendaLegada("A agenda está no formato antigo, sem datas; converta-a antes de exportar.")
+
+def menu_exportar():
+    """Exporta sessões, reservas ou relatórios filtrados para XLSX ou CSV"""
+    conjuntos = {"1": ("alunos", ARQ_ALUNOS, COLUNAS_ALUNOS), "2": ("agendamentos", ARQ_AG, COLUNAS_AG),
+                 "3": ("relatorios", ARQ_REL, COLUNAS_REL)}
+    print("\n1 - Sessões de alunos\n2 - Agendamentos\n3 - Relatórios")
+    escolha = input("O que exportar: ").strip()
+    if escolha not in conjuntos:
+        msg("Opção inválida.", "warn")
+        return
+    nome, csv_path, cols = conjuntos[escolha]
+    if csv_path == ARQ_AG:
+        try:
+            exigir_agenda_convertida()
+        except AgendaLegada as e:
+            msg(str(e), "warn")
+            return
+    filtros = {}
+    print("\nFiltros (deixe em branco para não filtrar):")
+    if "pc" in cols:
+        texto = input("PCs (ex: 01-10 ou 01,03): ").strip()
+        try:
+            filtros["pcs"] = expandir_pcs(texto) if texto else None
+        except ValueError as e:
+            msg(str(e), "warn")
+            return
+    if "professor" in cols:
+        filtros["professor"] = input("Professor: ").strip()
+    if "data" in cols:
+        filtros["data_inicio"], filtros["data_fim"] = pedir_intervalo()
+    padrao = f"{nome}_{datetime.now():%Y%m%d_%H%M%S}.xlsx"
+    destino = Path(input(f"Arquivo .xlsx ou .csv (Enter para {padrao}): ").strip() or padrao)
+    try:
+        with progresso_na_tela(f"Exportando {nome}") as progresso:
+            linhas = exportar_filtrado(csv_path, {chave: valor for chave, valor in filtros.items() if valor},
+                                       destino, cols, progresso)
+    except (ValueError, OSError) as e:
+        msg(f"Erro ao exportar: {e}", "err")
+        return
+    msg(f"{linhas} registro(s) exportado(s) para {destino}", "ok")
+
 def limpar_dados(usuario_logado: str):
     if usuario_logado != "admin":
         msg("Apenas o ADMIN pode acessar esta opção.", "warn")
@@ -647,55 +4568,566 @@ def limpar_dados(usuario_logado: str):
     print("2 - Limpar agendamentos")
     print("3 - Limpar alunos")
     print("4 - Limpar tudo")
-    print("5 - Voltar")
+    print("5 - Podar backups antigos")
+    print("6 - Converter agenda antiga (sem datas)")
+    print("7 - Voltar")
     escolha = input("Escolha uma opção: ").strip()
     if escolha == "1":
         msg("Limpando relatórios...", "info")
         time.sleep(0.6)
-        for arq in (ARQ_REL, ARQ_REL_XLSX):
-            try:
-                if arq.exists(): arq.unlink()
-            except Exception:
-                pass
-        criar_backup()
+        limpar_dataset(ARQ_REL, ARQ_REL_XLSX)
+        solicitar_backup()
         msg("Relatórios apagados com sucesso!", "ok")
     elif escolha == "2":
         msg("Limpando agendamentos...", "info")
         time.sleep(0.6)
-        try:
-            if ARQ_AG.exists(): ARQ_AG.unlink()
-            xlsx = Path("agendamentos.xlsx")
-            if xlsx.exists(): xlsx.unlink()
-        except Exception:
-            pass
-        criar_backup()
+        limpar_dataset(ARQ_AG, ARQ_AG_XLSX)
+        solicitar_backup()
         msg("Agendamentos apagados com sucesso!", "ok")
     elif escolha == "3":
         msg("Limpando alunos...", "info")
         time.sleep(0.6)
-        for arq in (ARQ_ALUNOS, ARQ_ALUNOS_XLSX):
-            try:
-                if arq.exists(): arq.unlink()
-            except Exception:
-                pass
-        criar_backup()
+        limpar_dataset(ARQ_ALUNOS, ARQ_ALUNOS_XLSX)
+        solicitar_backup()
         msg("Alunos apagados com sucesso!", "ok")
     elif escolha == "4":
         msg("Limpando todos os dados do sistema...", "info")
         time.sleep(0.6)
-        arquivos = [ARQ_REL, ARQ_REL_XLSX, ARQ_AG, ARQ_ALUNOS, ARQ_ALUNOS_XLSX, Path("agendamentos.xlsx")]
-        for arq in arquivos:
+        for csv_path, xlsx_path in ((ARQ_REL, ARQ_REL_XLSX), (ARQ_AG, ARQ_AG_XLSX), (ARQ_ALUNOS, ARQ_ALUNOS_XLSX)):
             try:
-                if arq.exists(): arq.unlink()
+                limpar_dataset(csv_path, xlsx_path)
             except Exception:
                 pass
-        criar_backup()
+        solicitar_backup()
         msg("Todos os dados foram apagados com sucesso!", "ok")
     elif escolha == "5":
+        msg("Aplicando política de retenção dos backups...", "info")
+        try:
+            snapshots, objetos = podar_backups()
+            msg(f"{snapshots} snapshot(s) e {objetos} arquivo(s) de backup removidos.", "ok")
+        except Exception as e:
+            msg(f"Erro ao podar backups: {e}", "err")
+    elif escolha == "6":
+        msg("A grade vaga é descartada; as reservas ficam datadas de hoje. Um backup é criado antes.", "info")
+        if input("Converter? (s/n): ").strip().lower() != "s":
+            return
+        try:
+            reservas = converter_agenda_legada()
+        except OSError as e:
+            msg(f"Conversão cancelada: {e}", "err")
+            return
+        if reservas < 0:
+            msg("A agenda já está no formato atual.", "ok")
+        else:
+            msg(f"Agenda convertida: {reservas} reserva(s) mantida(s).", "ok")
+    elif escolha == "7":
         return
     else:
         msg("Opção inválida.", "warn")
 
+def menu_diagnostico(usuario_logado: str):
+    if usuario_logado != "admin":
+        msg("Apenas o ADMIN pode acessar esta opção.", "warn")
+        return
+    while True:
+        print("\n=== DIAGNÓSTICO ===")
+        if not _instrumentacao.ativa:
+            msg("Instrumentação desligada (LAB_INSTRUMENTACAO=0).", "warn")
+        if _instrumentacao.arquivo_log:
+            print(f"Log estruturado: {_instrumentacao.arquivo_log}")
+        print("1 - Resumo por operação")
+        print("2 - Histograma de latência de uma operação")
+        print("3 - Últimos erros tratados")
+        print("4 - Zerar contadores")
+        print("5 - Voltar")
+        escolha = input("Escolha uma opção: ").strip()
+        if escolha == "1":
+            resumo = _instrumentacao.resumo()
+            if resumo:
+                print(tabulate(resumo, headers="keys", tablefmt="grid"))
+            else:
+                msg("Nenhuma operação medida ainda.", "warn")
+        elif escolha == "2":
+            nome = input("Operação (ex: carregar, salvar, criar_backup): ").strip()
+            faixas = [(faixa, n) for faixa, n in _instrumentacao.histograma(nome) if n]
+            if not faixas:
+                msg("Nenhuma chamada registrada para essa operação.", "warn")
+                continue
+            maior = max(n for _, n in faixas)
+            for faixa, n in faixas:
+                print(f"{faixa:>7} ms | {'#' * max(1, round(40 * n / maior))} {n}")
+        elif escolha == "3":
+            if _instrumentacao.ultimos_erros:
+                print(tabulate(_instrumentacao.ultimos_erros, headers="keys", tablefmt="grid"))
+            else:
+                msg("Nenhum erro tratado.", "ok")
+        elif escolha == "4":
+            _instrumentacao.zerar()
+            msg("Contadores zerados.", "ok")
+        elif escolha == "5":
+            return
+        else:
+            msg("Opção inválida.", "warn")
+
+def _trabalhador_estresse(pasta: str, professor: str, celulas: list, fila):
+    global _armazenamento
+    os.chdir(pasta)
+    _armazenamento = None
+    service = AgendamentoService()
+    reservados = [celula for celula in celulas if service.agendar_horario(*celula, professor)]
+    _exportador_xlsx.aguardar()
+    fila.put((professor, reservados))
+
+def teste_estresse_agendamentos(processos: int = 8, por_processo: int = 10) -> dict:
+    """Dispara reservas simultâneas de vários processos e confere se alguma se perdeu
+
+    Cada processo reserva células próprias e todos disputam a primeira célula do
+    dia, que deve ter exatamente um vencedor
+    """
+    import multiprocessing
+    import tempfile
+    global _armazenamento
+    if ARMAZENAMENTO == "remoto":
+        raise EntradaInvalida("O teste de estresse usa arquivos locais; rode-o sem LAB_ARMAZENAMENTO=remoto")
+    origem = os.getcwd()
+    hoje = datetime.now().strftime("%d/%m/%Y")
+    celulas = [(hoje, pc, h) for h in horarios_do_lab() for pc in pcs_do_lab()]
+    if processos * por_processo + 1 > len(celulas):
+        raise EntradaInvalida(f"A agenda tem só {len(celulas)} células para {processos * por_processo + 1} reservas")
+    disputada = celulas[0]
+    with tempfile.TemporaryDirectory() as pasta:
+        os.chdir(pasta)
+        _armazenamento = None
+        try:
+            ctx = multiprocessing.get_context("spawn")
+            fila = ctx.Queue()
+            workers = []
+            for i in range(processos):
+                proprias = [disputada] + [celulas[1 + i + j * processos] for j in range(por_processo)]
+                workers.append(ctx.Process(target=_trabalhador_estresse, args=(pasta, f"Estresse {i}", proprias, fila)))
+            for w in workers:
+                w.start()
+            reportados = dict(fila.get() for _ in workers)
+            for w in workers:
+                w.join()
+
+            # Os processos filhos não herdam o laboratório selecionado: usam o layout
+            # de um laboratório só dentro da pasta temporária
+            backend = ArmazenamentoSQLite(Path(ARQ_DB.name)) if ARMAZENAMENTO == "sqlite" else ArmazenamentoCSV()
+            final = backend.carregar(Path(ARQ_AG.name), COLUNAS_AG)
+            donos = {(d, pc, h): prof for d, pc, h, prof in zip(final["data"], final["pc"], final["horario"], final["professor"])}
+            perdidas = [
+                (professor, celula) for professor, reservadas in reportados.items()
+                for celula in map(tuple, reservadas) if donos.get(celula) != professor
+            ]
+            return {
+                "processos": processos,
+                "reservas_confirmadas": sum(len(v) for v in reportados.values()),
+                "reservas_no_arquivo": len(final),
+                "vencedores_celula_disputada": sum(disputada in map(tuple, v) for v in reportados.values()),
+                "celulas_duplicadas": int(final.duplicated(["data", "pc", "horario"]).sum()),
+                "atualizacoes_perdidas": perdidas
+            }
+        finally:
+            os.chdir(origem)
+            _armazenamento = None
+
+def autenticar(usuario: str, senha: str) -> bool:
+    return usuario in USERS and USERS[usuario]["senha"] == senha
+
+# Modo não interativo: subcomandos sem prompts, pausas nem limpeza de tela.
+# Os dados saem em JSON/CSV no stdout; mensagens de status vão para o stderr
+class ErroCLI(Exception):
+    """Falha de um subcomando, com o código de saída do processo"""
+
+    def __init__(self, mensagem: str, codigo: int = 1):
+        super().__init__(mensagem)
+        self.codigo = codigo
+
+def _emitir(dados, formato: str):
+    """Escreve o resultado no stdout em JSON ou CSV"""
+    if isinstance(dados, pd.DataFrame):
+        tabela = dados
+    elif isinstance(dados, list):
+        tabela = pd.DataFrame(dados)
+    else:
+        tabela = pd.DataFrame([dados])
+    if formato == "csv":
+        tabela.to_csv(sys.stdout, index=False, lineterminator="\n")
+    elif isinstance(dados, dict):
+        print(json.dumps(dados, ensure_ascii=False, indent=2, default=str))
+    else:
+        print(json.dumps(tabela.to_dict("records"), ensure_ascii=False, indent=2, default=str))
+
+def _pc_cli(texto: str) -> str:
+    numero = texto.strip().upper().replace("PC", "")
+    if not validar_numero(numero) or not validar_pc_existente(numero):
+        raise ErroCLI(f"PC inválido: {texto}", 2)
+    return f"PC{numero.zfill(2)}"
+
+def _data_cli(texto: str) -> str:
+    data = validar_data(texto) if texto else None
+    if texto and not data:
+        raise ErroCLI(f"Data inválida: {texto} (use DD/MM/AAAA)", 2)
+    return data
+
+def cli_alunos_add(args, usuario: str):
+    agora = datetime.now()
+    linha = pd.DataFrame([{
+        "pc": args.pc,
+        "nome": args.nome,
+        "data": args.data or agora.strftime("%d/%m/%Y"),
+        "entrada": args.entrada or agora.strftime("%H:%M"),
+        "saida": args.saida
+    }])
+    # Mesmas regras da importação de planilhas
+    aceitas, rejeitadas = validar_sessoes_em_lote(linha)
+    if aceitas.empty:
+        raise ErroCLI(rejeitadas["motivos"].iloc[0], 2)
+    registro = aceitas.iloc[0].to_dict()
+    if not args.permitir_sobreposicao:
+        conflitos = sessoes_sobrepostas(registro["pc"], registro["data"], registro["entrada"], registro["saida"])
+        if not conflitos.empty:
+            raise ErroCLI(f"{registro['pc']} já tem sessão nesse intervalo (IDs {', '.join(map(str, conflitos.index))}).", 3)
+    inserir_sessoes([registro])
+    solicitar_backup()
+    return registro
+
+def cli_alunos_list(args, usuario: str):
+    filtros = {"pc": _pc_cli(args.pc) if args.pc else None, "nome": args.nome,
+               "data_inicio": _data_cli(args.de), "data_fim": _data_cli(args.ate)}
+    filtros = {chave: valor for chave, valor in filtros.items() if valor}
+    if args.pagina is None:
+        # Sem paginação: uma página do tamanho exato do resultado
+        _, total = consultar_registros(ARQ_ALUNOS, filtros, 0, 1)
+        pagina, _ = consultar_registros(ARQ_ALUNOS, filtros, 0, max(total, 1))
+    else:
+        pagina, _ = consultar_registros(ARQ_ALUNOS, filtros, max(args.pagina - 1, 0), args.tamanho)
+    return pagina.rename_axis("id").reset_index()
+
+def cli_alunos_import(args, usuario: str):
+    caminho = Path(args.arquivo)
+    if not caminho.exists():
+        raise ErroCLI(f"Arquivo não encontrado: {caminho}", 2)
+    aceitas, rejeitadas = importar_sessoes(caminho)
+    return {"importadas": aceitas, "rejeitadas": rejeitadas.to_dict("records")}
+
+def cli_alunos_audit(args, usuario: str):
+    return auditar_sobreposicoes()
+
+def cli_agenda_book(args, usuario: str):
+    data = _data_cli(args.data) or datetime.now().strftime("%d/%m/%Y")
+    if datetime.strptime(data, "%d/%m/%Y").date() < datetime.now().date():
+        raise ErroCLI("Data no passado.", 2)
+    pcs = [_pc_cli(pc) for pc in args.pcs.split(",")]
+    celulas = expandir_recorrencia(
+        [(pc, horario) for pc in pcs for horario in args.horario], data, _data_cli(args.ate), args.repetir,
+        [0, 1, 2, 3, 4] if args.dias_uteis else None
+    )
+    resultados = AgendamentoService().agendar_lote(celulas, USERS[usuario]["nome"], args.tudo_ou_nada)
+    if any(r["reservado"] for r in resultados):
+        solicitar_backup()
+        return resultados
+    falhas = [f"{r['data']} {r['pc']} {r['horario']}: {r['motivo']}" for r in resultados if r["motivo"] != "lote cancelado"]
+    raise ErroCLI("; ".join(falhas) or "Nenhum PC agendado.", 3)
+
+def cli_agenda_cancel(args, usuario: str):
+    data = _data_cli(args.data)
+    dono = None if usuario == "admin" else USERS[usuario]["nome"]
+    if not AgendamentoService().cancelar_agendamento(data, _pc_cli(args.pc), args.horario, dono):
+        raise ErroCLI("Agendamento não encontrado ou de outro professor.", 3)
+    solicitar_backup()
+    return {"cancelado": {"data": data, "pc": _pc_cli(args.pc), "horario": args.horario}}
+
+def cli_agenda_free(args, usuario: str):
+    data = _data_cli(args.data) or datetime.now().strftime("%d/%m/%Y")
+    livres = AgendamentoService().get_horarios_disponiveis(data)
+    if args.horario:
+        livres = livres[livres["horario"] == args.horario]
+    return livres
+
+def cli_agenda_capacity(args, usuario: str):
+    data = _data_cli(args.de) or datetime.now().strftime("%d/%m/%Y")
+    if args.minimo < 1:
+        raise ErroCLI("--minimo deve ser positivo.", 2)
+    slots = AgendamentoService().buscar_capacidade(args.minimo, data, _data_cli(args.ate), args.adjacentes)
+    return [dict(slot, pcs=",".join(slot["pcs"])) for slot in slots]
+
+def cli_agenda_export(args, usuario: str):
+    agendados = AgendamentoService().get_horarios_agendados(_data_cli(args.de), _data_cli(args.ate))
+    return agendados[COLUNAS_AG]
+
+def cli_relatorio_add(args, usuario: str):
+    professor = validar_nome(args.professor) if args.professor else USERS[usuario]["nome"]
+    if not professor:
+        raise ErroCLI("Nome de professor inválido.", 2)
+    novo_rel = {"professor": professor, "relatorio": args.texto.strip(), "usuario": usuario}
+    salvar_relatorio(novo_rel)
+    return novo_rel
+
+def cli_relatorio_search(args, usuario: str):
+    dados, total = buscar_relatorios(" ".join(args.termos), max(args.pagina - 1, 0), args.tamanho)
+    if total == 0:
+        raise ErroCLI("Nenhum relatório encontrado.", 3)
+    return dados.rename_axis("id").reset_index()
+
+def cli_relatorio_list(args, usuario: str):
+    dados, _ = consultar_registros(ARQ_REL, {}, max(args.pagina - 1, 0), args.tamanho)
+    return dados.rename_axis("id").reset_index()
+
+def cli_exportar(args, usuario: str):
+    csv_path, cols = {"alunos": (ARQ_ALUNOS, COLUNAS_ALUNOS), "agendamentos": (ARQ_AG, COLUNAS_AG),
+                      "relatorios": (ARQ_REL, COLUNAS_REL)}[args.conjunto]
+    filtros = {"pcs": expandir_pcs(args.pcs) if args.pcs else None, "nome": args.nome, "professor": args.professor,
+               "data_inicio": _data_cli(args.de), "data_fim": _data_cli(args.ate)}
+    filtros = {chave: valor for chave, valor in filtros.items() if valor}
+    campos = {"pcs": "pc", "nome": "nome", "professor": "professor", "data_inicio": "data", "data_fim": "data"}
+    sem_campo = sorted({campos[chave] for chave in filtros if campos[chave] not in cols})
+    if sem_campo:
+        raise ErroCLI(f"{args.conjunto} não tem o campo {', '.join(sem_campo)} para filtrar.", 2)
+    if csv_path == ARQ_AG:
+        exigir_agenda_convertida()
+    try:
+        with progresso_na_tela(f"Exportando {args.conjunto}") as progresso:
+            linhas = exportar_filtrado(csv_path, filtros, Path(args.arquivo), cols, progresso)
+    except (TimeoutError, ConnectionError):
+        raise
+    except OSError as e:
+        raise ErroCLI(f"Não foi possível gravar {args.arquivo}: {e}")
+    msg(f"{linhas} registro(s) exportado(s) para {args.arquivo}", "ok")
+    return {"arquivo": args.arquivo, "linhas": linhas}
+
+def cli_backup(args, usuario: str):
+    if ARMAZENAMENTO == "remoto":
+        return {"snapshot": armazenamento().criar_backup()}
+    if not criar_backup():
+        raise ErroCLI("Falha ao criar backup.")
+    snapshots = _listar_snapshots()
+    return {"snapshot": str(snapshots[-1]) if snapshots else None}
+
+def cli_clean(args, usuario: str):
+    if usuario != "admin":
+        raise ErroCLI("Apenas o ADMIN pode limpar dados.", 4)
+    if args.alvo == "backups":
+        snapshots, objetos = podar_backups()
+        return {"snapshots_removidos": snapshots, "objetos_removidos": objetos}
+    conjuntos = {
+        "relatorios": [(ARQ_REL, ARQ_REL_XLSX)],
+        "agendamentos": [(ARQ_AG, ARQ_AG_XLSX)],
+        "alunos": [(ARQ_ALUNOS, ARQ_ALUNOS_XLSX)],
+    }
+    conjuntos["tudo"] = [par for pares in conjuntos.values() for par in pares]
+    for csv_path, xlsx_path in conjuntos[args.alvo]:
+        limpar_dataset(csv_path, xlsx_path)
+    solicitar_backup()
+    return {"limpo": args.alvo}
+
+def cli_agenda_convert(args, usuario: str):
+    if usuario != "admin":
+        raise ErroCLI("Apenas o ADMIN pode converter a agenda.", 4)
+    try:
+        reservas = converter_agenda_legada()
+    except (TimeoutError, ConnectionError):
+        raise
+    except OSError as e:
+        raise ErroCLI(f"Conversão cancelada: {e}")
+    return {"convertida": reservas >= 0, "reservas": max(reservas, 0)}
+
+def cli_compactar(args, usuario: str):
+    if ARMAZENAMENTO == "remoto":
+        raise ErroCLI("No modo remoto quem compacta é o servidor.", 2)
+    return {"compactados": compactar_conjuntos()}
+
+def cli_migrar_sqlite(args, usuario: str):
+    return migrar_csv_para_sqlite(forcar=args.forcar)
+
+def cli_migrar_lab(args, usuario: str):
+    return migrar_para_lab(args.nome, forcar=args.forcar)
+
+def cli_servidor(args, usuario: str):
+    import asyncio
+    if ARMAZENAMENTO == "remoto":
+        raise ErroCLI("O servidor precisa de armazenamento local (LAB_ARMAZENAMENTO=csv ou sqlite).", 2)
+    servidor = ServidorLab(*_endereco(args.endereco))
+    msg(f"Servidor do laboratório em {args.endereco} (Ctrl+C encerra)", "ok")
+    try:
+        asyncio.run(servidor.executar())
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        raise ErroCLI(f"Não foi possível abrir {args.endereco}: {e}")
+    return {"pedidos": servidor.pedidos, "gravacoes": servidor.gravacoes}
+
+def cli_estresse_agenda(args, usuario: str):
+    resultado = teste_estresse_agendamentos(args.processos, args.por_processo)
+    tipo = "ok" if (not resultado["atualizacoes_perdidas"] and not resultado["celulas_duplicadas"]
+                    and resultado["vencedores_celula_disputada"] == 1) else "err"
+    msg(f"{len(resultado['atualizacoes_perdidas'])} atualização(ões) perdida(s)", tipo)
+    return resultado
+
+def criar_parser_cli():
+    import argparse
+    # Opções globais aceitas antes ou depois do subcomando
+    comum = argparse.ArgumentParser(add_help=False)
+    comum.add_argument("--usuario", default=argparse.SUPPRESS, help="login (ou LAB_USUARIO)")
+    comum.add_argument("--senha", default=argparse.SUPPRESS, help="senha (ou LAB_SENHA)")
+    comum.add_argument("--formato", choices=("json", "csv"), default=argparse.SUPPRESS, help="saída (padrão: json)")
+    comum.add_argument("--lab", default=argparse.SUPPRESS, help="laboratório em DIR_DADOS (ou LAB_LABORATORIO)")
+    comum.add_argument("--sem-xlsx", action="store_true", default=argparse.SUPPRESS,
+                       help="sai sem esperar as planilhas XLSX (e, no SQLite, o espelho CSV) ficarem em dia "
+                            "(ou LAB_XLSX_AO_SAIR=0)")
+    parser = argparse.ArgumentParser(
+        description="Controle do laboratório em modo não interativo", parents=[comum],
+        epilog="Códigos de saída: 0 ok, 1 falha, 2 pedido inválido, 3 conflito, 4 acesso negado, "
+               "5 arquivo travado por outro terminal, 6 servidor indisponível."
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    alunos = comandos.add_parser("alunos", parents=[comum], help="sessões de uso dos PCs").add_subparsers(dest="acao", required=True)
+    p = alunos.add_parser("add", parents=[comum], help="registra uma sessão")
+    p.add_argument("--pc", required=True)
+    p.add_argument("--nome", required=True)
+    p.add_argument("--data", help="DD/MM/AAAA (padrão: hoje)")
+    p.add_argument("--entrada", help="HH:MM (padrão: agora)")
+    p.add_argument("--saida", required=True, help="HH:MM")
+    p.add_argument("--permitir-sobreposicao", action="store_true", help="grava mesmo se o PC já tiver sessão no intervalo")
+    p.set_defaults(funcao=cli_alunos_add)
+    p = alunos.add_parser("list", parents=[comum], help="lista sessões (todas, ou uma página com --pagina)")
+    p.add_argument("--pc")
+    p.add_argument("--nome", help="nome começando com")
+    p.add_argument("--de")
+    p.add_argument("--ate")
+    p.add_argument("--pagina", type=int)
+    p.add_argument("--tamanho", type=int, default=TAMANHO_PAGINA)
+    p.set_defaults(funcao=cli_alunos_list)
+    p = alunos.add_parser("import", parents=[comum], help="importa uma folha de presença CSV/XLSX")
+    p.add_argument("arquivo")
+    p.set_defaults(funcao=cli_alunos_import)
+    p = alunos.add_parser("audit", parents=[comum], help="pares de sessões sobrepostas no mesmo PC")
+    p.set_defaults(funcao=cli_alunos_audit)
+
+    agenda = comandos.add_parser("agenda", parents=[comum], help="reservas de PCs").add_subparsers(dest="acao", required=True)
+    p = agenda.add_parser("book", parents=[comum], help="reserva PCs em um ou mais horários, com repetição opcional")
+    p.add_argument("--data", help="DD/MM/AAAA (padrão: hoje)")
+    p.add_argument("--horario", required=True, action="append", help='ex: "08:00 - 09:00"; pode repetir')
+    p.add_argument("--pcs", required=True, help="lista separada por vírgulas, ex: 01,02,PC03")
+    p.add_argument("--repetir", choices=list(FREQUENCIAS_RECORRENCIA), help="repete a reserva até --ate")
+    p.add_argument("--ate", help="última data da repetição (DD/MM/AAAA)")
+    p.add_argument("--dias-uteis", action="store_true", help="com --repetir diaria, pula sábados e domingos")
+    p.add_argument("--tudo-ou-nada", action="store_true", help="não grava nada se alguma célula falhar")
+    p.set_defaults(funcao=cli_agenda_book)
+    p = agenda.add_parser("cancel", parents=[comum], help="cancela uma reserva")
+    p.add_argument("--data", required=True)
+    p.add_argument("--horario", required=True)
+    p.add_argument("--pc", required=True)
+    p.set_defaults(funcao=cli_agenda_cancel)
+    p = agenda.add_parser("free", parents=[comum], help="horários livres de uma data")
+    p.add_argument("--data")
+    p.add_argument("--horario")
+    p.set_defaults(funcao=cli_agenda_free)
+    p = agenda.add_parser("capacity", parents=[comum], help="horários com pelo menos N PCs livres")
+    p.add_argument("--minimo", type=int, required=True)
+    p.add_argument("--de", help="DD/MM/AAAA (padrão: hoje)")
+    p.add_argument("--ate", help="DD/MM/AAAA (padrão: o mesmo dia)")
+    p.add_argument("--adjacentes", action="store_true", help="só blocos de PCs vizinhos")
+    p.set_defaults(funcao=cli_agenda_capacity)
+    p = agenda.add_parser("export", parents=[comum], help="reservas de um intervalo")
+    p.add_argument("--de")
+    p.add_argument("--ate")
+    p.set_defaults(funcao=cli_agenda_export)
+    p = agenda.add_parser("convert", parents=[comum], help="converte a grade antiga sem datas, com backup antes (somente admin)")
+    p.set_defaults(funcao=cli_agenda_convert)
+
+    relatorio = comandos.add_parser("relatorio", parents=[comum], help="relatórios de aula").add_subparsers(dest="acao", required=True)
+    p = relatorio.add_parser("add", parents=[comum], help="registra um relatório de aula")
+    p.add_argument("--texto", required=True)
+    p.add_argument("--professor", help="padrão: nome do usuário")
+    p.set_defaults(funcao=cli_relatorio_add)
+    p = relatorio.add_parser("search", parents=[comum], help="busca por palavras no texto, professor ou usuário")
+    p.add_argument("termos", nargs="+", help="palavras (ou inícios de palavras) que devem aparecer")
+    p.add_argument("--pagina", type=int, default=1)
+    p.add_argument("--tamanho", type=int, default=TAMANHO_PAGINA)
+    p.set_defaults(funcao=cli_relatorio_search)
+    p = relatorio.add_parser("list", parents=[comum], help="lista os relatórios em páginas")
+    p.add_argument("--pagina", type=int, default=1)
+    p.add_argument("--tamanho", type=int, default=TAMANHO_PAGINA)
+    p.set_defaults(funcao=cli_relatorio_list)
+
+    p = comandos.add_parser("exportar", parents=[comum], help="grava registros filtrados em .xlsx ou .csv, em blocos")
+    p.add_argument("conjunto", choices=("alunos", "agendamentos", "relatorios"))
+    p.add_argument("arquivo", help="destino; o formato vem da extensão (.xlsx ou .csv)")
+    p.add_argument("--pcs", help="ex: 01-10 ou 01,03,PC05")
+    p.add_argument("--nome", help="nome começando com (alunos)")
+    p.add_argument("--professor", help="nome do professor (agendamentos e relatórios)")
+    p.add_argument("--de")
+    p.add_argument("--ate")
+    p.set_defaults(funcao=cli_exportar)
+    comandos.add_parser("backup", parents=[comum], help="cria um snapshot de backup").set_defaults(funcao=cli_backup)
+    p = comandos.add_parser("clean", parents=[comum], help="apaga dados (somente admin)")
+    p.add_argument("alvo", choices=("relatorios", "agendamentos", "alunos", "tudo", "backups"))
+    p.set_defaults(funcao=cli_clean)
+    p = comandos.add_parser("compactar", parents=[comum], help="incorpora os journais aos snapshots e gera os XLSX (para agendar)")
+    p.set_defaults(funcao=cli_compactar, sem_login=True)
+    p = comandos.add_parser("migrar-sqlite", parents=[comum], help="copia os CSV para o banco SQLite")
+    p.add_argument("--forcar", action="store_true")
+    p.set_defaults(funcao=cli_migrar_sqlite, sem_login=True)
+    p = comandos.add_parser("migrar-lab", parents=[comum], help="copia os dados da pasta atual para um laboratório")
+    p.add_argument("nome")
+    p.add_argument("--forcar", action="store_true", help="sobrescreve dados que o laboratório já tenha")
+    p.set_defaults(funcao=cli_migrar_lab, sem_login=True, sem_lab=True)
+    p = comandos.add_parser("servidor", parents=[comum], help="mantém os dados em memória para terminais com LAB_ARMAZENAMENTO=remoto")
+    p.add_argument("--endereco", default=SERVIDOR, help="host:porta (padrão: LAB_SERVIDOR ou 127.0.0.1:8765)")
+    p.set_defaults(funcao=cli_servidor, sem_login=True)
+    p = comandos.add_parser("estresse-agenda", parents=[comum], help="reservas concorrentes entre processos")
+    p.add_argument("processos", type=int, nargs="?", default=8)
+    p.add_argument("--por-processo", type=int, default=10)
+    p.set_defaults(funcao=cli_estresse_agenda, sem_login=True, sem_lab=True)
+    return parser
+
+def executar_cli(argv: list) -> int:
+    """Executa um subcomando e retorna o código de saída do processo"""
+    global _mensagens_no_stderr, XLSX_AO_SAIR
+    # Atalhos antigos: --migrar-sqlite [--forcar] e --estresse-agenda [N]
+    argv = [a.lstrip("-") if a in ("--migrar-sqlite", "--estresse-agenda") else a for a in argv]
+    parser = criar_parser_cli()
+    args = parser.parse_args(argv)
+    if getattr(args, "repetir", None) and not args.ate:
+        parser.error("--repetir exige --ate")
+    _mensagens_no_stderr = True
+    XLSX_AO_SAIR = XLSX_AO_SAIR and not getattr(args, "sem_xlsx", False)
+    usuario = getattr(args, "usuario", None) or os.environ.get("LAB_USUARIO", "")
+    senha = getattr(args, "senha", None) or os.environ.get("LAB_SENHA", "")
+    usuario = usuario.lower().strip()
+    if not getattr(args, "sem_login", False) and not autenticar(usuario, senha):
+        msg("Login inválido (use --usuario/--senha ou LAB_USUARIO/LAB_SENHA).", "err")
+        return 4
+    try:
+        # No modo remoto, o laboratório é o que o servidor abriu
+        if not getattr(args, "sem_lab", False) and ARMAZENAMENTO != "remoto":
+            lab = getattr(args, "lab", None) or os.environ.get("LAB_LABORATORIO")
+            labs = labs_disponiveis()
+            if not lab and len(labs) > 1:
+                raise ErroCLI(f"Informe o laboratório com --lab ({', '.join(labs)}).", 2)
+            if lab or labs:
+                selecionar_lab(lab or labs[0])
+        _emitir(args.funcao(args, usuario), getattr(args, "formato", "json"))
+        return 0
+    except ErroCLI as e:
+        msg(str(e), "err")
+        return e.codigo
+    except EntradaInvalida as e:
+        msg(str(e), "err")
+        return 2
+    except TimeoutError as e:
+        msg(f"{e}; tente de novo em instantes.", "err")
+        return 5
+    except ConnectionError as e:
+        msg(str(e), "err")
+        return 6
+    except PermissionError as e:
+        msg(str(e), "err")
+        return 4
+
 def login():
     acesso_liberado = False
     usuario_logado = None
@@ -704,7 +5136,7 @@ def login():
         usuario = input("Digite seu login: ").lower().strip()
         senha = pwinput.pwinput(prompt="Digite a senha: ", mask="*").strip()
         limpar_tela()
-        if usuario in USERS and USERS[usuario]["senha"] == senha:
+        if autenticar(usuario, senha):
             msg("Login efetuado com sucesso", "ok")
             usuario_logado = usuario
             acesso_liberado = True
@@ -715,22 +5147,57 @@ def login():
             limpar_tela()
     return usuario_logado
 
+def escolher_lab(usuario: str):
+    """Seleciona o laboratório após o login; sem pastas em DIR_DADOS, segue no layout de um laboratório só"""
+    if ARMAZENAMENTO == "remoto":
+        return
+    labs = labs_disponiveis()
+    preferido = os.environ.get("LAB_LABORATORIO")
+    if preferido or (len(labs) == 1 and usuario != "admin"):
+        selecionar_lab(preferido or labs[0])
+        return
+    if not labs:
+        return
+    print("\n=== LABORATÓRIO ===")
+    for i, nome in enumerate(labs, 1):
+        print(f"{i} - {nome}")
+    if usuario == "admin":
+        print(f"{len(labs) + 1} - Novo laboratório")
+    while LAB_ATUAL is None:
+        escolha = input("Escolha o laboratório: ").strip()
+        if escolha.isdigit() and 1 <= int(escolha) <= len(labs):
+            selecionar_lab(labs[int(escolha) - 1])
+        elif usuario == "admin" and escolha == str(len(labs) + 1):
+            try:
+                selecionar_lab(input("Nome do novo laboratório: "))
+            except ValueError as e:
+                msg(str(e), "warn")
+        else:
+            msg("Opção inválida.", "warn")
+    msg(f"Laboratório {LAB_ATUAL} selecionado.", "ok")
+
 def menu_principal(usuario: str):
     """Menu principal com interface melhorada"""
     opcoes = [
         ("1", "Computadores", menu_computadores),
         ("2", "Agendamento", menu_agendamento),
-        ("3", "Relatório", gerar_relatorio),
-        ("4", "Sair", lambda u: exit())
+        ("3", "Relatórios", menu_relatorios),
+        ("4", "Análise de uso", menu_analise),
+        ("5", "Sair", lambda u: exit())
     ]
     
     if usuario == "admin":
-        opcoes.append(("5", "Limpar dados", limpar_dados))
+        opcoes.append(("6", "Limpar dados", limpar_dados))
+        opcoes.append(("7", "Diagnóstico", menu_diagnostico))
     
     while True:
         print(f"\n{'='*25}")
         print(f"=== MENU PRINCIPAL ===")
         print(f"Usuário: {USERS[usuario]['nome']}")
+        if LAB_ATUAL is not None:
+            print(f"Laboratório: {LAB_ATUAL}")
+        elif ARMAZENAMENTO == "remoto":
+            print(f"Servidor: {SERVIDOR}")
         print(f"{'='*25}")
         
         for codigo, descricao, _ in opcoes:
@@ -740,14 +5207,42 @@ def menu_principal(usuario: str):
         
         for codigo, _, funcao in opcoes:
             if escolha == codigo:
-                funcao(usuario)
+                try:
+                    funcao(usuario)
+                except TimeoutError as e:
+                    # Outro terminal segurou a trava além do limite: a operação não foi feita
+                    msg(f"{e}. A operação foi interrompida; tente de novo em instantes.", "err")
+                except AgendaLegada as e:
+                    msg(str(e), "warn")
                 break
         else:
             msg("Opção inválida.", "warn")
 
+def medir_inicio(alvo_ms: float = None) -> int:
+    """Tempo desde o início do script até a tela de login estar pronta
+
+    Não inclui a partida do próprio interpretador (veja `python -X importtime`).
+    Retorna 1 se passar de `alvo_ms`
+    """
+    decorrido = (time.perf_counter() - _INICIO_PROCESSO) * 1000
+    resultado = {
+        "ate_login_ms": round(decorrido, 2),
+        "modulos_pesados_carregados": [m for m in MODULOS_PESADOS if m in sys.modules],
+        "alvo_ms": alvo_ms,
+    }
+    print(json.dumps(resultado, ensure_ascii=False))
+    return 1 if alvo_ms is not None and decorrido > alvo_ms else 0
+
 def main():
+    if "--medir-inicio" in sys.argv:
+        pos = sys.argv.index("--medir-inicio")
+        alvo = float(sys.argv[pos + 1]) if len(sys.argv) > pos + 1 else None
+        sys.exit(medir_inicio(alvo))
+    if len(sys.argv) > 1:
+        sys.exit(executar_cli(sys.argv[1:]))
     usuario = login()
+    escolher_lab(usuario)
     menu_principal(usuario)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,34 @@
+import atexit
+import importlib.util
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[1] / "import pandas as pd.py"
+
+
+@pytest.fixture
+def script():
+    return SCRIPT
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Uma cópia nova do script, com a pasta de trabalho vazia em tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("LAB_ARMAZENAMENTO", raising=False)
+    spec = importlib.util.spec_from_file_location("laboratorio", SCRIPT)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    atexit.unregister(modulo._finalizar_ao_sair)
+    yield modulo
+    # Exportações e backup pendentes terminam dentro da pasta temporária
+    modulo._exportador_xlsx.aguardar()
+    modulo._finalizar_ao_sair()
+
+
+@pytest.fixture
+def dia():
+    """Data a `dias` de hoje, no formato da agenda"""
+    return lambda dias: (datetime.now() + timedelta(days=dias)).strftime("%d/%m/%Y")
@@ -0,0 +1,18 @@
+from datetime import datetime
+
+import pytest
+
+
+def test_agenda_legada_so_converte_explicitamente(app, dia):
+    legada = "pc,horario,professor,status\nPC01,08:00 - 09:00,livre,Disponível\nPC02,08:00 - 09:00,Ana,Agendado\n"
+    app.ARQ_AG.write_text(legada, encoding="utf-8")
+    service = app.AgendamentoService()
+    with pytest.raises(app.AgendaLegada):
+        service.agendar_lote([(dia(3), "PC03", service.horarios[0])], "Bia")
+    assert app.ARQ_AG.read_text(encoding="utf-8") == legada
+
+    assert app.converter_agenda_legada() == 1
+    assert app._listar_snapshots()
+    assert service.indice().ocupante(datetime.now().strftime("%d/%m/%Y"), "PC02", "08:00 - 09:00") == "Ana"
+    assert service.agendar_lote([(dia(3), "PC03", service.horarios[0])], "Bia")[0]["reservado"]
+    assert app.converter_agenda_legada() == -1
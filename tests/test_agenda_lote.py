@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+
+def test_agendar_lote_tudo_ou_nada(app, dia):
+    service = app.AgendamentoService()
+    horario = service.horarios[0]
+    assert service.agendar_horario(dia(3), "PC01", horario, "Ana")
+
+    resultado = service.agendar_lote([(dia(3), "PC02", horario), (dia(3), "PC01", horario)], "Bia")
+    assert [r["reservado"] for r in resultado] == [False, False]
+    assert [r["motivo"] for r in resultado] == ["lote cancelado", "já reservado"]
+    assert service.indice().ocupante(dia(3), "PC02", horario) is None
+
+    resultado = service.agendar_lote([(dia(3), "PC02", horario), (dia(3), "PC01", horario)], "Bia", tudo_ou_nada=False)
+    assert [r["reservado"] for r in resultado] == [True, False]
+    assert len(app.carregar_dataframe(app.ARQ_AG, cols=app.COLUNAS_AG)) == 2
+
+
+def test_agendar_lote_datas_invalidas_e_sem_zeros(app):
+    service = app.AgendamentoService()
+    horario = service.horarios[0]
+    resultado = service.agendar_lote([("xx", "PC01", horario), ("31/02/2030", "PC01", horario)], "Ana")
+    assert [r["motivo"] for r in resultado] == ["data inválida", "data inválida"]
+
+    dia = datetime.now() + timedelta(days=40)
+    assert service.agendar_lote([(dia.strftime("%d/%m/%Y"), "PC01", horario)], "Ana")[0]["reservado"]
+    sem_zeros = f"{dia.day}/{dia.month}/{dia.year}"
+    resultado = service.agendar_lote([(sem_zeros, "PC01", horario)], "Bia")
+    assert resultado[0]["motivo"] == "já reservado"
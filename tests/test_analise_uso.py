@@ -0,0 +1,32 @@
+def test_analise_uso_registra_deltas_sem_reescrever(app):
+    analise = app.analise_uso()
+    analise.horas_por_pc()
+    gravado = app.ARQ_ANALISE.stat().st_mtime_ns
+    sessoes = [{"pc": f"PC0{i % 3 + 1}", "nome": f"Aluno {i}", "data": "10/05/2026", "entrada": "08:00",
+                "saida": "09:30", "duracao": "01:30"} for i in range(5)]
+    ids = app.inserir_sessoes(sessoes)
+    app.atualizar_sessao(ids[0], sessoes[0], {"saida": "10:00", "duracao": "02:00"})
+    app.excluir_sessoes({ids[1]: sessoes[1]})
+
+    assert app.ARQ_ANALISE.stat().st_mtime_ns == gravado
+    assert len(analise.log.read_text(encoding="utf-8").splitlines()) == 3
+    reconstruida = app.AnaliseUso(app.ARQ_ANALISE.with_name("referencia.json"))
+    reconstruida.reconstruir()
+    assert {k: analise.dados[k] for k in analise.AGREGADOS} == {k: reconstruida.dados[k] for k in analise.AGREGADOS}
+
+
+def test_horarios_com_segundos_iguais_a_reconstrucao(app):
+    analise = app.analise_uso()
+    analise.horas_por_pc()
+    reconstrucoes = analise.reconstrucoes
+    sessao = {"pc": "PC04", "nome": "Aluno", "data": "10/05/2026", "entrada": "08:15:30", "saida": "10:40:59",
+              "duracao": "02:25"}
+    id_sessao, = app.inserir_sessoes([sessao])
+    app.inserir_sessoes([{**sessao, "pc": "PC05", "entrada": "23:30:10", "saida": "00:45:00"}])
+    app.atualizar_sessao(id_sessao, sessao, {"saida": "11:05:01"})
+
+    assert analise.reconstrucoes == reconstrucoes
+    assert analise.dados["por_pc"] == {"PC04": 170, "PC05": 75}
+    reconstruida = app.AnaliseUso(app.ARQ_ANALISE.with_name("referencia.json"))
+    reconstruida.reconstruir()
+    assert {k: analise.dados[k] for k in analise.AGREGADOS} == {k: reconstruida.dados[k] for k in analise.AGREGADOS}
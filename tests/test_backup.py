@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+
+def _agenda(app, texto):
+    app.ARQ_AG.write_text(f"data,pc,horario,professor,status\n{texto}\n", encoding="utf-8")
+
+
+def _objetos(app):
+    return sorted(p.name for p in app.DIR_BACKUP_OBJETOS.glob("*/*"))
+
+
+def test_backup_guarda_cada_conteudo_uma_vez(app, tmp_path):
+    _agenda(app, "10/05/2026,PC01,08:00 - 09:00,Ana,Agendado")
+    app.ARQ_REL.write_text("professor,relatorio,usuario\nAna,ok,professor\n", encoding="utf-8")
+    assert app.criar_backup(avisar=False)
+    assert app.criar_backup(avisar=False)
+    assert len(app._listar_snapshots()) == 1
+    assert len(_objetos(app)) == 2
+
+    # Só a agenda mudou: um snapshot novo e um objeto novo, o relatório é reaproveitado
+    _agenda(app, "10/05/2026,PC02,08:00 - 09:00,Bia,Agendado")
+    assert app.criar_backup(avisar=False)
+    primeiro, segundo = app._listar_snapshots()
+    assert len(_objetos(app)) == 3
+    assert app._ler_manifesto(primeiro)["arquivos"]["relatorios.csv"] == app._ler_manifesto(segundo)["arquivos"]["relatorios.csv"]
+
+    assert sorted(app.restaurar_backup(primeiro, tmp_path / "restaurado")) == ["agendamentos.csv", "relatorios.csv"]
+    assert "PC01" in (tmp_path / "restaurado" / "agendamentos.csv").read_text(encoding="utf-8")
+
+
+def test_poda_mantem_um_por_hora_e_um_por_dia(app):
+    agora = datetime(2026, 5, 10, 12, 0)
+    criados = [agora - timedelta(days=40), agora - timedelta(days=3, hours=3), agora - timedelta(days=3, hours=-6),
+               agora - timedelta(minutes=115), agora - timedelta(minutes=40), agora - timedelta(minutes=10)]
+    for i, criado in enumerate(criados):
+        _agenda(app, f"10/05/2026,PC{i + 1:02d},08:00 - 09:00,Ana,Agendado")
+        assert app.criar_backup(avisar=False)
+        snapshot = app._listar_snapshots()[-1]
+        snapshot.rename(snapshot.with_name(f"{criado.strftime('%Y%m%d_%H%M%S_%f')}.json"))
+    assert len(_objetos(app)) == 6
+
+    assert app.podar_backups({"horas_horarias": 24, "dias_diarios": 30}, agora) == (3, 3)
+    # Fica o último de cada hora nas últimas 24 h e o último de cada dia no último mês
+    restantes = [datetime.strptime(s.stem, "%Y%m%d_%H%M%S_%f") for s in app._listar_snapshots()]
+    assert restantes == [criados[2], criados[3], criados[5]]
+    assert len(_objetos(app)) == 3
+    assert app.podar_backups({"horas_horarias": 24, "dias_diarios": 30}, agora) == (0, 0)
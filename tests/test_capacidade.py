@@ -0,0 +1,25 @@
+import pytest
+
+
+@pytest.mark.parametrize("minimo", [0, -3])
+def test_minimo_invalido_e_recusado(app, dia, minimo):
+    service = app.AgendamentoService()
+    with pytest.raises(ValueError, match="mínimo"):
+        service.buscar_capacidade(minimo, dia(2))
+    with pytest.raises(ValueError):
+        service.indice().bloco_livre(dia(2), service.horarios[0], minimo)
+
+
+def test_bloco_de_vizinhos_vem_antes_dos_espalhados(app, dia):
+    service = app.AgendamentoService()
+    primeiro, segundo = service.horarios[:2]
+    # No primeiro horário, um PC sim e outro não fica ocupado: sobra capacidade, mas não vizinhança
+    ocupados = [(dia(2), pc, primeiro) for pc in service.pcs[1::2]]
+    assert all(r["reservado"] for r in service.agendar_lote(ocupados, "Ana"))
+
+    slots = service.buscar_capacidade(3, dia(2))
+    assert slots[0]["adjacentes"] and slots[0]["pcs"] == service.pcs[:3]
+    espalhado = next(s for s in slots if s["horario"] == primeiro)
+    assert not espalhado["adjacentes"] and espalhado["pcs"] == service.pcs[0:6:2]
+    assert primeiro not in {s["horario"] for s in service.buscar_capacidade(3, dia(2), adjacentes=True)}
+    assert segundo in {s["horario"] for s in service.buscar_capacidade(3, dia(2), adjacentes=True)}
@@ -0,0 +1,15 @@
+import pytest
+
+
+def test_so_erro_de_validacao_sai_com_codigo_2(app, monkeypatch):
+    monkeypatch.setenv("LAB_USUARIO", "admin")
+    monkeypatch.setenv("LAB_SENHA", "admin123")
+    assert app.executar_cli(["exportar", "alunos", "x.txt"]) == 2
+    assert app.executar_cli(["exportar", "alunos", "x.csv", "--pcs", "01-99"]) == 2
+
+    # Um ValueError que não veio de uma validação é falha do programa, não pedido inválido
+    def quebrado(args, usuario):
+        return int("x")
+    monkeypatch.setattr(app, "cli_alunos_audit", quebrado)
+    with pytest.raises(ValueError):
+        app.executar_cli(["alunos", "audit"])
@@ -0,0 +1,35 @@
+import pytest
+
+
+def test_derivado_exige_vazio_e_aplicar_delta(app):
+    with pytest.raises(TypeError):
+        app.DerivadoPersistido(app.DIR_DADOS / "x.json", app.ARQ_ALUNOS)
+
+    class SemDelta(app.DerivadoPersistido):
+        def _vazio(self):
+            return {"total": 0}
+
+    with pytest.raises(TypeError, match="_aplicar_delta"):
+        SemDelta(app.DIR_DADOS / "x.json", app.ARQ_ALUNOS)
+
+
+def test_derivado_rele_deltas_do_log(app, tmp_path):
+    class Contador(app.DerivadoPersistido):
+        def _vazio(self):
+            return {"total": 0}
+
+        def _aplicar_delta(self, delta):
+            self.dados["total"] += delta
+
+    arquivo, conjunto = tmp_path / "contador.json", tmp_path / "conjunto.csv"
+    conjunto.write_text("a\n1\n", encoding="utf-8")
+    escritor = Contador(arquivo, conjunto)
+    escritor._ler()
+    escritor._gravar()
+    for delta in (2, 5):
+        escritor._registrar_delta(delta)
+    assert escritor.log.exists()
+
+    leitor = Contador(arquivo, conjunto)
+    leitor._ler()
+    assert leitor.dados["total"] == 7 and leitor._em_dia()
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+
+def _alunos_csv(app):
+    pd.DataFrame({
+        "id": [3, 7, 9], "pc": ["PC01", "PC02", None], "nome": ["Ána", "Bia 🙂", None],
+        "data": ["01/02/2026", "xx", None], "entrada": ["08:00", "08:00:30", None],
+        "saida": ["09:00", "23:59", "x"], "duracao": ["01:00", None, "00:10"],
+    }).to_csv(app.ARQ_ALUNOS, index=False)
+
+
+def _falhar(*args):
+    raise AssertionError("o CSV foi convertido de novo em vez de lido do cache")
+
+
+def test_cache_colunar_igual_ao_csv_tipado(app, monkeypatch):
+    _alunos_csv(app)
+    do_csv = app._snapshot_tipado(app.ARQ_ALUNOS, "alunos")
+    cache = app._caminho_cache_tipado(app.ARQ_ALUNOS)
+    # O cache abre sem pickle: só arrays de números, datas e bytes
+    with np.load(cache, allow_pickle=False) as colunas:
+        assert all(colunas[chave].dtype != object for chave in colunas.files)
+
+    monkeypatch.setattr(app, "tipar", _falhar)
+    pd.testing.assert_frame_equal(app._snapshot_tipado(app.ARQ_ALUNOS, "alunos"), do_csv)
+    assert do_csv.loc[7, "entrada"] == 480 and pd.isna(do_csv.loc[9, "saida"])
+    assert do_csv["nome"].tolist()[:2] == ["Ána", "Bia 🙂"] and pd.isna(do_csv.loc[9, "nome"])
+
+
+def test_cache_de_outra_versao_do_csv_e_ignorado(app):
+    _alunos_csv(app)
+    app._snapshot_tipado(app.ARQ_ALUNOS, "alunos")
+    pd.DataFrame({"id": [1], "pc": ["PC05"], "nome": ["Novo"], "data": ["05/05/2026"], "entrada": ["10:00"],
+                  "saida": ["11:00"], "duracao": ["01:00"]}).to_csv(app.ARQ_ALUNOS, index=False)
+    relido = app._snapshot_tipado(app.ARQ_ALUNOS, "alunos")
+    assert relido.index.tolist() == [1] and relido["pc"].tolist() == ["PC05"]
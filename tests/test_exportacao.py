@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def sessoes(request, app, monkeypatch):
+    monkeypatch.setattr(app, "ARMAZENAMENTO", request.param)
+    monkeypatch.setattr(app, "_armazenamento", None)
+    monkeypatch.setattr(app, "TAMANHO_BLOCO", 7)
+    app.inserir_registros([{"pc": f"PC0{i % 5 + 1}", "nome": f"Aluno {i}", "data": "10/03/2026", "entrada": "08:00",
+                            "saida": "09:00", "duracao": "01:00"} for i in range(50)],
+                          app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX, app.COLUNAS_ALUNOS)
+    return app
+
+
+def test_exporta_csv_em_blocos(sessoes, tmp_path):
+    app, filtros = sessoes, {"pcs": ["PC02", "PC03"]}
+    progresso = []
+    destino = tmp_path / "saida.csv"
+    assert app.exportar_filtrado(app.ARQ_ALUNOS, filtros, destino, app.COLUNAS_ALUNOS, progresso.append) == 20
+    # Um bloco por vez: o progresso avança várias vezes até o total
+    assert len(progresso) > 1 and progresso == sorted(progresso) and progresso[-1] == 20
+
+    esperado, _ = app.consultar_registros(app.ARQ_ALUNOS, filtros, 0, 100)
+    exportado = pd.read_csv(destino, dtype={"nome": str}, index_col="id")
+    assert exportado.index.tolist() == esperado.index.tolist()
+    assert exportado["nome"].tolist() == esperado["nome"].tolist()
+
+
+def test_exporta_xlsx_e_respeita_o_limite_de_linhas(sessoes, tmp_path, monkeypatch):
+    import openpyxl
+    app = sessoes
+    destino = tmp_path / "saida.xlsx"
+    assert app.exportar_filtrado(app.ARQ_ALUNOS, {"pc": "PC01"}, destino, app.COLUNAS_ALUNOS) == 10
+    linhas = list(openpyxl.load_workbook(destino, read_only=True).active.values)
+    assert linhas[0] == ("id", *app.COLUNAS_ALUNOS) and len(linhas) == 11
+    assert {linha[1] for linha in linhas[1:]} == {"PC01"}
+
+    monkeypatch.setattr(app, "LINHAS_MAX_XLSX", 20)
+    with pytest.raises(app.EntradaInvalida):
+        app.exportar_filtrado(app.ARQ_ALUNOS, {}, tmp_path / "grande.xlsx", app.COLUNAS_ALUNOS)
+    assert not list(tmp_path.glob("grande*"))
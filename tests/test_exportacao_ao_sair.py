@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+
+def _executar(script, pasta, modo, *argumentos, usuario=("professor", "prof123")):
+    env = {**os.environ, "LAB_ARMAZENAMENTO": modo, "LAB_USUARIO": usuario[0], "LAB_SENHA": usuario[1]}
+    env.pop("LAB_XLSX_AO_SAIR", None)
+    saida = subprocess.run([sys.executable, str(script), *argumentos], cwd=pasta, env=env,
+                           capture_output=True, text=True, timeout=120)
+    assert saida.returncode == 0, saida.stderr
+
+
+def test_saida_espera_xlsx_do_salvar_csv(tmp_path, script):
+    (tmp_path / "agendamentos.csv").write_text(
+        "pc,horario,professor,status\nPC02,08:00 - 09:00,Ana,Agendado\n", encoding="utf-8")
+    _executar(script, tmp_path, "csv", "agenda", "convert", usuario=("admin", "admin123"))
+    # O processo já terminou: a planilha que estava na fila foi gravada antes da saída
+    assert pd.read_excel(tmp_path / "agendamentos.xlsx")["professor"].tolist() == ["Ana"]
+
+
+def test_saida_espera_espelho_csv_do_sqlite(tmp_path, script):
+    _executar(script, tmp_path, "sqlite", "relatorio", "add", "--texto", "Aula de redes")
+    assert pd.read_csv(tmp_path / "relatorios.csv")["relatorio"].tolist() == ["Aula de redes"]
+    assert pd.read_excel(tmp_path / "relatorios.xlsx")["relatorio"].tolist() == ["Aula de redes"]
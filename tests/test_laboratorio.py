@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("modo", ["csv", "sqlite"])
+def test_estresse_agenda_sem_celulas_duplicadas(tmp_path, script, modo):
+    # Os processos do teste são criados com "spawn", que precisa do script como programa principal
+    env = {**os.environ, "LAB_ARMAZENAMENTO": modo}
+    saida = subprocess.run(
+        [sys.executable, str(script), "estresse-agenda", "6", "--por-processo", "5"],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert saida.returncode == 0, saida.stderr
+    resultado = json.loads(saida.stdout)
+    assert resultado["celulas_duplicadas"] == 0
+    assert resultado["atualizacoes_perdidas"] == []
+    assert resultado["vencedores_celula_disputada"] == 1
+    assert resultado["reservas_no_arquivo"] == resultado["reservas_confirmadas"]
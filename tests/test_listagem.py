@@ -0,0 +1,47 @@
+import pytest
+
+NOMES = ["Ávila Souza", "ávila Costa", "Avila Reis", "Élio 50%", "Elio_B", "Eliana", "50% Off", "Bruno"]
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def backend(request, app, monkeypatch):
+    monkeypatch.setattr(app, "ARMAZENAMENTO", request.param)
+    monkeypatch.setattr(app, "_armazenamento", None)
+    sessoes = [{"pc": f"PC{i % 4 + 1:02d}", "nome": nome, "data": "10/05/2026", "entrada": "08:00",
+                "saida": "09:00", "duracao": "01:00"} for i, nome in enumerate(NOMES)]
+    app.inserir_registros(sessoes, app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX, app.COLUNAS_ALUNOS)
+    return app
+
+
+@pytest.mark.parametrize("prefixo, esperados", [
+    ("ávila", ["Ávila Souza", "ávila Costa"]),
+    ("ÉLI", ["Élio 50%"]),
+    ("eli", ["Elio_B", "Eliana"]),
+    ("elio_", ["Elio_B"]),
+    ("%", []),
+    ("50%", ["50% Off"]),
+])
+def test_filtro_de_nome_igual_nos_backends(backend, prefixo, esperados):
+    pagina, total = backend.consultar_registros(backend.ARQ_ALUNOS, {"nome": prefixo}, 0, 50)
+    assert pagina["nome"].tolist() == esperados
+    assert total == len(esperados)
+
+
+def test_paginas_por_id_estavel(backend):
+    app = backend
+    todos, total = app.consultar_registros(app.ARQ_ALUNOS, {}, 0, 50)
+    ids = todos.index.tolist()
+    segunda, _ = app.consultar_registros(app.ARQ_ALUNOS, {}, 1, 3)
+    assert total == len(NOMES)
+    assert segunda.index.tolist() == ids[3:6]
+
+    # Excluir uma linha não renumera as outras nem reaproveita o ID
+    app.excluir_registros(app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX, [ids[1]])
+    assert app.buscar_registro(app.ARQ_ALUNOS, ids[1]) is None
+    assert app.buscar_registro(app.ARQ_ALUNOS, ids[4])["nome"] == "Elio_B"
+    novo, = app.inserir_registros([{"pc": "PC09", "nome": "Nova", "data": "11/05/2026", "entrada": "10:00",
+                                    "saida": "11:00", "duracao": "01:00"}],
+                                  app.ARQ_ALUNOS, app.ARQ_ALUNOS_XLSX, app.COLUNAS_ALUNOS)
+    assert novo > ids[-1]
+    primeira, total = app.consultar_registros(app.ARQ_ALUNOS, {}, 0, 3)
+    assert primeira.index.tolist() == [ids[0], ids[2], ids[3]] and total == len(NOMES)
@@ -0,0 +1,43 @@
+import pytest
+
+
+def sessao(app, pc, data, entrada="08:00", saida="09:00"):
+    return {"pc": pc, "nome": "Aluno", "data": data, "entrada": entrada, "saida": saida,
+            "duracao": app.calcular_duracao(data, entrada, saida)}
+
+
+def test_migracao_divide_por_mes_e_preserva_ids(app):
+    datas = ["05/03/2026", "20/03/2026", "02/04/2026", "15/05/2026"]
+    ids = app.inserir_sessoes([sessao(app, f"PC0{i + 1}", data) for i, data in enumerate(datas)])
+    app.salvar_relatorio({"professor": "Ana", "relatorio": "ok", "usuario": "professor"})
+    antes = app.carregar_dataframe(app.ARQ_ALUNOS, cols=app.COLUNAS_ALUNOS)
+
+    resultado = app.migrar_para_lab("sala")
+    assert resultado["alunos"] == 4 and resultado["relatorios"] == 1
+    assert app.ARQ_ALUNOS == app.DIR_DADOS / "sala" / "alunos.csv"
+    assert app.particoes(app.ARQ_ALUNOS) == ["2026-03", "2026-04", "2026-05"]
+    # O layout antigo fica onde estava
+    assert len(app.ArmazenamentoCSV().carregar(app.Path("alunos.csv"), app.COLUNAS_ALUNOS)) == 4
+    depois = app.carregar_dataframe(app.ARQ_ALUNOS, cols=app.COLUNAS_ALUNOS)
+    assert depois.index.tolist() == ids
+    assert depois[["pc", "data"]].equals(antes[["pc", "data"]])
+    with pytest.raises(app.EntradaInvalida):
+        app.migrar_para_lab("outra")
+
+
+def test_particoes_consulta_e_edicao_entre_meses(app):
+    ids = app.inserir_sessoes([sessao(app, "PC01", "05/03/2026"), sessao(app, "PC02", "02/04/2026")])
+    app.migrar_para_lab("sala")
+
+    # O ID continua a sequência do conjunto inteiro, não a da partição
+    novo, = app.inserir_sessoes([sessao(app, "PC03", "10/04/2026")])
+    assert novo == max(ids) + 1
+    abril, total = app.consultar_registros(app.ARQ_ALUNOS, {"data_inicio": "01/04/2026", "data_fim": "30/04/2026"})
+    assert total == 2 and abril.index.tolist() == [ids[1], novo]
+
+    # Uma sessão que muda de mês passa para a outra partição com o mesmo ID
+    marco = dict(app.buscar_registro(app.ARQ_ALUNOS, ids[0]))
+    app.atualizar_sessao(ids[0], marco, {"data": "12/04/2026", "duracao": marco["duracao"]})
+    assert app.particoes(app.ARQ_ALUNOS) == ["2026-04"]
+    assert app.buscar_registro(app.ARQ_ALUNOS, ids[0])["data"] == "12/04/2026"
+    assert sorted(app.carregar_dataframe(app.ARQ_ALUNOS, cols=app.COLUNAS_ALUNOS).index) == sorted(ids + [novo])
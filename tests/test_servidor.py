@@ -0,0 +1,24 @@
+import json
+import socket
+
+import pytest
+
+
+def test_servidor_fora_do_loopback_exige_token(app):
+    with pytest.raises(ValueError):
+        app.ServidorLab("0.0.0.0", 0, token="")
+
+    servidor = app.ServidorLab("127.0.0.1", 0, token="segredo").em_segundo_plano()
+    try:
+        with socket.create_connection(("127.0.0.1", servidor.porta)) as conexao:
+            canal = conexao.makefile("rwb")
+            for pedido in ({"op": "limpar", "conjunto": "relatorios"},
+                           {"op": "assinatura", "conjunto": "relatorios", "token": "segredo"}):
+                canal.write((json.dumps(pedido) + "\n").encode())
+                canal.flush()
+            recusado, aceito = json.loads(canal.readline()), json.loads(canal.readline())
+        assert recusado["tipo"] == "PermissionError"
+        assert aceito["ok"]
+        assert servidor.gravacoes == 0
+    finally:
+        servidor.parar()
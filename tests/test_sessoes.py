@@ -0,0 +1,34 @@
+def sessao(app, pc, data, entrada, saida):
+    return {"pc": pc, "nome": "Aluno", "data": data, "entrada": entrada, "saida": saida,
+            "duracao": app.calcular_duracao(data, entrada, saida)}
+
+
+def test_sobrepostas_passando_da_meia_noite(app):
+    noturna, = app.inserir_sessoes([sessao(app, "PC05", "10/05/2026", "23:00", "01:30")])
+    indice = app.indice_sessoes()
+    intervalo = app.IndiceSessoes.intervalo
+    assert indice.sobrepostas("PC05", *intervalo("11/05/2026", "00:30", "01:00")) == [noturna]
+    assert indice.sobrepostas("PC05", *intervalo("11/05/2026", "01:30", "02:00")) == []
+    assert indice.sobrepostas("PC06", *intervalo("11/05/2026", "00:30", "01:00")) == []
+    assert indice.sobrepostas("PC05", *intervalo("10/05/2026", "23:30", "23:45"), ignorar=noturna) == []
+
+    # Sessão gravada depois entra no mesmo índice, sem reconstruí-lo
+    madrugada, = app.inserir_sessoes([sessao(app, "PC05", "11/05/2026", "01:00", "02:00")])
+    assert app.indice_sessoes() is indice
+    assert indice.sobrepostas("PC05", *intervalo("11/05/2026", "01:15", "01:20")) == [noturna, madrugada]
+    assert indice.auditar() == [("PC05", noturna, madrugada, 30)]
+
+
+def test_indice_incremental_igual_a_reconstrucao(app):
+    registros = [sessao(app, f"PC0{i % 3 + 1}", f"{10 + i % 4:02d}/05/2026", f"{20 + i % 4:02d}:{i % 6 * 10:02d}", f"0{i % 3}:15")
+                 for i in range(24)]
+    ids = app.inserir_sessoes(registros)
+    indice = app.indice_sessoes()
+    app.atualizar_sessao(ids[5], registros[5], {"data": "13/05/2026", "entrada": "22:00", "saida": "23:30"})
+    app.excluir_sessoes({ids[0]: registros[0], ids[7]: registros[7]})
+    assert app.indice_sessoes() is indice
+
+    reconstruido = app.IndiceSessoes(app.carregar_tipado(app.ARQ_ALUNOS))
+    assert indice.dias == reconstruido.dias
+    assert sorted(indice.auditar()) == sorted(reconstruido.auditar())
+    assert all(dias for dias in indice.dias.values()) and all(ids for dias in indice.dias.values() for _, _, ids in dias.values())
@@ -0,0 +1,73 @@
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+def _pid_morto() -> int:
+    processo = subprocess.Popen([sys.executable, "-c", "pass"])
+    processo.wait()
+    return processo.pid
+
+
+def test_trava_abandonada_tomada_por_um_so(app, tmp_path, monkeypatch):
+    # B julga a trava abandonada e para; enquanto isso A também a julga. Sem a tomada
+    # atômica, A travava e B, ao continuar, apagava a trava nova de A
+    alvo = tmp_path / "dados.csv"
+    alvo.with_name("dados.csv.lock").write_text(f"{_pid_morto()}@{platform.node()}", encoding="utf-8")
+    julgar = app._trava_abandonada
+    julgou, continuar = threading.Event(), threading.Event()
+
+    def julgar_devagar(trava, expira):
+        abandonada = julgar(trava, expira)
+        if threading.current_thread().name == "B" and not julgou.is_set():
+            julgou.set()
+            continuar.wait(5)
+        return abandonada
+
+    monkeypatch.setattr(app, "_trava_abandonada", julgar_devagar)
+    dentro, sobreposicoes = [], []
+
+    def secao_critica():
+        with app.trava_arquivo(alvo, timeout=10):
+            if dentro:
+                sobreposicoes.append(threading.current_thread().name)
+            dentro.append(1)
+            time.sleep(0.6)
+            dentro.pop()
+
+    b = threading.Thread(target=secao_critica, name="B")
+    b.start()
+    assert julgou.wait(5)
+    a = threading.Thread(target=secao_critica, name="A")
+    a.start()
+    time.sleep(0.3)
+    continuar.set()
+    a.join()
+    b.join()
+    assert sobreposicoes == []
+    assert not list(tmp_path.glob("*.lock*"))
+
+
+def test_trava_de_processo_vivo_nao_e_tomada(app, tmp_path):
+    trava = tmp_path / "dados.csv.lock"
+    trava.write_text(f"{os.getppid()}@{platform.node()}", encoding="utf-8")
+    with pytest.raises(TimeoutError):
+        with app.trava_arquivo(tmp_path / "dados.csv", timeout=0.3):
+            pass
+    assert trava.exists()
+
+
+def test_trava_de_outra_maquina_so_expira_sem_renovacao(app, tmp_path):
+    trava = tmp_path / "dados.csv.lock"
+    trava.write_text("123@outra-maquina", encoding="utf-8")
+    with pytest.raises(TimeoutError):
+        with app.trava_arquivo(tmp_path / "dados.csv", timeout=0.3, expira=30):
+            pass
+    antiga = time.time() - 60
+    os.utime(trava, (antiga, antiga))
+    with app.trava_arquivo(tmp_path / "dados.csv", timeout=0.3, expira=30):
+        assert trava.read_text(encoding="utf-8") == app._DONO_TRAVA